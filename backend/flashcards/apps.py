@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class FlashcardsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'flashcards'
+
+    def ready(self):
+        from django.contrib.auth.password_validation import get_default_password_validators
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .metrics import install_execute_wrapper
+        connection_created.connect(install_execute_wrapper)
+
+        # builds the validators once per process, including reading CommonPasswordValidator's word list,
+        # instead of on the first registration
+        get_default_password_validators()
@@ -0,0 +1,119 @@
+"""
+Async-native versions of the read endpoints, for deployments served by an ASGI server.
+
+Each function has the same name, parameters and response body as its sync counterpart in views.py, so
+flashcards.urls can serve either per route (see FLASHCARDS_ASYNC_VIEWS). They use the async ORM and
+cache APIs instead of DRF, which has no async views, and render JSON with DRF's encoder.
+"""
+from django.views.decorators.http import require_GET
+from rest_framework import status
+
+from .authentication import aresolve_caller
+from .cache import acached
+from .etags import (
+    aclasses_etag, aflashcard_sets_etag, aflashcards_etag, aflashcards_in_set_etag, async_etag, auser_classes_etag
+)
+from . import listings
+from .models import FlashcardSet
+from .pagination import alist_response, json_response
+
+
+def _error(message, code):
+    return json_response({'error': message}, status=code)
+
+
+@async_etag(aflashcard_sets_etag)
+@require_GET
+async def get_flashcard_sets(request):
+    """Fetch flashcard sets for a given user (username via query param)"""
+    try:
+        user_id, username = await aresolve_caller(request, request.GET.get('username'))
+        error = listings.caller_error(user_id, username)
+        if error:
+            return _error(*error)
+
+        return await alist_response(request, listings.user_sets(user_id), cache_key=('user_sets', user_id))
+    except Exception as e:
+        return _error(str(e), status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_etag(aflashcards_in_set_etag)
+@require_GET
+async def get_flashcards_in_set(request):
+    """Fetch flashcards in a specific flashcard set (set_id via query param)"""
+    try:
+        set_id = request.GET.get('set_id')
+        if not set_id:
+            return _error('set_id is required', status.HTTP_400_BAD_REQUEST)
+
+        try:
+            flashcard_set = await FlashcardSet.objects.aget(id=set_id)
+        except FlashcardSet.DoesNotExist:
+            return _error('Flashcard set not found', status.HTTP_404_NOT_FOUND)
+
+        return await alist_response(request, listings.set_cards(flashcard_set))
+    except Exception as e:
+        return _error(str(e), status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_etag(aflashcards_etag)
+@require_GET
+async def get_flashcards(request):
+    """Fetch flashcards created by a specific user"""
+    try:
+        user_id, username = await aresolve_caller(request, request.GET.get('username'))
+        error = listings.caller_error(user_id, username)
+        if error:
+            return _error(*error)
+
+        return await alist_response(request, listings.user_cards(user_id), cache_key=('user_cards', user_id))
+    except Exception as e:
+        return _error(str(e), status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_etag(auser_classes_etag)
+@require_GET
+async def get_user_classes(request):
+    """Fetch classes the user is enrolled in"""
+    try:
+        user_id, username = await aresolve_caller(request, request.GET.get('username'))
+        error = listings.caller_error(user_id, username)
+        if error:
+            return _error(*error)
+
+        async def load_classes():
+            return [listings.class_row(membership) async for membership in listings.memberships(user_id)]
+
+        return json_response(await acached('user_classes', user_id, load_classes))
+    except Exception as e:
+        return _error(str(e), status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_etag(aclasses_etag)
+@require_GET
+async def list_classes(request):
+    """Return all classes from the Class table"""
+    try:
+        return await alist_response(request, listings.all_classes())
+    except Exception as e:
+        return _error(str(e), status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@require_GET
+async def dashboard(request):
+    """Classes, sets with card counts and recent study time for one user, as in views.dashboard"""
+    try:
+        user_id, username = await aresolve_caller(request, request.GET.get('username'))
+        error = listings.caller_error(user_id, username)
+        if error:
+            return _error(*error)
+
+        memberships, sets, recent = listings.dashboard_querysets(user_id)
+        return json_response(listings.dashboard_body(
+            user_id,
+            [listings.class_row(membership, member_count=True) async for membership in memberships],
+            [listings.dashboard_set_row(flashcard_set) async for flashcard_set in sets],
+            [listings.recent_study_row(entry) async for entry in recent]
+        ))
+    except Exception as e:
+        return _error(str(e), status.HTTP_500_INTERNAL_SERVER_ERROR)
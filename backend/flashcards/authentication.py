@@ -0,0 +1,101 @@
+"""
+Stateless bearer tokens for the API.
+
+login_user returns a token signed with SECRET_KEY that carries the user's id and username.
+SignedTokenAuthentication checks the signature and age of "Authorization: Bearer <token>" and builds
+request.user from the token alone, so authenticating a request reads neither the session nor the user
+table. The flip side is that a token stays valid until FLASHCARDS_TOKEN_MAX_AGE passes, even if the
+user is deactivated or changes their password; rotate SECRET_KEY (keeping the old one in
+SECRET_KEY_FALLBACKS to phase it out) to revoke every token at once.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from .cache import aget_user_id, get_user_id
+
+KEYWORD = 'Bearer'
+SALT = 'flashcards.authentication.token'
+
+
+def issue_token(user):
+    return signing.dumps({'id': user.id, 'username': user.username}, salt=SALT, compress=True)
+
+
+def read_token(token):
+    """The (user_id, username) a token was issued for. Raises signing.BadSignature, or SignatureExpired"""
+    claims = signing.loads(token, salt=SALT, max_age=settings.FLASHCARDS_TOKEN_MAX_AGE)
+    return claims['id'], claims['username']
+
+
+def _bearer(request):
+    header = get_authorization_header(request).split()
+    if not header or header[0].lower() != KEYWORD.lower().encode():
+        return None
+    if len(header) != 2:
+        raise exceptions.AuthenticationFailed('Invalid token header')
+    return header[1]
+
+
+def token_caller(request):
+    """(user_id, username) from a valid bearer token, else None; for code that runs before DRF authenticates"""
+    try:
+        token = _bearer(request)
+        return read_token(token.decode()) if token else None
+    except (exceptions.AuthenticationFailed, signing.BadSignature, UnicodeDecodeError):
+        return None
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    def authenticate(self, request):
+        token = _bearer(request)
+        if token is None:
+            return None
+        try:
+            user_id, username = read_token(token.decode())
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed('Token has expired')
+        except (signing.BadSignature, UnicodeDecodeError):
+            raise exceptions.AuthenticationFailed('Invalid token')
+        # not loaded from the database: only id and username are filled in
+        user = User(id=user_id, username=username)
+        user._state.adding = False
+        return user, None
+
+    def authenticate_header(self, request):
+        return KEYWORD
+
+
+def resolve_caller(request, username):
+    """
+    (user_id, username) of the user a view acts for: the username parameter when given, as before,
+    otherwise the authenticated user. user_id is None for an unknown username, and both are None for an
+    anonymous request without one. The authenticated user's own name costs no lookup.
+    """
+    user = getattr(request, 'user', None)
+    caller = (user.id, user.username) if user is not None and user.is_authenticated else None
+    return _known_caller(caller, username) or (get_user_id(username), username)
+
+
+async def aresolve_caller(request, username):
+    """
+    resolve_caller for the async views, which DRF does not authenticate: a valid bearer token, else the
+    session user, stands in for request.user.
+    """
+    caller = token_caller(request)
+    if caller is None and not username and hasattr(request, 'auser'):
+        user = await request.auser()
+        if user.is_authenticated:
+            caller = user.id, user.username
+    return _known_caller(caller, username) or (await aget_user_id(username), username)
+
+
+def _known_caller(caller, username):
+    """resolve_caller's answer when it needs no lookup, else None"""
+    if caller is not None and (not username or username == caller[1]):
+        return caller
+    if not username:
+        return None, None
+    return None
@@ -0,0 +1,202 @@
+"""
+Profile pictures: streamed uploads and content-addressed thumbnails.
+
+An upload is written to MEDIA_ROOT/profile_pictures/ chunk by chunk while it is hashed, and named after
+its SHA-256. A thread pool then renders square WebP and JPEG thumbnails of every size in
+THUMBNAIL_SIZES into MEDIA_ROOT/avatars/ as "<hash>-<size>.<ext>" and only then records the hash on
+the profile, so readers never see links to thumbnails that do not exist yet. Since a name never
+changes content, they are served with a one-year immutable Cache-Control (CACHE_CONTROL), and pages
+that show avatars never read the originals. The web server or storage serves MEDIA_ROOT/avatars/ in
+production; thumbnail_view only stands in for it under DEBUG.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.views.static import serve
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZES = (64, 256)
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}), 'jpg': ('JPEG', {'quality': 85, 'optimize': True,
+                                                                              'progressive': True})}
+UPLOAD_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+ORIGINALS_DIR = 'profile_pictures'
+THUMBNAILS_DIR = 'avatars'
+HASH_LENGTH = 32
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Room in an upload request for the multipart boundaries and the other form fields
+FORM_OVERHEAD_BYTES = 16 * 1024
+
+_executor = None
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def _directory(name, media_root=None):
+    path = Path(media_root or settings.MEDIA_ROOT) / name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def thumbnail_name(content_hash, size, ext):
+    return f'{content_hash}-{size}.{ext}'
+
+
+def thumbnail_urls(content_hash, sizes=THUMBNAIL_SIZES):
+    """{size: {ext: url}} for a processed picture, or None when there is none (yet)"""
+    if not content_hash:
+        return None
+    return {size: {ext: f'{settings.MEDIA_URL}{THUMBNAILS_DIR}/{thumbnail_name(content_hash, size, ext)}'
+                   for ext in FORMATS}
+            for size in sizes}
+
+
+def thumbnails_exist(content_hash, media_root=None):
+    directory = _directory(THUMBNAILS_DIR, media_root)
+    return all((directory / thumbnail_name(content_hash, size, ext)).exists()
+               for size in THUMBNAIL_SIZES for ext in FORMATS)
+
+
+def hash_file(path):
+    with open(path, 'rb') as original:
+        return hashlib.file_digest(original, 'sha256').hexdigest()[:HASH_LENGTH]
+
+
+def save_original(uploaded_file):
+    """
+    Write an uploaded image to disk in chunks and return its media-relative name and content hash.
+    Raises InvalidImage, leaving nothing behind, if it is not a supported image of acceptable size.
+    """
+    directory = _directory(ORIGINALS_DIR)
+    digest = hashlib.sha256()
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.upload')
+    try:
+        with os.fdopen(descriptor, 'wb') as destination:
+            for chunk in uploaded_file.chunks():
+                digest.update(chunk)
+                destination.write(chunk)
+        try:
+            # reads the header only; decoding waits for the thumbnail worker
+            with Image.open(temp_path) as image:
+                image_format, (width, height) = image.format, image.size
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+            raise InvalidImage('Not a supported image')
+        if image_format not in UPLOAD_FORMATS:
+            raise InvalidImage(f'Unsupported image format {image_format}')
+        if width * height > settings.FLASHCARDS_AVATAR_MAX_PIXELS:
+            raise InvalidImage('Image dimensions are too large')
+
+        content_hash = digest.hexdigest()[:HASH_LENGTH]
+        name = f'{ORIGINALS_DIR}/{content_hash}.{UPLOAD_FORMATS[image_format]}'
+        os.replace(temp_path, Path(settings.MEDIA_ROOT) / name)
+        return name, content_hash
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def render_thumbnails(original_path, content_hash, media_root=None):
+    """Write every size and format of the picture's thumbnails, each atomically"""
+    directory = _directory(THUMBNAILS_DIR, media_root)
+    with Image.open(original_path) as image:
+        # lets JPEG decode at a reduced scale, which is most of the cost for large photos
+        image.draft('RGB', (max(THUMBNAIL_SIZES) * 2, max(THUMBNAIL_SIZES) * 2))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # flatten transparency onto white rather than the black RGB conversion would leave
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        image = image.convert('RGB')
+        for size in sorted(THUMBNAIL_SIZES, reverse=True):
+            image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+            for ext, (image_format, options) in FORMATS.items():
+                target = directory / thumbnail_name(content_hash, size, ext)
+                temp_path = target.with_suffix(target.suffix + '.tmp')
+                image.save(temp_path, image_format, **options)
+                os.replace(temp_path, target)
+
+
+def process(user_id, name, content_hash, media_root=None):
+    """Thumbnail a stored original and publish its hash, unless the user uploaded another one meanwhile"""
+    media_root = media_root or settings.MEDIA_ROOT
+    if not thumbnails_exist(content_hash, media_root):
+        render_thumbnails(Path(media_root) / name, content_hash, media_root)
+    UserProfile.objects.filter(user_id=user_id, profile_picture=name).update(avatar_hash=content_hash)
+
+
+def _process_in_worker(user_id, name, content_hash, media_root):
+    try:
+        process(user_id, name, content_hash, media_root)
+    except Exception:
+        logger.exception('Could not create thumbnails for %s', name)
+    finally:
+        # pool threads outlive requests, so nothing else would ever close their connections
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # Pillow releases the GIL while resizing and encoding, so threads use several cores
+        _executor = ThreadPoolExecutor(max_workers=settings.FLASHCARDS_THUMBNAIL_WORKERS,
+                                       thread_name_prefix='thumbnails')
+    return _executor
+
+
+def drain():
+    """Wait for queued thumbnails, e.g. before a test or benchmark removes its MEDIA_ROOT"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def set_picture(user_id, name, content_hash):
+    """
+    Point the user's profile at a stored original. Returns True if its thumbnails are ready, False if they
+    were queued (after the current transaction commits); the profile keeps its previous avatar_hash until
+    they are done.
+    """
+    profile, _ = UserProfile.objects.get_or_create(user_id=user_id)
+    profile.profile_picture = name
+    ready = thumbnails_exist(content_hash)
+    if ready:
+        profile.avatar_hash = content_hash
+    profile.save(update_fields=['profile_picture', 'avatar_hash'])
+    if not ready:
+        if settings.FLASHCARDS_THUMBNAIL_WORKERS:
+            media_root = settings.MEDIA_ROOT
+            transaction.on_commit(
+                lambda: _get_executor().submit(_process_in_worker, user_id, name, content_hash, media_root)
+            )
+            return False
+        process(user_id, name, content_hash)
+    return True
+
+
+def upload_too_large(request):
+    """Whether the declared request size rules out a file within FLASHCARDS_AVATAR_MAX_BYTES, before any parsing"""
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return False
+    return length > settings.FLASHCARDS_AVATAR_MAX_BYTES + FORM_OVERHEAD_BYTES
+
+
+def thumbnail_view(request, name):
+    response = serve(request, name, document_root=_directory(THUMBNAILS_DIR))
+    response['Cache-Control'] = CACHE_CONTROL
+    return response
@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from . import passwords
+
+UserModel = get_user_model()
+
+
+class PooledPasswordBackend(ModelBackend):
+    """ModelBackend that checks (and upgrades) password hashes through flashcards.passwords"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # hash anyway, so the response time does not reveal which usernames exist
+            passwords.make_password(password)
+            return None
+
+        valid, must_update = passwords.check_password(password, user.password)
+        if not valid:
+            return None
+        if must_update:
+            user.password = passwords.make_password(password)
+            user.save(update_fields=['password'])
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,44 @@
+"""Shared helpers for the bench_* management commands"""
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from . import study_time
+
+
+@contextmanager
+def isolated_database(verbosity=0):
+    """Run the body against a throwaway test database so benchmarks never touch real data"""
+    old_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST']['NAME']
+    if connection.vendor == 'sqlite' and not old_test_name:
+        # a fresh in-memory database each time: background threads (the study-time flusher, thumbnail
+        # workers) may still hold persistent connections that would keep the previous one alive
+        connection.settings_dict['TEST']['NAME'] = f'file:bench_{uuid.uuid4().hex}?mode=memory&cache=shared'
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        # heartbeats the body buffered belong to this database: write them while it exists, since the
+        # atexit flush would run after it is destroyed
+        try:
+            study_time.flush()
+        except Exception:
+            # the failed flush put them back; drop them along with the database
+            study_time.buffer.discard()
+        connection.creation.destroy_test_db(old_name, verbosity)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        teardown_test_environment()
+
+
+def measure(func, *args, **kwargs):
+    """Call func and return (result, elapsed seconds, number of queries run)"""
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    return result, elapsed, len(ctx.captured_queries)
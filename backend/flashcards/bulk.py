@@ -0,0 +1,122 @@
+import json
+
+from django.db import transaction
+
+from . import dedup
+from .cache import invalidate
+from .models import Flashcard
+from .counters import USER_CARDS, adjust_card_count, bump_user_lists
+
+DEFAULT_CHUNK_SIZE = 500
+NOT_AN_OBJECT = 'Row must be an object with question and answer'
+
+
+class InvalidRow:
+    """Placeholder for an input row that could not be parsed"""
+
+    def __init__(self, message, line=None):
+        self.message = message
+        self.line = line
+
+
+def row_line(row):
+    """The file line number a reader attached to a row (a 'line' key, or InvalidRow.line), if any"""
+    if isinstance(row, InvalidRow):
+        return row.line
+    return row.get('line') if isinstance(row, dict) else None
+
+
+def iter_ndjson(stream):
+    """Yield one decoded object per non-blank line of an uploaded NDJSON file, without reading it all in"""
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield InvalidRow('Invalid JSON', line=number)
+            continue
+        if not isinstance(row, dict):
+            yield InvalidRow(NOT_AN_OBJECT, line=number)
+            continue
+        row['line'] = number
+        yield row
+
+
+def clean_row(row):
+    """Return (question, answer) for a valid row, or raise ValueError with the reason"""
+    if isinstance(row, InvalidRow):
+        raise ValueError(row.message)
+    if not isinstance(row, dict):
+        raise ValueError(NOT_AN_OBJECT)
+
+    question = row.get('question')
+    answer = row.get('answer')
+    if not isinstance(question, str) or not isinstance(answer, str):
+        raise ValueError('Question and answer are required')
+
+    question, answer = question.strip(), answer.strip()
+    if not question or not answer:
+        raise ValueError('Question and answer are required')
+    return question, answer
+
+
+def insert_flashcards(user_id, flashcard_set, rows, chunk_size=DEFAULT_CHUNK_SIZE, collect_ids=True, max_errors=None):
+    """
+    Validate rows and write the valid ones into flashcard_set with bulk_create, chunk_size at a time,
+    all inside one transaction. Invalid rows are reported by index instead of aborting the batch; with
+    max_errors only that many are kept (so a huge bad file stays cheap) but all are counted.
+    """
+    created_ids = []
+    errors = []
+    created = 0
+    invalid = 0
+    pending = []
+
+    def flush():
+        nonlocal created
+        objs = Flashcard.objects.bulk_create(pending)
+        created += len(objs)
+        # the Flashcard receiver indexes one saved card; bulk_create sends no post_save
+        dedup.index_cards(flashcard_set.class_obj_id, [(obj.id, obj.front_text, obj.back_text) for obj in objs])
+        if collect_ids:
+            created_ids.extend(obj.id for obj in objs)
+        pending.clear()
+
+    with transaction.atomic():
+        for index, row in enumerate(rows):
+            try:
+                question, answer = clean_row(row)
+            except ValueError as e:
+                invalid += 1
+                if max_errors is None or len(errors) < max_errors:
+                    error = {'index': index, 'error': str(e)}
+                    # index counts rows; line is where a file reader found the row, past headers and blank lines
+                    if row_line(row) is not None:
+                        error['line'] = row_line(row)
+                    errors.append(error)
+                continue
+
+            pending.append(Flashcard(
+                class_obj_id=flashcard_set.class_obj_id,
+                creator_id=user_id,
+                flashcard_set_id=flashcard_set.id,
+                front_text=question,
+                back_text=answer
+            ))
+            if len(pending) >= chunk_size:
+                flush()
+
+        if pending:
+            flush()
+
+        # bulk_create skips post_save, so do what the Flashcard receivers would have done once
+        if created:
+            adjust_card_count(flashcard_set.id, created)
+            bump_user_lists(USER_CARDS, user_id)
+
+    invalidate('user_cards', user_id)
+    if created:
+        invalidate('user_sets', flashcard_set.creator_id)
+    return {'created': created, 'ids': created_ids, 'errors': errors, 'invalid': invalid}
@@ -0,0 +1,131 @@
+"""
+Read-through cache for per-user lookups.
+
+Values live in the Django cache named by FLASHCARDS_CACHE_ALIAS (local memory by default, Redis when
+REDIS_URL is set). Entries expire after FLASHCARDS_CACHE_TIMEOUT seconds, the backend evicts least
+recently used keys when full, and flashcards.signals deletes entries when the rows behind them change.
+
+Loaders always read from the primary: right after a write deletes an entry, a lagging replica could
+still return the old rows (or no user for a new username), and that would be cached until the next
+write or the timeout.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+
+from .routers import use_primary
+
+_MISSING = object()
+
+_stats_lock = threading.Lock()
+_hits = Counter()
+_misses = Counter()
+
+
+def get_cache():
+    return caches[settings.FLASHCARDS_CACHE_ALIAS]
+
+
+def make_key(kind, ident):
+    return f'flashcards:{kind}:{ident}'
+
+
+def _record(kind, value):
+    with _stats_lock:
+        if value is _MISSING:
+            _misses[kind] += 1
+        else:
+            _hits[kind] += 1
+
+
+def cached(kind, ident, loader, timeout=None):
+    """Return the cached value for (kind, ident), calling loader() and storing its result on a miss"""
+    cache = get_cache()
+    key = make_key(kind, ident)
+    value = cache.get(key, _MISSING)
+    _record(kind, value)
+    if value is _MISSING:
+        value = use_primary(loader)()
+        cache.set(key, value, timeout or settings.FLASHCARDS_CACHE_TIMEOUT)
+    return value
+
+
+def cached_on_commit(kind, ident, loader):
+    """
+    cached() for loaders that may write: a loaded value is stored only once the current transaction
+    commits, so a rollback cannot leave entries pointing at rows that were never committed
+    """
+    cache = get_cache()
+    key = make_key(kind, ident)
+    value = cache.get(key, _MISSING)
+    _record(kind, value)
+    if value is _MISSING:
+        value = use_primary(loader)()
+        transaction.on_commit(lambda: cache.set(key, value, settings.FLASHCARDS_CACHE_TIMEOUT))
+    return value
+
+
+async def acached(kind, ident, loader):
+    """Async cached(): loader is called with no arguments and must return an awaitable"""
+    cache = get_cache()
+    key = make_key(kind, ident)
+    value = await cache.aget(key, _MISSING)
+    _record(kind, value)
+    if value is _MISSING:
+        value = await use_primary(_await)(loader)
+        await cache.aset(key, value, settings.FLASHCARDS_CACHE_TIMEOUT)
+    return value
+
+
+async def _await(loader):
+    # the awaitable is created and awaited inside use_primary, where its queries are routed
+    return await loader()
+
+
+def invalidate(kind, *idents):
+    """Drop cached entries once the current transaction commits (immediately outside one)"""
+    keys = [make_key(kind, ident) for ident in idents if ident is not None]
+    if keys:
+        transaction.on_commit(lambda: get_cache().delete_many(keys))
+
+
+def version(kind):
+    """Generation of a group of entries that are dropped together by bump(kind); put it in their idents"""
+    # a fresh timestamp rather than 1, so an evicted counter never reuses the idents of live entries
+    return get_cache().get_or_set(make_key(kind, 'version'), time.time_ns(), None)
+
+
+def bump(kind):
+    """Orphan every entry keyed on version(kind) once the current transaction commits"""
+    key = make_key(kind, 'version')
+
+    def increment():
+        try:
+            get_cache().incr(key)
+        except ValueError:
+            get_cache().set(key, time.time_ns(), None)
+
+    transaction.on_commit(increment)
+
+
+def get_user_id(username):
+    """Resolve a username to a user id, or None if there is no such user"""
+    return cached('user_id', username,
+                  lambda: User.objects.filter(username=username).values_list('id', flat=True).first())
+
+
+async def aget_user_id(username):
+    return await acached('user_id', username,
+                         lambda: User.objects.filter(username=username).values_list('id', flat=True).afirst())
+
+
+def stats():
+    """Hit/miss counters per kind of entry since this process started"""
+    with _stats_lock:
+        kinds = sorted(set(_hits) | set(_misses))
+        return {kind: {'hits': _hits[kind], 'misses': _misses[kind]} for kind in kinds}
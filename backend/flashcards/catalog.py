@@ -0,0 +1,43 @@
+"""
+The class catalog: shared classes to browse, search and join.
+
+Personal default classes are left out, and every catalog query walks the partial class_catalog_idx
+(shared classes only) in id order, one keyset page at a time. Searches match the start of class_name or
+class_number; on PostgreSQL they match anywhere in either, through the pg_trgm indexes of migration 0011.
+
+Pages are cached for FLASHCARDS_CATALOG_CACHE_TIMEOUT seconds under the current catalog version, which
+flashcards.signals bumps whenever a shared class is created, changed or deleted, so a new class shows up
+on the next request. member_count, which changes with every join, may lag by up to the timeout.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from . import cache
+from .models import Class
+from .pagination import keyset_page
+
+FIELDS = ('id', 'class_name', 'class_number', 'description', 'member_count')
+MAX_QUERY_LENGTH = 100
+
+
+def search_filter(text):
+    if connection.vendor == 'postgresql':
+        return Q(class_name__icontains=text) | Q(class_number__icontains=text)
+    return Q(class_name__istartswith=text) | Q(class_number__istartswith=text)
+
+
+def catalog_classes(text=''):
+    classes = Class.objects.filter(is_personal=False)
+    if text:
+        classes = classes.filter(search_filter(text))
+    return classes.values(*FIELDS)
+
+
+def page(request, text=''):
+    """One keyset page of the catalog, optionally narrowed to classes matching text"""
+    ident = f"{cache.version('catalog')}:{hashlib.sha1(text.lower().encode()).hexdigest()}"
+    return keyset_page(request, catalog_classes(text), cache_key=('catalog', ident),
+                       cache_timeout=settings.FLASHCARDS_CATALOG_CACHE_TIMEOUT)
@@ -0,0 +1,95 @@
+"""
+Denormalized FlashcardSet.card_count and Class.member_count.
+
+Single-row writes are counted by the receivers in flashcards.signals, which covers cascades and
+QuerySet.delete() too since Django sends post_delete per row. bulk_create sends no signals, so bulk
+paths call adjust_card_count / recount_members themselves. reconcile_* recompute every counter from
+the source tables in id-range batches, for drift left by raw SQL or by bulk writes outside these paths.
+
+Whatever changes a member_count, or adds, edits or removes a class, also bumps the CLASSES list version,
+which is all the ETag of the class listing reads. The per-user listings of cards and class memberships
+have a version each too (bump_user_lists), bumped wherever their cached copies are invalidated.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Class, ClassMember, Flashcard, FlashcardSet, ListVersion
+
+RECONCILE_BATCH_SIZE = 5000
+CLASSES = 'classes'
+USER_CARDS = 'user_cards'
+USER_CLASSES = 'user_classes'
+
+
+def adjust_card_count(set_id, delta):
+    """Add delta cards to a set and bump its version, in one UPDATE"""
+    FlashcardSet.objects.filter(id=set_id).update(
+        card_count=Greatest(F('card_count') + delta, Value(0)),
+        version=F('version') + 1
+    )
+
+
+def adjust_member_count(class_id, delta):
+    Class.objects.filter(id=class_id).update(member_count=Greatest(F('member_count') + delta, Value(0)))
+    bump_list_version(CLASSES)
+
+
+def bump_list_version(name):
+    if not ListVersion.objects.filter(name=name).update(version=F('version') + 1):
+        # migration 0015 creates the CLASSES row (a flushed test database has none); others start on first use
+        ListVersion.objects.bulk_create([ListVersion(name=name, version=1)], ignore_conflicts=True)
+
+
+def user_list_name(kind, user_id):
+    return f'{kind}:{user_id}'
+
+
+def bump_user_lists(kind, *user_ids):
+    """Bump the USER_CARDS or USER_CLASSES version of each user: one UPDATE, and one INSERT for users without a row"""
+    names = {user_list_name(kind, user_id) for user_id in user_ids if user_id is not None}
+    if names and ListVersion.objects.filter(name__in=names).update(version=F('version') + 1) < len(names):
+        # a user whose list never changed has no row yet; a missing row reads as version None
+        ListVersion.objects.bulk_create([ListVersion(name=name, version=1) for name in names], ignore_conflicts=True)
+
+
+def _count_of(model, fk):
+    rows = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def _reconcile(model, field, actual, batch_size, dry_run):
+    """Fix rows of model whose field differs from the actual expression; returns how many were off"""
+    bounds = model.objects.order_by('id').values_list('id', flat=True)
+    drifted = 0
+    last_id = 0
+    while True:
+        batch = list(bounds.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return drifted
+        last_id = batch[-1]
+        wrong = model.objects.filter(id__gte=batch[0], id__lte=last_id).annotate(actual=actual) \
+            .filter(~Q(**{field: F('actual')}))
+        if dry_run:
+            drifted += wrong.count()
+        else:
+            # the UPDATE recomputes rather than copying the annotation, so it is exact even under writes
+            drifted += model.objects.filter(id__in=wrong.values('id')).update(**{field: actual})
+
+
+def reconcile_card_counts(batch_size=RECONCILE_BATCH_SIZE, dry_run=False):
+    return _reconcile(FlashcardSet, 'card_count', _count_of(Flashcard, 'flashcard_set'), batch_size, dry_run)
+
+
+def reconcile_member_counts(batch_size=RECONCILE_BATCH_SIZE, dry_run=False):
+    drifted = _reconcile(Class, 'member_count', _count_of(ClassMember, 'class_obj'), batch_size, dry_run)
+    if drifted and not dry_run:
+        bump_list_version(CLASSES)
+    return drifted
+
+
+def recount_members(class_ids):
+    """Recompute member_count for the given classes, e.g. after a bulk_create of ClassMember rows"""
+    class_ids = list(class_ids)
+    if class_ids:
+        Class.objects.filter(id__in=class_ids).update(member_count=_count_of(ClassMember, 'class_obj'))
+        bump_list_version(CLASSES)
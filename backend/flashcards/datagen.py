@@ -0,0 +1,167 @@
+"""
+Synthetic data for benchmarks and load tests: users, classes, memberships, sets, cards, board
+messages, leaderboard rows and study time, written with bulk_create in batches.
+
+Counts come from a named scale in SCALES, optionally overridden one by one. Everything is derived from
+a seeded random.Random, so the same arguments produce the same data.
+"""
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+from .counters import recount_members
+from .models import (
+    Class, ClassMember, Flashcard, FlashcardSet, FlashcardSetLeaderboard, FlashcardSetStudyTime, Message,
+    MessageBoard
+)
+
+VOCABULARY = (
+    'cell membrane protein enzyme photosynthesis mitochondria nucleus ribosome osmosis diffusion '
+    'velocity acceleration momentum energy force friction gravity inertia torque voltage current '
+    'resistance capacitor integral derivative limit matrix vector eigenvalue theorem proof lemma '
+    'revolution empire treaty constitution amendment senate parliament economy inflation market '
+    'supply demand elasticity algorithm recursion pointer compiler variable function object class'
+).split()
+
+SUBJECTS = ('Biology', 'Physics', 'Calculus', 'History', 'Economics', 'Computer Science', 'Chemistry')
+
+SCALES = {
+    'tiny': dict(users=50, classes=10, memberships_per_user=3, sets_per_user=2, cards_per_set=20,
+                 messages_per_class=50, leaderboard_per_set=10),
+    'small': dict(users=500, classes=50, memberships_per_user=3, sets_per_user=2, cards_per_set=50,
+                  messages_per_class=200, leaderboard_per_set=20),
+    'medium': dict(users=5000, classes=500, memberships_per_user=4, sets_per_user=3, cards_per_set=60,
+                   messages_per_class=500, leaderboard_per_set=50),
+    'large': dict(users=50000, classes=5000, memberships_per_user=4, sets_per_user=4, cards_per_set=50,
+                  messages_per_class=1000, leaderboard_per_set=100),
+}
+
+DEFAULT_PASSWORD = 'synthetic-password-1'
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(scale='tiny', prefix='synthetic', seed=0, batch_size=5000, password=DEFAULT_PASSWORD,
+             progress=None, **overrides):
+    """
+    Create one dataset and return {'users': [...usernames of the first few users], 'counts': {...},
+    'elapsed': seconds}. Usernames are "<prefix>_user_<n>", so pick a new prefix to add a second dataset.
+    """
+    counts = {**SCALES[scale], **{name: value for name, value in overrides.items() if value is not None}}
+    rng = random.Random(seed)
+    log = progress or (lambda message: None)
+    start = time.perf_counter()
+
+    # one hash for everyone; hashing per user would dominate generation time
+    password_hash = make_password(password)
+    users = []
+    for batch in _batches(range(counts['users']), batch_size):
+        users += User.objects.bulk_create([
+            User(username=f'{prefix}_user_{i}', email=f'{prefix}_user_{i}@example.com', password=password_hash)
+            for i in batch
+        ])
+    log(f"{len(users)} users")
+
+    classes = Class.objects.bulk_create([
+        Class(class_name=f'{rng.choice(SUBJECTS)} {100 + i}', class_number=f'{prefix.upper()}-{i}',
+              description=sentence(rng, 12))
+        for i in range(counts['classes'])
+    ], batch_size=batch_size)
+    MessageBoard.objects.bulk_create([MessageBoard(class_obj=class_obj) for class_obj in classes],
+                                     batch_size=batch_size)
+    log(f"{len(classes)} classes")
+
+    members = {class_obj.id: [] for class_obj in classes}
+    user_classes = {}
+    memberships = []
+    for user in users:
+        joined = rng.sample(classes, min(counts['memberships_per_user'], len(classes)))
+        user_classes[user.id] = [class_obj.id for class_obj in joined]
+        for class_obj in joined:
+            role = 'Leader' if not members[class_obj.id] else rng.choice(('Student', 'Student', 'Student', 'TA'))
+            members[class_obj.id].append(user.id)
+            memberships.append(ClassMember(user_id=user.id, class_obj_id=class_obj.id, role_in_class=role))
+    ClassMember.objects.bulk_create(memberships, batch_size=batch_size)
+    for batch in _batches(members, batch_size):
+        recount_members(batch)
+    log(f"{len(memberships)} memberships")
+
+    sets = FlashcardSet.objects.bulk_create([
+        FlashcardSet(class_obj_id=rng.choice(user_classes[user.id]), creator_id=user.id,
+                     name=f'{sentence(rng, 2).title()} review {n}', description=sentence(rng, 8),
+                     card_count=counts['cards_per_set'])
+        for user in users for n in range(counts['sets_per_user'])
+    ], batch_size=batch_size)
+    log(f"{len(sets)} sets")
+
+    def cards():
+        for flashcard_set in sets:
+            for _ in range(counts['cards_per_set']):
+                yield Flashcard(
+                    flashcard_set_id=flashcard_set.id, class_obj_id=flashcard_set.class_obj_id,
+                    creator_id=flashcard_set.creator_id,
+                    front_text=f'What is the {rng.choice(VOCABULARY)} of {sentence(rng, rng.randint(1, 4))}?',
+                    back_text=sentence(rng, rng.randint(4, 20))
+                )
+
+    card_total = 0
+    for batch in _batches(cards(), batch_size):
+        Flashcard.objects.bulk_create(batch)
+        card_total += len(batch)
+    log(f"{card_total} cards")
+
+    boards = dict(MessageBoard.objects.filter(class_obj__in=classes).values_list('class_obj_id', 'id'))
+
+    def messages():
+        for class_obj in classes:
+            authors = members[class_obj.id]
+            if not authors:
+                continue
+            for _ in range(counts['messages_per_class']):
+                yield Message(board_id=boards[class_obj.id], user_id=rng.choice(authors),
+                              message_text=sentence(rng, rng.randint(3, 25)))
+
+    message_total = 0
+    for batch in _batches(messages(), batch_size):
+        Message.objects.bulk_create(batch)
+        message_total += len(batch)
+    log(f"{message_total} messages")
+
+    def activity(model, **fields):
+        for flashcard_set in sets:
+            candidates = members[flashcard_set.class_obj_id]
+            for user_id in rng.sample(candidates, min(counts['leaderboard_per_set'], len(candidates))):
+                yield model(flashcard_set_id=flashcard_set.id, user_id=user_id,
+                            **{name: make() for name, make in fields.items()})
+
+    leaderboard_total = 0
+    for batch in _batches(activity(FlashcardSetLeaderboard, score=lambda: rng.randint(0, 1000)), batch_size):
+        FlashcardSetLeaderboard.objects.bulk_create(batch)
+        leaderboard_total += len(batch)
+    for batch in _batches(activity(FlashcardSetStudyTime, time_spent=lambda: rng.randint(30, 7200)), batch_size):
+        FlashcardSetStudyTime.objects.bulk_create(batch)
+    log(f"{leaderboard_total} leaderboard rows")
+
+    return {
+        'users': [user.username for user in users[:10]],
+        'counts': {
+            'users': len(users), 'classes': len(classes), 'memberships': len(memberships), 'sets': len(sets),
+            'cards': card_total, 'messages': message_total, 'leaderboard': leaderboard_total
+        },
+        'elapsed': time.perf_counter() - start
+    }
@@ -0,0 +1,143 @@
+"""
+Deck import and export in CSV, Anki-style TSV and JSONL.
+
+Readers take any iterable of text (or, for JSONL, bytes) lines, such as an open file or a decoded upload,
+and yield {question, answer} rows for bulk.insert_flashcards, one line at a time. Writers stream a set's
+cards from .iterator() and yield text chunks, so neither direction holds the deck in memory.
+"""
+import codecs
+import csv
+import itertools
+import json
+import re
+
+from django.conf import settings
+
+from .bulk import InvalidRow, iter_ndjson
+from .models import Flashcard
+
+FORMATS = ('csv', 'tsv', 'jsonl')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'tsv': 'text/tab-separated-values; charset=utf-8',
+    'jsonl': 'application/x-ndjson'
+}
+EXPORT_CHUNK_CHARS = 64 * 1024
+CSV_HEADER = ['question', 'answer']
+ANKI_HEADER = '#separator:tab\n#html:false\n'
+# a file option line such as "#separator:tab" or "#tags column:3"
+ANKI_DIRECTIVE = re.compile(r'#[a-z ]+:', re.IGNORECASE)
+
+
+def guess_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('ndjson', 'json'):
+        return 'jsonl'
+    if extension == 'txt':
+        # Anki's "Notes in Plain Text" export
+        return 'tsv'
+    return extension if extension in FORMATS else None
+
+
+def decode_lines(upload):
+    """Decode an uploaded file line by line, dropping a UTF-8 BOM"""
+    return codecs.iterdecode(upload, 'utf-8-sig')
+
+
+def _iter_delimited(lines, delimiter, first_line=1):
+    """first_line is the file's line number of the first of lines; rows carry the line they start on"""
+    reader = csv.reader(lines, delimiter=delimiter)
+    line = first_line
+    for fields in reader:
+        # a quoted field may span lines, so the next row starts after every line read so far
+        number, line = line, first_line + reader.line_num
+        if not fields or not any(field.strip() for field in fields):
+            continue
+        if len(fields) < 2:
+            yield InvalidRow(f'Line {number}: expected question and answer columns', line=number)
+            continue
+        # Anki exports may carry extra columns (tags, deck); only the first two are the card
+        yield {'question': fields[0], 'answer': fields[1], 'line': number}
+
+
+def iter_csv(lines):
+    rows = _iter_delimited(lines, ',')
+    first = next(rows, None)
+    if first is None:
+        return
+    if isinstance(first, InvalidRow) or [first['question'].strip().lower(), first['answer'].strip().lower()] != CSV_HEADER:
+        yield first
+    yield from rows
+
+
+def iter_anki(lines):
+    # Anki puts file options such as "#separator:tab" on lines before the first note; after it, a line
+    # starting with '#' is a card (or the rest of a quoted multi-line field) like any other
+    lines = iter(lines)
+    for number, line in enumerate(lines, start=1):
+        if not ANKI_DIRECTIVE.match(line):
+            yield from _iter_delimited(itertools.chain([line], lines), '\t', first_line=number)
+            return
+
+
+def read_deck(lines, fmt):
+    """Yield rows parsed from lines in the given format"""
+    if fmt == 'csv':
+        return iter_csv(lines)
+    if fmt == 'tsv':
+        return iter_anki(lines)
+    if fmt == 'jsonl':
+        return iter_ndjson(lines)
+    raise ValueError(f'Unsupported format {fmt!r}; expected one of {", ".join(FORMATS)}')
+
+
+class _Echo:
+    """File-like object for csv.writer that hands back each written line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def _row_writer(**options):
+    """csv.writer(...).writerow that also quotes a row with a field starting with '#', which Anki and
+    iter_anki would otherwise take for a file option line"""
+    writer = csv.writer(_Echo(), **options)
+    quote_all = csv.writer(_Echo(), quoting=csv.QUOTE_ALL, **options)
+
+    def writerow(fields):
+        return (quote_all if any(field.startswith('#') for field in fields) else writer).writerow(fields)
+    return writerow
+
+
+def _format_rows(cards, fmt):
+    if fmt == 'csv':
+        writerow = _row_writer()
+        yield writerow(CSV_HEADER)
+        for question, answer in cards:
+            yield writerow([question, answer])
+    elif fmt == 'tsv':
+        writerow = _row_writer(delimiter='\t', lineterminator='\n')
+        yield ANKI_HEADER
+        for question, answer in cards:
+            yield writerow([question, answer])
+    elif fmt == 'jsonl':
+        for question, answer in cards:
+            yield json.dumps({'question': question, 'answer': answer}, ensure_ascii=False) + '\n'
+    else:
+        raise ValueError(f'Unsupported format {fmt!r}; expected one of {", ".join(FORMATS)}')
+
+
+def export_deck(set_id, fmt):
+    """Yield a set's cards, oldest first, as text chunks of about EXPORT_CHUNK_CHARS"""
+    cards = Flashcard.objects.filter(flashcard_set_id=set_id).order_by('id').values_list('front_text', 'back_text')
+
+    pending = []
+    size = 0
+    for line in _format_rows(cards.iterator(chunk_size=settings.FLASHCARDS_STREAM_CHUNK_SIZE), fmt):
+        pending.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_CHARS:
+            yield ''.join(pending)
+            pending, size = [], 0
+    if pending:
+        yield ''.join(pending)
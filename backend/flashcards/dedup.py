@@ -0,0 +1,225 @@
+"""
+Near-duplicate flashcard detection with MinHash signatures and an LSH index per class.
+
+A card's text is normalized and split into character shingles. Each shingle is hashed, and the
+signature keeps the minimum of NUM_PERM multiply-shift hashes of those values, computed for a whole
+batch of cards at once with NumPy. The signature is cut into BANDS bands of ROWS values, and each band
+is stored as an LSHBucket. Cards that share a bucket in any band are candidates; they count as
+duplicates when the fraction of equal signature values (an estimate of Jaccard similarity) reaches
+the threshold.
+
+Cards are indexed in the transaction that writes them (see signals.py and bulk.py), and cards written
+before that by the dedup_class command, so looking up similar cards only reads.
+"""
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Flashcard, FlashcardSignature, LSHBucket
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+INDEX_BATCH_SIZE = 2000
+DEFAULT_THRESHOLD = 0.8
+MAX_BLOCK_SHINGLES = 32768
+
+_rng = np.random.default_rng(20240917)
+_A = _rng.integers(1, 2 ** 63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, size=NUM_PERM, dtype=np.uint64)
+_BAND_MULTIPLIERS = _rng.integers(1, 2 ** 63, size=ROWS, dtype=np.uint64) | np.uint64(1)
+
+
+def normalize(text):
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+def shingle_hashes(text):
+    text = normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def _signature_block(hashes):
+    offsets = np.cumsum([0] + [len(h) for h in hashes[:-1]])
+    values = np.concatenate(hashes)
+    with np.errstate(over='ignore'):
+        # multiply-shift hashing: wrap at 2**64 and keep the high 32 bits
+        permuted = (values[:, None] * _A[None, :] + _B[None, :]) >> np.uint64(32)
+    return np.minimum.reduceat(permuted, offsets, axis=0).astype(np.uint32)
+
+
+def signatures(texts):
+    """MinHash signatures for many texts as a (len(texts), NUM_PERM) uint32 array"""
+    blocks = []
+    block, size = [], 0
+    for text in texts:
+        hashes = shingle_hashes(text)
+        block.append(hashes)
+        size += len(hashes)
+        # bound the (shingles x NUM_PERM) intermediate to a few tens of MB
+        if size >= MAX_BLOCK_SHINGLES:
+            blocks.append(_signature_block(block))
+            block, size = [], 0
+    if block:
+        blocks.append(_signature_block(block))
+    if not blocks:
+        return np.empty((0, NUM_PERM), dtype=np.uint32)
+    return np.concatenate(blocks)
+
+
+def band_buckets(sigs):
+    """One signed 64-bit bucket id per (card, band)"""
+    bands = sigs.astype(np.uint64).reshape(len(sigs), BANDS, ROWS)
+    with np.errstate(over='ignore'):
+        buckets = (bands * _BAND_MULTIPLIERS).sum(axis=2, dtype=np.uint64)
+    return buckets.view(np.int64)
+
+
+def card_text(front_text, back_text):
+    return f'{front_text} {back_text}'
+
+
+def index_cards(class_id, cards):
+    """Compute and store signatures and buckets for (card_id, front_text, back_text) of cards in one class"""
+    sigs = signatures([card_text(front, back) for _, front, back in cards])
+    buckets = band_buckets(sigs)
+    # no savepoint: inside a write's transaction this adds no queries, and the write rolls back as a whole
+    with transaction.atomic(savepoint=False):
+        # conflicts are a concurrent index_class that stored the same card first
+        FlashcardSignature.objects.bulk_create(
+            [FlashcardSignature(flashcard_id=card_id, class_obj_id=class_id, signature=sig.tobytes())
+             for (card_id, _, _), sig in zip(cards, sigs)],
+            ignore_conflicts=True
+        )
+        LSHBucket.objects.bulk_create(
+            [LSHBucket(class_obj_id=class_id, band=band, bucket=int(bucket), flashcard_id=card_id)
+             for (card_id, _, _), card_buckets in zip(cards, buckets)
+             for band, bucket in enumerate(card_buckets)],
+            ignore_conflicts=True
+        )
+
+
+def index_class(class_id):
+    """Index every card in the class that does not have a signature yet, e.g. cards written before indexing on write"""
+    indexed = 0
+    while True:
+        batch = list(
+            Flashcard.objects.filter(class_obj_id=class_id, minhash__isnull=True)
+            .order_by('id').values_list('id', 'front_text', 'back_text')[:INDEX_BATCH_SIZE]
+        )
+        if not batch:
+            return indexed
+        index_cards(class_id, batch)
+        indexed += len(batch)
+
+
+def forget(card_ids):
+    """Drop stored signatures, e.g. before re-indexing a card whose text or class changed"""
+    LSHBucket.objects.filter(flashcard_id__in=card_ids).delete()
+    FlashcardSignature.objects.filter(flashcard_id__in=card_ids).delete()
+
+
+def _load_signature(raw):
+    return np.frombuffer(bytes(raw), dtype=np.uint32)
+
+
+def similar_cards(card_id, threshold=DEFAULT_THRESHOLD, limit=20):
+    """Return [(card_id, estimated similarity)] for cards in the same class, most similar first"""
+    card = Flashcard.objects.filter(id=card_id) \
+        .values('class_obj_id', 'front_text', 'back_text', 'minhash__signature').first()
+    if card is None:
+        return None
+    class_id = card['class_obj_id']
+    if card['minhash__signature'] is not None:
+        signature = _load_signature(card['minhash__signature'])
+    else:
+        # not indexed yet: compute it here rather than write from a read
+        signature = signatures([card_text(card['front_text'], card['back_text'])])[0]
+
+    match = Q()
+    for band, bucket in enumerate(band_buckets(signature[None, :])[0]):
+        match |= Q(band=band, bucket=int(bucket))
+    candidate_ids = set(
+        LSHBucket.objects.filter(class_obj_id=class_id).filter(match).values_list('flashcard_id', flat=True)
+    )
+    candidate_ids.discard(card_id)
+
+    results = []
+    for other_id, raw in FlashcardSignature.objects.filter(flashcard_id__in=candidate_ids) \
+            .values_list('flashcard_id', 'signature'):
+        similarity = float(np.mean(_load_signature(raw) == signature))
+        if similarity >= threshold:
+            results.append((other_id, similarity))
+    results.sort(key=lambda item: (-item[1], item[0]))
+    return results[:limit]
+
+
+def duplicate_clusters(class_id, threshold=DEFAULT_THRESHOLD):
+    """
+    Group the class's indexed cards into clusters of near-duplicates, each sorted by id.
+    Every bucket is compared against its first member only, so the work is linear in the number of
+    bucket entries rather than quadratic in the number of cards. Clusters chain: A~B and B~C put A and C
+    together even when A and C are not similar themselves.
+    """
+    sigs = {
+        card_id: _load_signature(raw)
+        for card_id, raw in FlashcardSignature.objects.filter(class_obj_id=class_id)
+        .values_list('flashcard_id', 'signature').iterator(chunk_size=INDEX_BATCH_SIZE)
+    }
+
+    parent = {}
+
+    def find(card_id):
+        root = card_id
+        while parent.get(root, root) != root:
+            root = parent[root]
+        parent[card_id] = root
+        return root
+
+    previous_key, head = None, None
+    buckets = LSHBucket.objects.filter(class_obj_id=class_id).order_by('band', 'bucket', 'flashcard_id') \
+        .values_list('band', 'bucket', 'flashcard_id')
+    for band, bucket, card_id in buckets.iterator(chunk_size=INDEX_BATCH_SIZE):
+        if (band, bucket) != previous_key:
+            previous_key, head = (band, bucket), card_id
+            continue
+        if find(card_id) == find(head):
+            continue
+        if np.mean(sigs[card_id] == sigs[head]) >= threshold:
+            parent[find(card_id)] = find(head)
+
+    clusters = defaultdict(list)
+    for card_id in parent:
+        clusters[find(card_id)].append(card_id)
+    return sorted(sorted(members) for members in clusters.values() if len(members) > 1)
+
+
+def merge_clusters(clusters, threshold=DEFAULT_THRESHOLD):
+    """
+    Keep the oldest card of each cluster and delete the rest that are duplicates of that card itself;
+    a card that only joined the cluster through a chain of similar cards is kept. Returns the number of
+    cards deleted
+    """
+    deleted = 0
+    with transaction.atomic():
+        for members in clusters:
+            sigs = dict(FlashcardSignature.objects.filter(flashcard_id__in=members)
+                        .values_list('flashcard_id', 'signature'))
+            if members[0] not in sigs:
+                continue
+            kept = _load_signature(sigs[members[0]])
+            duplicate_ids = [card_id for card_id in members[1:]
+                             if card_id in sigs and np.mean(_load_signature(sigs[card_id]) == kept) >= threshold]
+            if duplicate_ids:
+                Flashcard.objects.filter(id__in=duplicate_ids).delete()
+                deleted += len(duplicate_ids)
+    return deleted
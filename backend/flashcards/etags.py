@@ -0,0 +1,143 @@
+"""
+ETag functions for the GET endpoints, used with django.views.decorators.http.etag.
+
+Each one computes a cheap version token with a single indexed query (or none at all) so a matching
+If-None-Match is answered with 304 before the view runs its listing query or renders JSON.
+Returning None skips conditional handling and lets the view produce its own error response.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from .authentication import token_caller
+from .cache import aget_user_id, get_user_id
+from .counters import CLASSES, USER_CARDS, USER_CLASSES, user_list_name
+from .models import FlashcardSet, ListVersion
+
+# version moves with every card write, so card_count changes show up in the sets tag too
+SETS_STATS = {'count': Count('id'), 'max_id': Max('id'), 'versions': Sum('version')}
+
+
+def _etag(kind, token, request):
+    # The query string is part of the tag because pages and stream mode render different bodies
+    raw = f'{kind}:{token}:{request.GET.urlencode()}'
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _versions(kind, user_id):
+    # one primary key lookup; bumped by every write to the user's list (see counters.bump_user_lists)
+    return ListVersion.objects.filter(name=user_list_name(kind, user_id)).values_list('version', flat=True)
+
+
+def _user_id(request):
+    username = request.GET.get('username')
+    if username:
+        return get_user_id(username)
+    # these run before DRF authenticates the request, so read a bearer token here too
+    caller = token_caller(request)
+    return caller[0] if caller else None
+
+
+async def _auser_id(request):
+    username = request.GET.get('username')
+    if username:
+        return await aget_user_id(username)
+    caller = token_caller(request)
+    return caller[0] if caller else None
+
+
+def flashcards_in_set_etag(request):
+    set_id = request.GET.get('set_id')
+    if not set_id or not set_id.isdigit():
+        return None
+    version = FlashcardSet.objects.filter(id=set_id).values_list('version', flat=True).first()
+    if version is None:
+        return None
+    return _etag('set', f'{set_id}-{version}', request)
+
+
+def flashcard_sets_etag(request):
+    user_id = _user_id(request)
+    if user_id is None:
+        return None
+    stats = FlashcardSet.objects.filter(creator_id=user_id).aggregate(**SETS_STATS)
+    return _etag('sets', f"{stats['count']}-{stats['max_id']}-{stats['versions']}", request)
+
+
+def flashcards_etag(request):
+    user_id = _user_id(request)
+    if user_id is None:
+        return None
+    return _etag('cards', f'{user_id}-{_versions(USER_CARDS, user_id).first()}', request)
+
+
+def user_classes_etag(request):
+    user_id = _user_id(request)
+    if user_id is None:
+        return None
+    return _etag('user_classes', f'{user_id}-{_versions(USER_CLASSES, user_id).first()}', request)
+
+
+def classes_etag(request):
+    # bumped by every class write and member_count change; see flashcards.counters
+    version = ListVersion.objects.filter(name=CLASSES).values_list('version', flat=True).first()
+    return _etag('classes', version, request)
+
+
+# Async twins of the functions above, for flashcards.async_views; each must produce the same tag
+
+async def aflashcards_in_set_etag(request):
+    set_id = request.GET.get('set_id')
+    if not set_id or not set_id.isdigit():
+        return None
+    version = await FlashcardSet.objects.filter(id=set_id).values_list('version', flat=True).afirst()
+    if version is None:
+        return None
+    return _etag('set', f'{set_id}-{version}', request)
+
+
+async def aflashcard_sets_etag(request):
+    user_id = await _auser_id(request)
+    if user_id is None:
+        return None
+    stats = await FlashcardSet.objects.filter(creator_id=user_id).aaggregate(**SETS_STATS)
+    return _etag('sets', f"{stats['count']}-{stats['max_id']}-{stats['versions']}", request)
+
+
+async def aflashcards_etag(request):
+    user_id = await _auser_id(request)
+    if user_id is None:
+        return None
+    return _etag('cards', f'{user_id}-{await _versions(USER_CARDS, user_id).afirst()}', request)
+
+
+async def auser_classes_etag(request):
+    user_id = await _auser_id(request)
+    if user_id is None:
+        return None
+    return _etag('user_classes', f'{user_id}-{await _versions(USER_CLASSES, user_id).afirst()}', request)
+
+
+async def aclasses_etag(request):
+    version = await ListVersion.objects.filter(name=CLASSES).values_list('version', flat=True).afirst()
+    return _etag('classes', version, request)
+
+
+def async_etag(etag_func):
+    """django.views.decorators.http.etag for an async view whose etag function is also async"""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            tag = await etag_func(request)
+            tag = quote_etag(tag) if tag is not None else None
+            response = get_conditional_response(request, etag=tag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if tag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', tag)
+            return response
+        return inner
+    return decorator
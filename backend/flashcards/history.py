@@ -0,0 +1,83 @@
+"""Message board history: (timestamp, id) keyset seeks and a gzip'd NDJSON export"""
+import zlib
+from datetime import datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .models import Message
+from .pagination import PaginationError, decode_cursor, encode_cursor
+
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def message_cursor(row):
+    # isoformat keeps microseconds, which the seek needs to be exact
+    return encode_cursor({'ts': row['ts'].isoformat(), 'id': row['id']})
+
+
+def parse_message_cursor(cursor):
+    values = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(values['ts']), int(values['id'])
+    except (KeyError, TypeError, ValueError):
+        raise PaginationError('Invalid cursor')
+
+
+def _compact(message):
+    return {
+        'id': message.id,
+        'user_id': message.user_id,
+        'username': message.user.username,
+        'text': message.message_text,
+        'ts': message.timestamp
+    }
+
+
+def history_page(board_id, limit, before=None, after=None):
+    """
+    Return (rows oldest first, has_more) for one page of a board.
+    With after, the page starts just after that (timestamp, id); otherwise it ends just before `before`
+    (or at the newest message). Either way it is one seek on the (board, timestamp, id) index.
+    """
+    messages = Message.objects.filter(board_id=board_id).select_related('user').only(
+        'id', 'user_id', 'message_text', 'timestamp', 'user__username'
+    )
+    if after is not None:
+        ts, message_id = after
+        messages = messages.filter(Q(timestamp__gt=ts) | Q(timestamp=ts, id__gt=message_id)).order_by('timestamp', 'id')
+    else:
+        if before is not None:
+            ts, message_id = before
+            messages = messages.filter(Q(timestamp__lt=ts) | Q(timestamp=ts, id__lt=message_id))
+        messages = messages.order_by('-timestamp', '-id')
+
+    rows = [_compact(message) for message in messages[:limit + 1]]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is None:
+        rows.reverse()
+    return rows, has_more
+
+
+def export_board(board_id):
+    """Yield the whole board, oldest first, as gzip-compressed NDJSON chunks"""
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    messages = Message.objects.filter(board_id=board_id).select_related('user').only(
+        'id', 'user_id', 'message_text', 'timestamp', 'user__username'
+    ).order_by('timestamp', 'id')
+
+    pending = []
+    size = 0
+    for message in messages.iterator(chunk_size=settings.FLASHCARDS_STREAM_CHUNK_SIZE):
+        line = (encoder.encode(_compact(message)) + '\n').encode()
+        pending.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = compressor.compress(b''.join(pending))
+            pending, size = [], 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b''.join(pending)) + compressor.flush()
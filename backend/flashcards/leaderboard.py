@@ -0,0 +1,178 @@
+"""
+Leaderboard rankings kept sorted in process and maintained incrementally as scores are upserted.
+
+FlashcardSetLeaderboard stays the source of truth. Each worker loads a set's scores once into a
+SetRanking and applies its own submissions in place. A per-set generation counter in the Django cache
+tells the other workers to reload after someone else writes, but only when the cache is shared between
+them (Redis); with the default per-process LocMemCache each worker sees only its own bumps. So every
+submission also bumps a ListVersion row for the set, and a ranking older than
+FLASHCARDS_LEADERBOARD_MAX_AGE seconds reads that one row and is rebuilt only if it moved. Only one
+caller per process rebuilds a set; the others wait for its result.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .cache import get_cache
+from .counters import bump_list_version
+from .models import FlashcardSetLeaderboard, ListVersion
+
+
+class SetRanking:
+    """Scores of one set ordered by score descending, ties broken by user id"""
+
+    def __init__(self, rows=()):
+        self.scores = dict(rows)
+        self.entries = sorted((-score, user_id) for user_id, score in self.scores.items())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def upsert(self, user_id, score):
+        old = self.scores.get(user_id)
+        if old is not None:
+            del self.entries[bisect_left(self.entries, (-old, user_id))]
+        insort(self.entries, (-score, user_id))
+        self.scores[user_id] = score
+
+    def rank(self, user_id):
+        """1-based rank of user_id, or None if they have no score"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return bisect_left(self.entries, (-score, user_id)) + 1
+
+    def window(self, start, stop):
+        """(rank, user_id, score) for ranks start+1 .. stop"""
+        start = max(start, 0)
+        return [(start + offset + 1, user_id, -neg_score)
+                for offset, (neg_score, user_id) in enumerate(self.entries[start:stop])]
+
+    def top(self, k):
+        return self.window(0, k)
+
+    def around(self, user_id, radius):
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        return self.window(rank - 1 - radius, rank + radius)
+
+
+_lock = threading.Lock()
+_rankings = {}  # set id -> (generation, version, version checked at, SetRanking)
+_loading = {}  # set id -> lock held by the caller rebuilding that set's ranking
+
+
+def _generation_key(set_id):
+    return f'flashcards:leaderboard_gen:{set_id}'
+
+
+def _bump_generation(set_id):
+    cache = get_cache()
+    key = _generation_key(set_id)
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # evicted between add and incr; start a new sequence
+        cache.set(key, 1, None)
+        return 1
+
+
+def version_name(set_id):
+    return f'leaderboard:{set_id}'
+
+
+def _version(set_id):
+    return ListVersion.objects.filter(name=version_name(set_id)).values_list('version', flat=True).first()
+
+
+def _load(set_id):
+    """(version, SetRanking) from the database; the version is read first, so a write during the load shows"""
+    version = _version(set_id)
+    rows = FlashcardSetLeaderboard.objects.filter(flashcard_set_id=set_id).values_list('user_id', 'score')
+    return version, SetRanking(rows.iterator(chunk_size=settings.FLASHCARDS_STREAM_CHUNK_SIZE))
+
+
+def get_ranking(set_id):
+    """
+    Return this worker's SetRanking for a set, rebuilding it only when the cached generation or, once
+    the ranking is FLASHCARDS_LEADERBOARD_MAX_AGE seconds old, the version row shows a write it lacks
+    """
+    generation = get_cache().get(_generation_key(set_id), 0)
+    with _lock:
+        loaded = _rankings.get(set_id)
+    if loaded is not None and loaded[0] == generation:
+        if time.monotonic() - loaded[2] < settings.FLASHCARDS_LEADERBOARD_MAX_AGE:
+            return loaded[3]
+        if _version(set_id) == loaded[1]:
+            with _lock:
+                if _rankings.get(set_id) is loaded:
+                    _rankings[set_id] = (generation, loaded[1], time.monotonic(), loaded[3])
+            return loaded[3]
+
+    with _lock:
+        loading = _loading.setdefault(set_id, threading.Lock())
+    with loading:
+        with _lock:
+            current = _rankings.get(set_id)
+        if current is not None and current is not loaded and current[0] == generation:
+            # rebuilt by the caller this one waited for
+            return current[3]
+        checked_at = time.monotonic()
+        version, ranking = _load(set_id)
+        with _lock:
+            _rankings[set_id] = (generation, version, checked_at, ranking)
+        return ranking
+
+
+def submit_scores(set_id, scores):
+    """Upsert {user_id: score} for a set with one INSERT ... ON CONFLICT and apply it to the ranking"""
+    ranking = get_ranking(set_id)
+    with transaction.atomic():
+        FlashcardSetLeaderboard.objects.bulk_create(
+            [FlashcardSetLeaderboard(flashcard_set_id=set_id, user_id=user_id, score=score)
+             for user_id, score in scores.items()],
+            update_conflicts=True,
+            unique_fields=['flashcard_set', 'user'],
+            update_fields=['score', 'last_updated']
+        )
+        bump_list_version(version_name(set_id))
+        version = _version(set_id)
+
+    with _lock:
+        for user_id, score in scores.items():
+            ranking.upsert(user_id, score)
+        generation = _bump_generation(set_id)
+        loaded = _rankings.get(set_id)
+        if (loaded is not None and loaded[3] is ranking and loaded[0] == generation - 1
+                and (loaded[1] or 0) == version - 1):
+            # only this submission happened since its last load, and it has been applied in place
+            _rankings[set_id] = (generation, version, loaded[2], ranking)
+        else:
+            # another worker wrote in between; reload on next read
+            _rankings.pop(set_id, None)
+
+
+def top_scores(set_id, k):
+    ranking = get_ranking(set_id)
+    with _lock:
+        return ranking.top(k)
+
+
+def scores_around(set_id, user_id, radius):
+    """(rank, entries) for a user and radius neighbours on each side; rank is None without a score"""
+    ranking = get_ranking(set_id)
+    with _lock:
+        return ranking.rank(user_id), ranking.around(user_id, radius)
+
+
+def with_usernames(rows):
+    """Turn (rank, user_id, score) tuples into response dicts with one username query"""
+    names = dict(User.objects.filter(id__in=[user_id for _, user_id, _ in rows]).values_list('id', 'username'))
+    return [{'rank': rank, 'user_id': user_id, 'username': names.get(user_id), 'score': score}
+            for rank, user_id, score in rows]
@@ -0,0 +1,96 @@
+"""
+Querysets and response rows of the read endpoints, shared by views and async_views.
+
+Each listing is defined once here; the sync views iterate the querysets, the async ones iterate them
+with `async for`, and both shape rows and bodies with the same functions, so the two stay identical.
+"""
+from rest_framework import status
+
+from .models import Class, ClassMember, Flashcard, FlashcardSet, FlashcardSetStudyTime
+
+DASHBOARD_RECENT_STUDY = 10
+
+
+def caller_error(user_id, username):
+    """(message, status) for a read endpoint whose caller is missing or unknown, else None"""
+    if not username:
+        return 'Username is required', status.HTTP_400_BAD_REQUEST
+    if user_id is None:
+        return 'User not found', status.HTTP_404_NOT_FOUND
+    return None
+
+
+def user_sets(user_id):
+    return FlashcardSet.objects.filter(creator_id=user_id).values(
+        'id', 'name', 'description', 'class_obj_id', 'created_at', 'card_count'
+    )
+
+
+def set_cards(flashcard_set):
+    return Flashcard.objects.filter(flashcard_set=flashcard_set).values('id', 'front_text', 'back_text', 'creator_id')
+
+
+def user_cards(user_id):
+    return Flashcard.objects.filter(creator_id=user_id).values('id', 'front_text', 'back_text')
+
+
+def all_classes():
+    return Class.objects.all().values('id', 'class_name', 'class_number', 'description', 'member_count')
+
+
+def memberships(user_id):
+    return ClassMember.objects.filter(user_id=user_id).select_related('class_obj')
+
+
+def class_row(membership, member_count=False):
+    row = {
+        'id': membership.class_obj.id,
+        'class_name': membership.class_obj.class_name,
+        'class_number': membership.class_obj.class_number,
+        'description': membership.class_obj.description,
+        'role_in_class': membership.role_in_class
+    }
+    if member_count:
+        row['member_count'] = membership.class_obj.member_count
+    return row
+
+
+def dashboard_querysets(user_id):
+    """(memberships, sets, recently studied) for the dashboard, one query each"""
+    return (
+        memberships(user_id).order_by('class_obj_id'),
+        FlashcardSet.objects.filter(creator_id=user_id).select_related('class_obj').order_by('-created_at', '-id'),
+        FlashcardSetStudyTime.objects.filter(user_id=user_id).select_related('flashcard_set')
+        .order_by('-last_studied')[:DASHBOARD_RECENT_STUDY]
+    )
+
+
+def dashboard_set_row(flashcard_set):
+    return {
+        'id': flashcard_set.id,
+        'name': flashcard_set.name,
+        'description': flashcard_set.description,
+        'class_obj_id': flashcard_set.class_obj_id,
+        'class_name': flashcard_set.class_obj.class_name,
+        'created_at': flashcard_set.created_at,
+        'card_count': flashcard_set.card_count
+    }
+
+
+def recent_study_row(entry):
+    return {
+        'set_id': entry.flashcard_set_id,
+        'set_name': entry.flashcard_set.name,
+        'time_spent': entry.time_spent,
+        'last_studied': entry.last_studied
+    }
+
+
+def dashboard_body(user_id, classes, sets, recent_study):
+    return {
+        'user_id': user_id,
+        'classes': classes,
+        'flashcard_sets': sets,
+        'card_count': sum(flashcard_set['card_count'] for flashcard_set in sets),
+        'recent_study': recent_study
+    }
@@ -0,0 +1,166 @@
+import asyncio
+import importlib
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import clear_url_caches
+
+from flashcards import cache
+from flashcards.benchmarks import isolated_database
+from flashcards.bulk import insert_flashcards
+from flashcards.models import Class, ClassMember, FlashcardSet
+
+MODES = ('wsgi', 'asgi-sync', 'asgi-async')
+
+
+def use_async_views(enabled):
+    """Rebuild the URLconf with every read route served by its sync or its async implementation"""
+    settings.FLASHCARDS_ASYNC_VIEWS = {'*'} if enabled else set()
+    import flashcards.urls
+    import studyhub.urls
+    importlib.reload(flashcards.urls)
+    importlib.reload(studyhub.urls)
+    clear_url_caches()
+
+
+class Command(BaseCommand):
+    help = ('Drive the read endpoints through the WSGI handler on a thread pool (like a threaded WSGI '
+            'server) and the ASGI handler on one event loop (like uvicorn), and compare p50/p99 and rps')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--concurrency', type=int, default=200, help='Requests kept in flight')
+        parser.add_argument('--threads', type=int, default=32, help='WSGI worker threads')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+
+    def handle(self, *args, **options):
+        rng = random.Random(16)
+        original = set(settings.FLASHCARDS_ASYNC_VIEWS)
+
+        with isolated_database():
+            paths = self.seed(options['users'], rng)
+            requests = [rng.choice(paths) for _ in range(options['requests'])]
+            self.stdout.write(f"{len(requests)} requests, {options['concurrency']} in flight, "
+                              f"{options['threads']} WSGI threads")
+            try:
+                for mode in options['modes']:
+                    use_async_views(mode == 'asgi-async')
+                    cache.get_cache().clear()
+                    if mode == 'wsgi':
+                        run = self.run_wsgi(requests, options['concurrency'], options['threads'])
+                    else:
+                        run = self.run_asgi(requests, options['concurrency'])
+                    latencies, elapsed, errors = asyncio.run(run)
+                    self.report(mode, latencies, elapsed, errors)
+            finally:
+                settings.FLASHCARDS_ASYNC_VIEWS = original
+                use_async_views(False)
+
+    def seed(self, user_count, rng):
+        users = User.objects.bulk_create([User(username=f'bench_asgi_{i}', password='!') for i in range(user_count)])
+        classes = Class.objects.bulk_create(
+            [Class(class_name=f'Class {i}', class_number=f'ASGI-{i}') for i in range(user_count // 10 + 1)]
+        )
+        ClassMember.objects.bulk_create([
+            ClassMember(user=user, class_obj=class_obj, role_in_class='Student')
+            for user in users for class_obj in rng.sample(classes, min(3, len(classes)))
+        ])
+        paths = ['/api/classes/?page_size=50']
+        for user in users[:50]:
+            flashcard_set = FlashcardSet.objects.create(class_obj=classes[0], name=f'{user.username} set', creator=user)
+            insert_flashcards(user.id, flashcard_set, [{'question': f'Q{i}', 'answer': f'A{i}'} for i in range(100)],
+                              collect_ids=False)
+            paths.append(f'/api/flashcards/set/?{urlencode({"set_id": flashcard_set.id, "page_size": 50})}')
+        for user in users:
+            query = urlencode({'username': user.username})
+            paths += [f'/api/flashcard-sets/?{query}', f'/api/user-classes/?{query}', f'/api/dashboard/?{query}']
+        return paths
+
+    async def run_clients(self, requests, concurrency, call):
+        queue = iter(requests)
+        latencies = []
+        errors = 0
+
+        async def client():
+            nonlocal errors
+            for path in queue:
+                start = time.perf_counter()
+                status = await call(path)
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return sorted(latencies), time.perf_counter() - start, errors
+
+    async def run_wsgi(self, requests, concurrency, threads):
+        handler = WSGIHandler()
+        factory = RequestFactory()
+        loop = asyncio.get_running_loop()
+
+        def call(path):
+            environ = factory.get(path, HTTP_HOST='localhost').environ
+            result = {}
+
+            def start_response(status, headers, exc_info=None):
+                result['status'] = int(status.split()[0])
+
+            body = handler(environ, start_response)
+            for _ in body:
+                pass
+            body.close()
+            return result['status']
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return await self.run_clients(requests, concurrency, lambda path: loop.run_in_executor(pool, call, path))
+
+    async def run_asgi(self, requests, concurrency):
+        handler = ASGIHandler()
+        never = asyncio.Event()
+
+        async def call(path):
+            route, _, query = path.partition('?')
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': route, 'raw_path': route.encode(), 'query_string': query.encode(),
+                'root_path': '', 'headers': [(b'host', b'localhost')],
+                'client': ('127.0.0.1', 50000), 'server': ('localhost', 80)
+            }
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+            result = {}
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # the client never disconnects early
+                await never.wait()
+
+            async def send(event):
+                if event['type'] == 'http.response.start':
+                    result['status'] = event['status']
+
+            await handler(scope, receive, send)
+            return result['status']
+
+        return await self.run_clients(requests, concurrency, call)
+
+    def report(self, mode, latencies, elapsed, errors):
+        if not latencies:
+            raise CommandError('No requests were made')
+        p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+        line = (f'  {mode:10} {len(latencies) / elapsed:>8,.0f} req/s   p50 {statistics.median(latencies) * 1000:7.1f} ms   '
+                f'p99 {p99 * 1000:7.1f} ms')
+        if errors:
+            line += f'   ({errors} non-200 responses)'
+        self.stdout.write(line)
@@ -0,0 +1,67 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+
+from flashcards.benchmarks import isolated_database
+
+PASSWORD = 'bench-auth-password-2024'
+USERNAME = 'bench_auth_user'
+SESSION_ENGINES = ('db', 'cached_db', 'signed_cookies')
+
+
+class Command(BaseCommand):
+    help = ('Log in once per session backend and with a bearer token, then report the queries and latency '
+            'of authenticated requests to a cached endpoint, which leaves only the cost of identifying the caller')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per mode')
+        parser.add_argument('--path', default='/api/flashcards/', help='GET endpoint to request')
+
+    def handle(self, *args, **options):
+        # cheap hashes: the logins are setup here, not what is measured
+        with isolated_database(), override_settings(FLASHCARDS_PASSWORD_ITERATIONS=1000,
+                                                    FLASHCARDS_PASSWORD_WORKERS=0):
+            User.objects.create(username=USERNAME, password=make_password(PASSWORD))
+            self.stdout.write(f"  {'mode':34} {'queries/request':>16} {'p50 ms':>8}")
+            for engine in SESSION_ENGINES:
+                with override_settings(SESSION_ENGINE=f'django.contrib.sessions.backends.{engine}'):
+                    client, _ = self.login()
+                    # how every view identified its caller before: a username parameter, next to the session
+                    self.report(f'{engine} session, ?username=', client, options, {'username': USERNAME})
+                    self.report(f'{engine} session', client, options, {})
+            _, token = self.login()
+            self.report('bearer token', Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {token}'),
+                        options, {})
+
+    def login(self):
+        client = Client(HTTP_HOST='localhost')
+        response = client.post('/api/login/', json.dumps({'username': USERNAME, 'password': PASSWORD}),
+                               content_type='application/json')
+        if response.status_code != 200:
+            raise CommandError(f'Login failed with status {response.status_code}')
+        return client, response.json()['token']
+
+    def report(self, label, client, options, params):
+        queries, timings = [], []
+
+        def count(execute, sql, sql_params, many, context):
+            queries[-1] += 1
+            return execute(sql, sql_params, many, context)
+
+        client.get(options['path'], params)  # fill the endpoint's cache
+        for _ in range(options['requests']):
+            queries.append(0)
+            with connection.execute_wrapper(count):
+                start = time.perf_counter()
+                response = client.get(options['path'], params)
+                timings.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise CommandError(f'{label}: status {response.status_code}')
+        self.stdout.write(f'  {label:34} {statistics.mean(queries):>16.1f} '
+                          f'{statistics.median(timings) * 1000:>8.2f}')
@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from flashcards.benchmarks import isolated_database, measure
+from flashcards.models import Flashcard
+from flashcards.views import bulk_create_flashcards, create_flashcard
+
+
+class Command(BaseCommand):
+    help = 'Compare importing a deck one card per request against the bulk create endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=500, help='Number of cards in the deck')
+
+    def handle(self, *args, **options):
+        count = options['cards']
+        factory = APIRequestFactory()
+        cards = [{'question': f'Question {i}', 'answer': f'Answer {i}'} for i in range(count)]
+
+        with isolated_database():
+            User.objects.create_user(username='bench_single', password='unused-password')
+            User.objects.create_user(username='bench_bulk', password='unused-password')
+
+            def per_card():
+                for card in cards:
+                    request = factory.post('/api/create-flashcard/', {'username': 'bench_single', **card}, format='json')
+                    create_flashcard(request)
+
+            def bulk():
+                request = factory.post('/api/create-flashcards/bulk/', {'username': 'bench_bulk', 'cards': cards}, format='json')
+                bulk_create_flashcards(request)
+
+            _, single_time, single_queries = measure(per_card)
+            _, bulk_time, bulk_queries = measure(bulk)
+
+            assert Flashcard.objects.filter(creator__username='bench_single').count() == count
+            assert Flashcard.objects.filter(creator__username='bench_bulk').count() == count
+
+        self.stdout.write(f'{count} cards')
+        self.stdout.write(f'  per-card: {single_time:.3f}s, {single_queries} queries, {count} requests')
+        self.stdout.write(f'  bulk:     {bulk_time:.3f}s, {bulk_queries} queries, 1 request')
+        if bulk_time:
+            self.stdout.write(self.style.SUCCESS(f'  speedup:  {single_time / bulk_time:.1f}x'))
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from flashcards import decks
+from flashcards.benchmarks import isolated_database
+from flashcards.bulk import insert_flashcards
+from flashcards.models import Class, Flashcard, FlashcardSet
+
+
+class Command(BaseCommand):
+    help = 'Measure deck import and export throughput (cards/sec) and peak memory for each file format'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=1000000)
+        parser.add_argument('--formats', nargs='+', choices=decks.FORMATS, default=list(decks.FORMATS))
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Report peak Python heap per phase with tracemalloc (slows both phases down)')
+
+    def handle(self, *args, **options):
+        count = options['cards']
+        trace = options['trace_memory']
+        self.stdout.write(f'{count} cards per file')
+
+        with isolated_database(), tempfile.TemporaryDirectory() as tmp:
+            user = User.objects.create(username='bench_decks', password='!')
+            class_obj = Class.objects.create(class_name='Deck bench', class_number='DECK-1')
+
+            source = FlashcardSet.objects.create(class_obj=class_obj, name='source', creator=user)
+            for offset in range(0, count, 10000):
+                Flashcard.objects.bulk_create([
+                    Flashcard(flashcard_set=source, class_obj=class_obj, creator=user,
+                              front_text=f'Question {i}, with "quotes"', back_text=f'Answer {i}\tline two')
+                    for i in range(offset, min(offset + 10000, count))
+                ])
+
+            for fmt in options['formats']:
+                path = os.path.join(tmp, f'deck.{fmt}')
+
+                def export():
+                    with open(path, 'w', newline='', encoding='utf-8') as f:
+                        for chunk in decks.export_deck(source.id, fmt):
+                            f.write(chunk)
+
+                target = FlashcardSet.objects.create(class_obj=class_obj, name=f'import {fmt}', creator=user)
+
+                def import_():
+                    with open(path, newline='', encoding='utf-8') as f:
+                        return insert_flashcards(user.id, target, decks.read_deck(f, fmt), collect_ids=False,
+                                                 max_errors=10)
+
+                _, export_time, export_peak = self.run_phase(export, trace)
+                result, import_time, import_peak = self.run_phase(import_, trace)
+                assert result['created'] == count and not result['invalid'], result
+
+                line = (f'  {fmt:5} export {count / export_time:>9,.0f} cards/s, '
+                        f'import {count / import_time:>9,.0f} cards/s ({os.path.getsize(path) / 1e6:.0f} MB file)')
+                if trace:
+                    line += f', peak heap export {export_peak / 1e6:.1f} MB / import {import_peak / 1e6:.1f} MB'
+                self.stdout.write(line)
+
+    def run_phase(self, func, trace):
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        peak = 0
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return result, elapsed, peak
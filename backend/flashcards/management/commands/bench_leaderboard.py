@@ -0,0 +1,68 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from flashcards import leaderboard
+from flashcards.benchmarks import isolated_database, measure
+from flashcards.models import Class, FlashcardSet, FlashcardSetLeaderboard
+
+
+class Command(BaseCommand):
+    help = 'Compare ORDER BY/COUNT(*) leaderboard queries with the incrementally maintained ranking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--participants', type=int, default=100000)
+        parser.add_argument('--lookups', type=int, default=200, help='Rank and top-k lookups per approach')
+        parser.add_argument('--updates', type=int, default=1000, help='Scores upserted in the batch submission')
+
+    def handle(self, *args, **options):
+        participants = options['participants']
+        lookups = options['lookups']
+        rng = random.Random(7)
+
+        with isolated_database():
+            class_obj = Class.objects.create(class_name='Bench', class_number='BENCH-1')
+            flashcard_set = FlashcardSet.objects.create(class_obj=class_obj, name='Bench set')
+            users = User.objects.bulk_create(
+                [User(username=f'bench_{i}', password='!') for i in range(participants)], batch_size=5000
+            )
+            FlashcardSetLeaderboard.objects.bulk_create(
+                [FlashcardSetLeaderboard(flashcard_set=flashcard_set, user=user, score=rng.randint(0, 100000))
+                 for user in users],
+                batch_size=5000
+            )
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            user_ids = [user.id for user in users]
+            sample = [rng.choice(user_ids) for _ in range(lookups)]
+
+            def naive():
+                rows = FlashcardSetLeaderboard.objects.filter(flashcard_set=flashcard_set)
+                for user_id in sample:
+                    list(rows.order_by('-score').values_list('user_id', 'score')[:10])
+                    score = rows.get(user_id=user_id).score
+                    rows.filter(score__gt=score).count()
+
+            def ranked():
+                for user_id in sample:
+                    leaderboard.top_scores(flashcard_set.id, 10)
+                    leaderboard.scores_around(flashcard_set.id, user_id, 2)
+
+            start = time.perf_counter()
+            leaderboard.get_ranking(flashcard_set.id)
+            load_time = time.perf_counter() - start
+
+            _, naive_time, naive_queries = measure(naive)
+            _, ranked_time, ranked_queries = measure(ranked)
+
+            updates = {rng.choice(user_ids): rng.randint(0, 100000) for _ in range(options['updates'])}
+            _, submit_time, submit_queries = measure(leaderboard.submit_scores, flashcard_set.id, updates)
+
+        self.stdout.write(f'{participants} participants, {lookups} top-10 + rank lookups')
+        self.stdout.write(f'  initial load:       {load_time * 1000:.1f} ms')
+        self.stdout.write(f'  ORDER BY + COUNT:   {naive_time / lookups * 1000:.3f} ms/lookup, {naive_queries} queries')
+        self.stdout.write(f'  ranking structure:  {ranked_time / lookups * 1000:.3f} ms/lookup, {ranked_queries} queries')
+        self.stdout.write(f'  batch submit ({len(updates)} scores): {submit_time * 1000:.1f} ms, {submit_queries} queries')
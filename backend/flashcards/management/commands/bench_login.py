@@ -0,0 +1,101 @@
+import json
+import os
+import statistics
+import threading
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from flashcards import passwords
+from flashcards.benchmarks import isolated_database
+
+PASSWORD = 'storm-password-2024'
+PROBE_TOKEN = 'bench-probe-token'
+
+
+def percentile(timings, fraction):
+    return timings[max(int(len(timings) * fraction) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = ('Log in from many concurrent clients with passwords hashed on the request threads and in the '
+            'process pool, reporting logins/sec per core and how a cheap endpoint fares meanwhile')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=16, help='Concurrent login threads')
+        parser.add_argument('--logins', type=int, default=64, help='Logins per mode')
+        parser.add_argument('--iterations', type=int, help='PBKDF2 cost (default: FLASHCARDS_PASSWORD_ITERATIONS)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Pool processes')
+
+    def handle(self, *args, **options):
+        cores = os.cpu_count() or 1
+        modes = {'request threads': 0, f'pool of {options["workers"]}': options['workers']}
+        with isolated_database(), override_settings(FLASHCARDS_PASSWORD_ITERATIONS=options['iterations'],
+                                                    SESSION_ENGINE='django.contrib.sessions.backends.cache',
+                                                    FLASHCARDS_METRICS_TOKEN=PROBE_TOKEN):
+            password_hash = make_password(PASSWORD)
+            User.objects.bulk_create([User(username=f'storm_{i}', password=password_hash)
+                                      for i in range(options['clients'])])
+            for label, workers in modes.items():
+                with override_settings(FLASHCARDS_PASSWORD_WORKERS=workers):
+                    if workers:
+                        passwords.check_password(PASSWORD, User.objects.first().password)  # start the pool
+                    result = self.storm(options['clients'], options['logins'])
+                self.report(label, result, cores if not workers else min(workers, cores))
+
+    def storm(self, clients, logins):
+        login_times, probe_times, failures = [], [], []
+        remaining = iter(range(logins))
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def login(n):
+            client = Client(HTTP_HOST='localhost')
+            while True:
+                with lock:
+                    i = next(remaining, None)
+                if i is None:
+                    break
+                start = time.perf_counter()
+                response = client.post('/api/login/', json.dumps({'username': f'storm_{n}', 'password': PASSWORD}),
+                                       content_type='application/json')
+                elapsed = time.perf_counter() - start
+                with lock:
+                    (login_times if response.status_code == 200 else failures).append(elapsed)
+            connection.close()
+
+        def probe():
+            client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {PROBE_TOKEN}')
+            while not done.is_set():
+                start = time.perf_counter()
+                client.get('/api/cache-stats/')
+                probe_times.append(time.perf_counter() - start)
+                time.sleep(0.01)
+
+        threads = [threading.Thread(target=login, args=(n,)) for n in range(clients)]
+        prober = threading.Thread(target=probe)
+        start = time.perf_counter()
+        prober.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        done.set()
+        prober.join()
+        return elapsed, sorted(login_times), sorted(probe_times), len(failures)
+
+    def report(self, label, result, cores_used):
+        elapsed, login_times, probe_times, failures = result
+        rate = len(login_times) / elapsed
+        self.stdout.write(
+            f'{label}: {rate:.1f} logins/s ({rate / cores_used:.1f} per core), '
+            f'login p50 {statistics.median(login_times) * 1000:.0f} ms, p99 {percentile(login_times, 0.99) * 1000:.0f} ms; '
+            f'other requests meanwhile p50 {statistics.median(probe_times) * 1000:.1f} ms, '
+            f'p99 {percentile(probe_times, 0.99) * 1000:.1f} ms'
+            + (f'; {failures} failed' if failures else '')
+        )
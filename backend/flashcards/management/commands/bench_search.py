@@ -0,0 +1,76 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from flashcards.benchmarks import isolated_database
+from flashcards.datagen import VOCABULARY
+from flashcards.models import Class, Flashcard, FlashcardSet
+from flashcards.search import search_flashcards
+
+
+class Command(BaseCommand):
+    help = 'Measure full-text search latency against an icontains scan at a given card count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=5000000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--skip-scan', action='store_true', help='Do not time the icontains baseline')
+
+    def handle(self, *args, **options):
+        cards = options['cards']
+        rng = random.Random(11)
+
+        def sentence(words):
+            return ' '.join(rng.choice(VOCABULARY) for _ in range(words))
+
+        with isolated_database():
+            user = User.objects.create(username='bench_search', password='!')
+            classes = Class.objects.bulk_create(
+                [Class(class_name=f'Class {i}', class_number=f'C-{i}') for i in range(50)]
+            )
+            sets = FlashcardSet.objects.bulk_create(
+                [FlashcardSet(class_obj=classes[i % 50], name=f'Set {i}', creator=user) for i in range(500)]
+            )
+
+            start = time.perf_counter()
+            for offset in range(0, cards, 10000):
+                batch = []
+                for i in range(offset, min(offset + 10000, cards)):
+                    flashcard_set = sets[i % len(sets)]
+                    front = sentence(6)
+                    if i % 1000 == 0:
+                        # rare terms, so lookups that match a handful of cards are measured too
+                        front += f' needle{i // 1000 % 100}'
+                    batch.append(Flashcard(flashcard_set=flashcard_set, class_obj_id=flashcard_set.class_obj_id,
+                                           creator=user, front_text=front, back_text=sentence(12)))
+                Flashcard.objects.bulk_create(batch)
+            self.stdout.write(f'Seeded {cards} cards (including index maintenance) in {time.perf_counter() - start:.1f}s')
+
+            common = [rng.choice(VOCABULARY) for _ in range(options['queries'])]
+            rare = [f'needle{rng.randrange(100)}' for _ in range(options['queries'])]
+            results = {'common term': self.time_searches(common), 'rare term': self.time_searches(rare)}
+
+            if not options['skip_scan']:
+                scans = []
+                for term in rare[:5]:
+                    start = time.perf_counter()
+                    list(Flashcard.objects.filter(Q(front_text__icontains=term) | Q(back_text__icontains=term))
+                         .values('id')[:20])
+                    scans.append(time.perf_counter() - start)
+                results['rare term, icontains scan'] = sorted(scans)
+
+        for label, timings in results.items():
+            self.stdout.write(f'  {label}: p50 {statistics.median(timings) * 1000:.1f} ms, '
+                              f'p99 {timings[max(int(len(timings) * 0.99) - 1, 0)] * 1000:.1f} ms')
+
+    def time_searches(self, terms):
+        timings = []
+        for term in terms:
+            start = time.perf_counter()
+            search_flashcards(term, limit=20)
+            timings.append(time.perf_counter() - start)
+        return sorted(timings)
@@ -0,0 +1,237 @@
+import io
+import json
+import platform
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from flashcards import avatars, cache, datagen
+from flashcards.benchmarks import isolated_database
+from flashcards.models import ClassMember, Flashcard, FlashcardSet, FlashcardSetLeaderboard, UserProfile
+from flashcards.urls import urlpatterns
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+SLOW_REPEAT = 3  # endpoints that hash a password
+METRICS_TOKEN = 'bench-metrics-token'
+
+
+def photo(i):
+    """A distinct 1024x768 JPEG per i, so every upload is new content"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (1024, 768), ((i * 37) % 256, (i * 91) % 256, 120)).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class Fixture:
+    """Ids and names from the generated data that the endpoint cases refer to"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.usernames = list(User.objects.filter(username__startswith=f'{prefix}_user_')
+                              .order_by('id').values_list('username', flat=True)[:200])
+        self.username = self.usernames[0]
+        flashcard_set = FlashcardSet.objects.filter(creator__username=self.username).order_by('id').first()
+        self.set_id = flashcard_set.id
+        self.class_id = ClassMember.objects.filter(user__username=self.username).order_by('id') \
+            .values_list('class_obj_id', flat=True).first()
+        self.card_ids = list(Flashcard.objects.filter(flashcard_set_id=self.set_id).order_by('id')
+                             .values_list('id', flat=True)[:100])
+        self.card_id = self.card_ids[0]
+        self.ranked_username = FlashcardSetLeaderboard.objects.filter(flashcard_set_id=self.set_id) \
+            .values_list('user__username', flat=True).first()
+
+        user_id = User.objects.get(username=self.username).id
+        name, content_hash = avatars.save_original(SimpleUploadedFile('avatar.jpg', photo(-1)))
+        UserProfile.objects.create(user_id=user_id, profile_picture=name)
+        avatars.process(user_id, name, content_hash)
+        self.url_kwargs = {'avatar_thumbnail': {'name': avatars.thumbnail_name(content_hash, 64, 'webp')}}
+        scraper = {'HTTP_AUTHORIZATION': f'Bearer {METRICS_TOKEN}'}
+        self.headers = {'cache_stats': scraper, 'metrics': scraper}
+
+    def upload_data(self, i):
+        # the previous upload's thumbnail job writes to the database; let it finish outside the timed request
+        avatars.drain()
+        return {'username': self.username, 'file': SimpleUploadedFile('photo.jpg', photo(i))}
+
+    def cases(self):
+        """url name -> (method, data for iteration i, repeat override or None)"""
+        user = {'username': self.username}
+        deck = '\n'.join(['question,answer'] + [f'Imported question {n},Imported answer {n}' for n in range(100)])
+        return {
+            'register': ('post', lambda i: {'username': f'{self.prefix}_new_{i}', 'email': f'{self.prefix}_new_{i}@example.com',
+                                            'password': 'a-Long-enough-password-42'}, SLOW_REPEAT),
+            'login': ('post', lambda i: {**user, 'password': datagen.DEFAULT_PASSWORD}, SLOW_REPEAT),
+            'get_flashcards': ('get', lambda i: user, None),
+            'create_flashcard': ('post', lambda i: {**user, 'set_id': self.set_id, 'question': f'Q {i}',
+                                                    'answer': f'A {i}'}, None),
+            'bulk_create_flashcards': ('post', lambda i: {**user, 'set_id': self.set_id, 'cards': [
+                {'question': f'Bulk {i} {n}', 'answer': 'Answer'} for n in range(50)]}, None),
+            'get_user_classes': ('get', lambda i: user, None),
+            'list_classes': ('get', lambda i: {'page_size': 50}, None),
+            'class_members': ('get', lambda i: {'class_id': self.class_id}, None),
+            'class_catalog': ('get', lambda i: {'q': datagen.SUBJECTS[i % len(datagen.SUBJECTS)][:4]}, None),
+            'join_class': ('post', lambda i: {'username': self.usernames[i % len(self.usernames)],
+                                              'class_id': self.class_id}, None),
+            'import_roster': ('post', lambda i: {'class_id': self.class_id, 'users': self.usernames}, None),
+            'create_class': ('post', lambda i: {**user, 'class_name': f'Bench class {i}',
+                                                'class_number': f'BENCH-{i}'}, None),
+            'dashboard': ('get', lambda i: user, None),
+            'get_flashcard_sets': ('get', lambda i: user, None),
+            'get_flashcards_in_set': ('get', lambda i: {'set_id': self.set_id}, None),
+            'search_flashcards': ('get', lambda i: {'q': datagen.VOCABULARY[i % len(datagen.VOCABULARY)]}, None),
+            'similar_flashcards': ('get', lambda i: {'card_id': self.card_id}, None),
+            'import_deck': ('upload', lambda i: {**user, 'set_id': self.set_id,
+                                                 'file': SimpleUploadedFile('deck.csv', deck.encode())}, None),
+            'export_deck': ('get', lambda i: {'set_id': self.set_id}, None),
+            'create_flashcard_set': ('post', lambda i: {**user, 'name': f'Bench set {i}'}, None),
+            'cache_stats': ('get', lambda i: {}, None),
+            'get_due_cards': ('get', lambda i: user, None),
+            'submit_reviews': ('post', lambda i: {**user, 'reviews': [
+                {'card_id': self.card_ids[i % len(self.card_ids)], 'quality': 4}]}, None),
+            'leaderboard_top': ('get', lambda i: {'set_id': self.set_id}, None),
+            'leaderboard_rank': ('get', lambda i: {'set_id': self.set_id, 'username': self.ranked_username}, None),
+            'submit_scores': ('post', lambda i: {'set_id': self.set_id,
+                                                 'scores': [{'username': self.username, 'score': i}]}, None),
+            'study_heartbeat': ('post', lambda i: {**user, 'set_id': self.set_id, 'seconds': 30}, None),
+            'board_history': ('get', lambda i: {**user, 'class_id': self.class_id}, None),
+            'upload_profile_picture': ('upload', self.upload_data, None),
+            'avatar_thumbnail': ('get', lambda i: {}, None),
+            'metrics': ('get', lambda i: {}, None),
+        }
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every endpoint in flashcards/urls.py on generated data of increasing size, and fail '
+            'when query counts or latency regress against a stored baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=datagen.SCALES, default=['tiny', 'small'])
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per endpoint per size')
+        parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+        parser.add_argument('--queries-only', action='store_true',
+                            help='Only compare query counts (latency baselines do not carry across machines)')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed relative p50 slowdown before it counts as a regression')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help='Ignore p50 slowdowns smaller than this, which are mostly noise')
+
+    def handle(self, *args, **options):
+        names = [pattern.name for pattern in urlpatterns]
+        results = {}
+        for size in options['sizes']:
+            # heartbeats stay buffered, so the flusher thread does not write in the middle of timed requests
+            with isolated_database(), tempfile.TemporaryDirectory() as media, \
+                    override_settings(MEDIA_ROOT=media, FLASHCARDS_STUDY_TIME_FLUSH_INTERVAL=3600,
+                                      FLASHCARDS_METRICS_TOKEN=METRICS_TOKEN):
+                generated = datagen.generate(scale=size, prefix='bench', seed=18)
+                self.stdout.write(f"{size}: {generated['counts']['cards']} cards, "
+                                  f"{generated['counts']['users']} users (generated in {generated['elapsed']:.1f}s)")
+                fixture = Fixture('bench')
+                cases = fixture.cases()
+                missing = [name for name in names if name not in cases]
+                if missing:
+                    raise CommandError(f'No benchmark case for: {", ".join(missing)}')
+                cache.get_cache().clear()
+                results[size] = {
+                    name: self.run_case(reverse(name, kwargs=fixture.url_kwargs.get(name)), *cases[name],
+                                        options['repeat'], fixture.headers.get(name, {}))
+                    for name in names
+                }
+                avatars.drain()
+            self.print_size(results[size])
+
+        failures = [f'{size}/{name}: status {result["status"]}'
+                    for size, by_name in results.items() for name, result in by_name.items()
+                    if result['status'] >= 400]
+        if failures:
+            raise CommandError('Endpoints failed during the run:\n  ' + '\n  '.join(failures))
+
+        if options['save_baseline']:
+            self.save_baseline(options['baseline'], results)
+            return
+        if options['baseline'].exists():
+            self.compare(json.loads(options['baseline'].read_text()), results, options)
+        else:
+            self.stdout.write(f"No baseline at {options['baseline']}; run with --save-baseline to create one")
+
+    def run_case(self, path, method, make_data, repeat, default_repeat, headers):
+        client = Client(HTTP_HOST='localhost', **headers)
+        timings = []
+        queries = []
+        status = 200
+
+        def count(execute, sql, params, many, context):
+            queries[-1] += 1
+            return execute(sql, params, many, context)
+
+        for i in range(repeat or default_repeat):
+            data = make_data(i)
+            queries.append(0)
+            with connection.execute_wrapper(count):
+                start = time.perf_counter()
+                if method == 'get':
+                    response = client.get(path, data)
+                elif method == 'upload':
+                    response = client.post(path, data)
+                else:
+                    response = client.post(path, json.dumps(data), content_type='application/json')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append(time.perf_counter() - start)
+            status = max(status, response.status_code)
+
+        timings.sort()
+        return {
+            'p50_ms': round(statistics.median(timings) * 1000, 3),
+            'p95_ms': round(timings[max(int(len(timings) * 0.95) - 1, 0)] * 1000, 3),
+            'p99_ms': round(timings[max(int(len(timings) * 0.99) - 1, 0)] * 1000, 3),
+            'queries': max(queries),
+            'status': status,
+        }
+
+    def print_size(self, by_name):
+        self.stdout.write(f"  {'endpoint':26} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+        for name, result in by_name.items():
+            self.stdout.write(f"  {name:26} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                              f"{result['p99_ms']:>9.2f} {result['queries']:>8}")
+
+    def save_baseline(self, path, results):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        baseline = {
+            'environment': {'database': connection.vendor, 'python': platform.python_version(),
+                            'machine': platform.machine()},
+            'results': {size: {name: {key: value for key, value in result.items() if key != 'status'}
+                               for name, result in by_name.items()}
+                        for size, by_name in results.items()},
+        }
+        path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+        self.stdout.write(self.style.SUCCESS(f'Saved baseline to {path}'))
+
+    def compare(self, baseline, results, options):
+        regressions = []
+        for size, by_name in results.items():
+            for name, result in by_name.items():
+                base = baseline['results'].get(size, {}).get(name)
+                if base is None:
+                    continue
+                if result['queries'] > base['queries']:
+                    regressions.append(f"{size}/{name}: {result['queries']} queries (baseline {base['queries']})")
+                if options['queries_only']:
+                    continue
+                slower = result['p50_ms'] - base['p50_ms']
+                if result['p50_ms'] > base['p50_ms'] * (1 + options['tolerance']) and slower > options['min_delta_ms']:
+                    regressions.append(f"{size}/{name}: p50 {result['p50_ms']:.2f} ms (baseline {base['p50_ms']:.2f} ms)")
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,31 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from flashcards import avatars
+from flashcards.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Create thumbnails for profile pictures uploaded before they were generated on upload'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        done = missing = failed = 0
+        profiles = UserProfile.objects.filter(avatar_hash='').exclude(profile_picture='') \
+            .exclude(profile_picture__isnull=True).values_list('user_id', 'profile_picture')
+        for user_id, name in profiles.iterator():
+            path = Path(settings.MEDIA_ROOT) / name
+            if not path.exists():
+                missing += 1
+                continue
+            try:
+                avatars.process(user_id, name, avatars.hash_file(path))
+                done += 1
+            except Exception as e:
+                self.stderr.write(f'{name}: {e}')
+                failed += 1
+        self.stdout.write(f'Thumbnailed {done} pictures in {time.perf_counter() - start:.1f}s '
+                          f'({missing} originals missing, {failed} failed)')
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards import dedup
+from flashcards.models import Class, Flashcard
+
+
+class Command(BaseCommand):
+    help = 'Report (or merge) clusters of near-duplicate flashcards in a class'
+
+    def add_arguments(self, parser):
+        parser.add_argument('class_id', type=int)
+        parser.add_argument('--threshold', type=float, default=dedup.DEFAULT_THRESHOLD,
+                            help='Estimated Jaccard similarity at which two cards count as duplicates')
+        parser.add_argument('--merge', action='store_true',
+                            help='Delete the cards of each cluster that are duplicates of its oldest card')
+        parser.add_argument('--show', type=int, default=20, help='Number of clusters to print')
+
+    def handle(self, *args, **options):
+        class_id = options['class_id']
+        if not Class.objects.filter(id=class_id).exists():
+            raise CommandError(f'Class {class_id} does not exist')
+        if not 0 < options['threshold'] <= 1:
+            raise CommandError('--threshold must be in (0, 1]')
+
+        start = time.perf_counter()
+        indexed = dedup.index_class(class_id)
+        clusters = dedup.duplicate_clusters(class_id, threshold=options['threshold'])
+        elapsed = time.perf_counter() - start
+
+        duplicates = sum(len(members) - 1 for members in clusters)
+        self.stdout.write(f'Indexed {indexed} new cards; found {len(clusters)} clusters '
+                          f'({duplicates} duplicate cards) in {elapsed:.2f}s')
+
+        shown = clusters[:options['show']]
+        fronts = Flashcard.objects.in_bulk([members[0] for members in shown])
+        for members in shown:
+            self.stdout.write(f'  {fronts[members[0]].front_text[:60]!r}: cards {members}')
+
+        if options['merge'] and clusters:
+            deleted = dedup.merge_clusters(clusters, threshold=options['threshold'])
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} duplicate cards'))
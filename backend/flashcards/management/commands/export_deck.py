@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards import decks
+from flashcards.models import FlashcardSet
+
+
+class Command(BaseCommand):
+    help = 'Export a flashcard set as CSV, Anki-style TSV or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('set_id', type=int)
+        parser.add_argument('path', nargs='?', default='-', help='Output file, or - for stdout')
+        parser.add_argument('--format', dest='fmt', choices=decks.FORMATS,
+                            help='File format (guessed from the extension when omitted, else csv)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['fmt'] or (decks.guess_format(path) if path != '-' else None) or 'csv'
+        if not FlashcardSet.objects.filter(id=options['set_id']).exists():
+            raise CommandError(f'Flashcard set {options["set_id"]} does not exist')
+
+        chunks = decks.export_deck(options['set_id'], fmt)
+        if path == '-':
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(chunk)
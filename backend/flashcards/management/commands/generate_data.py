@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from flashcards import datagen
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with synthetic users, classes, sets, cards, messages and leaderboard rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=datagen.SCALES, default='tiny')
+        parser.add_argument('--prefix', default='synthetic', help='Username and class number prefix')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default=datagen.DEFAULT_PASSWORD, help='Password of every generated user')
+        for name in datagen.SCALES['tiny']:
+            parser.add_argument(f'--{name.replace("_", "-")}', type=int, help='Override the scale preset')
+
+    def handle(self, *args, **options):
+        overrides = {name: options[name] for name in datagen.SCALES['tiny']}
+        with transaction.atomic():
+            result = datagen.generate(
+                scale=options['scale'], prefix=options['prefix'], seed=options['seed'],
+                batch_size=options['batch_size'], password=options['password'],
+                progress=lambda message: self.stdout.write(f'  {message}'), **overrides
+            )
+        counts = ', '.join(f'{count} {name}' for name, count in result['counts'].items())
+        self.stdout.write(self.style.SUCCESS(f"Generated {counts} in {result['elapsed']:.1f}s"))
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards import decks
+from flashcards.bulk import insert_flashcards
+from flashcards.models import FlashcardSet
+
+
+class Command(BaseCommand):
+    help = 'Import a CSV, Anki-style TSV or JSONL deck file into a flashcard set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('set_id', type=int)
+        parser.add_argument('--username', help='Card creator (defaults to the set creator)')
+        parser.add_argument('--format', dest='fmt', choices=decks.FORMATS,
+                            help='File format (guessed from the extension when omitted)')
+        parser.add_argument('--chunk-size', type=int, default=settings.FLASHCARDS_IMPORT_CHUNK_SIZE,
+                            help='Cards per bulk_create')
+
+    def handle(self, *args, **options):
+        fmt = options['fmt'] or decks.guess_format(options['path'])
+        if fmt is None:
+            raise CommandError('Could not tell the file format from its name; pass --format')
+
+        try:
+            flashcard_set = FlashcardSet.objects.get(id=options['set_id'])
+        except FlashcardSet.DoesNotExist:
+            raise CommandError(f'Flashcard set {options["set_id"]} does not exist')
+
+        user_id = flashcard_set.creator_id
+        if options['username']:
+            user_id = User.objects.filter(username=options['username']).values_list('id', flat=True).first()
+            if user_id is None:
+                raise CommandError(f'User {options["username"]} does not exist')
+
+        with open(options['path'], newline='', encoding='utf-8-sig') as f:
+            result = insert_flashcards(user_id, flashcard_set, decks.read_deck(f, fmt),
+                                       chunk_size=options['chunk_size'], collect_ids=False, max_errors=20)
+
+        for error in result['errors']:
+            self.stderr.write(f'  line {error.get("line", "?")}: {error["error"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result["created"]} cards into set {flashcard_set.id}; skipped {result["invalid"]} invalid rows'
+        ))
@@ -0,0 +1,44 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards import roster
+
+
+class Command(BaseCommand):
+    help = ('Enroll the users of a CSV roster (username or email, optional role; a "user,role" header row '
+            'is skipped) into a class in one transaction')
+
+    def add_arguments(self, parser):
+        parser.add_argument('class_id', type=int)
+        parser.add_argument('path')
+        parser.add_argument('--default-role', choices=roster.ROLES, default=roster.DEFAULT_ROLE,
+                            help='Role for rows that do not name one')
+
+    def handle(self, *args, **options):
+        entries = []
+        with open(options['path'], newline='', encoding='utf-8-sig') as f:
+            for row in csv.reader(f):
+                if not row or not row[0].strip():
+                    continue
+                user = row[0].strip()
+                role = row[1].strip() if len(row) > 1 else ''
+                if not entries and (user.lower(), role.lower()) in (('user', 'role'), ('user', '')):
+                    continue
+                entries.append({'user': user, 'role': role} if role else user)
+
+        try:
+            result = roster.import_roster(options['class_id'], entries, options['default_role'])
+        except roster.ClassNotFound:
+            raise CommandError(f'Class {options["class_id"]} does not exist')
+
+        for error in result['invalid']:
+            self.stderr.write(f'  row {error["index"] + 1}: {error["error"]}')
+        for identifier in result['missing']:
+            self.stderr.write(f'  no such user: {identifier}')
+        for email in result['ambiguous']:
+            self.stderr.write(f'  several users share {email}; enroll them by username')
+        self.stdout.write(self.style.SUCCESS(
+            f'Enrolled {result["enrolled"]} users in class {options["class_id"]}; {result["already_members"]} were '
+            f'already members, {len(result["missing"])} not found'
+        ))
@@ -0,0 +1,220 @@
+import asyncio
+import base64
+import json
+import os
+import statistics
+import struct
+import time
+from contextlib import contextmanager
+from urllib.parse import quote, urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from flashcards import realtime
+from flashcards.authentication import issue_token
+from flashcards.benchmarks import isolated_database
+from flashcards.models import Class, ClassMember
+
+PREFIX = 'loadtest_board'
+
+
+class BoardClient:
+    """One board connection; records when each load-test message arrives, by message number"""
+
+    def __init__(self, class_id, token, expected):
+        self.path = f'/ws/classes/{class_id}/board/'
+        self.query = f'token={quote(token)}'
+        self.expected = expected
+        self.received = {}  # message number -> arrival time
+        self.done = asyncio.Event()
+
+    def on_text(self, text):
+        data = json.loads(text)
+        if data.get('type') == 'message' and data['message'].startswith('load '):
+            self.received[int(data['message'][5:])] = time.perf_counter()
+            if len(self.received) >= self.expected:
+                self.done.set()
+
+
+class InProcessClient(BoardClient):
+    """Calls realtime.board_socket directly, as an ASGI server would, with no server or network in between"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.inbox = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.rejected = False
+        self.task = None
+
+    async def connect(self):
+        scope = {'type': 'websocket', 'path': self.path, 'query_string': self.query.encode(), 'headers': []}
+        self.inbox.put_nowait({'type': 'websocket.connect'})
+        self.task = asyncio.create_task(realtime.board_socket(scope, self.inbox.get, self.send))
+        await self.accepted.wait()
+        return not self.rejected
+
+    async def send(self, event):
+        if event['type'] == 'websocket.accept':
+            self.accepted.set()
+        elif event['type'] == 'websocket.close':
+            self.rejected = True
+            self.accepted.set()
+        elif event['type'] == 'websocket.send':
+            self.on_text(event['text'])
+
+    async def post(self, text):
+        self.inbox.put_nowait({'type': 'websocket.receive', 'text': json.dumps({'message': text})})
+
+    async def close(self):
+        self.inbox.put_nowait({'type': 'websocket.disconnect'})
+        await self.task
+
+
+class NetworkClient(BoardClient):
+    """A minimal RFC 6455 client over a TCP connection to a running ASGI server"""
+
+    def __init__(self, url, *args):
+        super().__init__(*args)
+        self.url = urlsplit(url)
+        self.reader = self.writer = self.task = None
+
+    async def connect(self):
+        host, port = self.url.hostname, self.url.port or 80
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.writer.write((f'GET {self.path}?{self.query} HTTP/1.1\r\nHost: {host}:{port}\r\n'
+                           f'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                           f'Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n').encode())
+        response = await self.reader.readuntil(b'\r\n\r\n')
+        if not response.startswith(b'HTTP/1.1 101'):
+            self.writer.close()
+            return False
+        self.task = asyncio.create_task(self.read())
+        return True
+
+    async def read(self):
+        while True:
+            try:
+                opcode, payload = await self.read_frame()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            if opcode == 0x1:
+                self.on_text(payload.decode())
+            elif opcode == 0x8:
+                return
+            elif opcode == 0x9:
+                self.write_frame(0xA, payload)
+
+    async def read_frame(self):
+        first, second = await self.reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length, = struct.unpack('!H', await self.reader.readexactly(2))
+        elif length == 127:
+            length, = struct.unpack('!Q', await self.reader.readexactly(8))
+        # servers do not mask their frames
+        return first & 0x0F, await self.reader.readexactly(length)
+
+    def write_frame(self, opcode, payload):
+        # clients must mask every frame
+        mask = os.urandom(4)
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, 0x80 | length)
+        elif length < 1 << 16:
+            header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, length)
+        self.writer.write(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+
+    async def post(self, text):
+        self.write_frame(0x1, json.dumps({'message': text}).encode())
+        await self.writer.drain()
+
+    async def close(self):
+        if self.writer is None or self.writer.is_closing():
+            return
+        self.write_frame(0x8, struct.pack('!H', 1000))
+        await self.writer.drain()
+        if self.task is not None:
+            await asyncio.wait([self.task], timeout=5)
+        self.writer.close()
+
+
+@contextmanager
+def seeded_board(sockets):
+    """A class with sockets members; deleted afterwards, since a server's database is a real one"""
+    Class.objects.filter(class_number=PREFIX).delete()
+    User.objects.filter(username__startswith=f'{PREFIX}_').delete()
+    class_obj = Class.objects.create(class_name='Board load test', class_number=PREFIX)
+    User.objects.bulk_create([User(username=f'{PREFIX}_{i}', password='!') for i in range(sockets)], batch_size=5000)
+    users = list(User.objects.filter(username__startswith=f'{PREFIX}_').order_by('id'))
+    ClassMember.objects.bulk_create(
+        [ClassMember(user=user, class_obj=class_obj, role_in_class='Student') for user in users], batch_size=5000
+    )
+    try:
+        yield class_obj.id, [issue_token(user) for user in users]
+    finally:
+        class_obj.delete()
+        User.objects.filter(username__startswith=f'{PREFIX}_').delete()
+
+
+class Command(BaseCommand):
+    help = ('Open many board WebSockets to a running ASGI server (e.g. "uvicorn studyhub.asgi:application" '
+            'on this database) and measure the latency from posting each message to its delivery')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='ws://127.0.0.1:8000', help='Base URL of the ASGI server')
+        parser.add_argument('--sockets', type=int, default=5000)
+        parser.add_argument('--messages', type=int, default=10)
+        parser.add_argument('--in-process', action='store_true',
+                            help='Call the ASGI application directly in a throwaway database instead, which '
+                                 'leaves out the server, the network and WebSocket framing')
+
+    def handle(self, *args, **options):
+        sockets, messages = options['sockets'], options['messages']
+        if options['in_process']:
+            with isolated_database(), seeded_board(sockets) as (class_id, tokens):
+                clients = [InProcessClient(class_id, token, messages) for token in tokens]
+                results = asyncio.run(self.run(clients, messages))
+            where = 'in process'
+        else:
+            with seeded_board(sockets) as (class_id, tokens):
+                clients = [NetworkClient(options['url'], class_id, token, messages) for token in tokens]
+                results = asyncio.run(self.run(clients, messages))
+            where = options['url']
+
+        connect_time, fanout_time, latencies = results
+        self.stdout.write(f'{sockets} sockets ({where}), {messages} messages')
+        self.stdout.write(f'  connect + backfill: {connect_time:.2f}s')
+        self.stdout.write(f'  fan-out complete:   {fanout_time:.2f}s ({len(latencies)} deliveries)')
+        self.stdout.write(f'  delivery latency:   p50 {statistics.median(latencies) * 1000:.1f} ms, '
+                          f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms')
+
+    async def run(self, clients, messages):
+        start = time.perf_counter()
+        try:
+            accepted = await asyncio.gather(*(client.connect() for client in clients))
+        except OSError as e:
+            raise CommandError(f'Could not connect: {e}')
+        connect_time = time.perf_counter() - start
+        if not all(accepted):
+            await asyncio.gather(*(client.close() for client in clients))
+            raise CommandError(f'{accepted.count(False)} sockets were rejected')
+
+        sent_at = {}
+        start = time.perf_counter()
+        for i in range(messages):
+            sent_at[i] = time.perf_counter()
+            await clients[i % len(clients)].post(f'load {i}')
+        try:
+            await asyncio.wait_for(asyncio.gather(*(client.done.wait() for client in clients)), timeout=120)
+        finally:
+            fanout_time = time.perf_counter() - start
+            await asyncio.gather(*(client.close() for client in clients))
+
+        # each delivery against the time its own message was posted
+        latencies = sorted(arrival - sent_at[number] for client in clients
+                           for number, arrival in client.received.items())
+        return connect_time, fanout_time, latencies
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from flashcards import counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute FlashcardSet.card_count and Class.member_count from the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows have drifted')
+        parser.add_argument('--batch-size', type=int, default=counters.RECONCILE_BATCH_SIZE,
+                            help='Rows checked per UPDATE')
+
+    def handle(self, *args, **options):
+        verb = 'would fix' if options['dry_run'] else 'fixed'
+        for label, reconcile in (('card_count', counters.reconcile_card_counts),
+                                 ('member_count', counters.reconcile_member_counts)):
+            start = time.perf_counter()
+            drifted = reconcile(batch_size=options['batch_size'], dry_run=options['dry_run'])
+            self.stdout.write(f'{label}: {verb} {drifted} rows in {time.perf_counter() - start:.2f}s')
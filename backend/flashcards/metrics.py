@@ -0,0 +1,165 @@
+"""
+In-process request metrics, exported in the Prometheus text format at /metrics.
+
+RequestMetricsMiddleware (flashcards.middleware) records one observation per request into the
+histograms below, labelled by URL name. Each worker process keeps its own numbers; Prometheus sums
+them when it scrapes every worker. Only staff users, and scrapers sending
+"Authorization: Bearer <FLASHCARDS_METRICS_TOKEN>" when that is set, may read them.
+"""
+import bisect
+import hmac
+import threading
+from collections import defaultdict
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+MAX_LOGGED_STATEMENTS = 50
+# any other method is counted as "other", so clients cannot add label values
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+# Stats for the request being handled in this context; copied into sync_to_async threads by asgiref
+current_request = ContextVar('flashcards_request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self, keep_sql=False):
+        self.queries = 0
+        self.db_time = 0.0
+        self.keep_sql = keep_sql
+        self.statements = []
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper: time every statement run on behalf of a measured request"""
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = perf_counter() - start
+        stats.queries += 1
+        stats.db_time += elapsed
+        if stats.keep_sql and len(stats.statements) < MAX_LOGGED_STATEMENTS:
+            stats.statements.append((elapsed, sql))
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """connection_created receiver, so every connection (in any thread) reports to current_request"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # label value -> [per-bucket counts..., +Inf count], sum
+        self._counts = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self._sums = defaultdict(float)
+
+    def observe(self, label, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[label][index] += 1
+            self._sums[label] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = [(label, list(counts), self._sums[label]) for label, counts in sorted(self._counts.items())]
+        for label, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{view="{label}",le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{label}"}} {_number(total)}')
+            lines.append(f'{self.name}_count{{view="{label}"}} {cumulative}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+            self._sums.clear()
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values = defaultdict(int)
+
+    def inc(self, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for key, value in snapshot:
+            labels = ','.join(f'{name}="{label}"' for name, label in key)
+            lines.append(f'{self.name}{{{labels}}} {value}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+request_duration = Histogram('flashcards_request_duration_seconds',
+                             'Wall time until the response was returned, or a streamed body was drained',
+                             DURATION_BUCKETS)
+request_queries = Histogram('flashcards_request_queries', 'Database queries per request', QUERY_BUCKETS)
+request_db_time = Histogram('flashcards_request_db_seconds', 'Time spent in database calls per request',
+                            DURATION_BUCKETS)
+response_size = Histogram('flashcards_response_size_bytes', 'Response body size', SIZE_BUCKETS)
+requests_total = Counter('flashcards_requests_total', 'Requests by view, method and status')
+
+METRICS = (request_duration, request_queries, request_db_time, response_size, requests_total)
+
+
+def render():
+    return '\n'.join(line for metric in METRICS for line in metric.render()) + '\n'
+
+
+def reset():
+    for metric in METRICS:
+        metric.clear()
+
+
+def method_label(method):
+    return method if method in METHODS else 'other'
+
+
+def can_scrape(request):
+    """Whether the request may read /metrics or the cache stats: a staff user, or the metrics token"""
+    token = settings.FLASHCARDS_METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '').encode()
+    if token and hmac.compare_digest(header, f'Bearer {token}'.encode()):
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+def metrics_view(request):
+    if not can_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
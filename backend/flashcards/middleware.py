@@ -0,0 +1,174 @@
+import logging
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import cache, metrics, routers
+from .authentication import token_caller
+
+logger = logging.getLogger('flashcards.requests')
+
+
+class RequestMetricsMiddleware:
+    """
+    Time each request, count its queries and database time, and measure the response body, recording
+    all of it in flashcards.metrics under the request's URL name. Requests over
+    FLASHCARDS_QUERY_BUDGET queries or FLASHCARDS_LATENCY_BUDGET_MS are logged with their SQL.
+    Goes first in MIDDLEWARE so the rest of the stack is included in the timing.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        self.finish(request, response, stats, start)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        self.finish(request, response, stats, start)
+        return response
+
+    def start(self):
+        keep_sql = settings.FLASHCARDS_QUERY_BUDGET is not None or settings.FLASHCARDS_LATENCY_BUDGET_MS is not None
+        stats = metrics.RequestStats(keep_sql=keep_sql)
+        return stats, metrics.current_request.set(stats), perf_counter()
+
+    def finish(self, request, response, stats, start):
+        if response.streaming:
+            self.observe_when_drained(request, response, stats, start)
+        else:
+            self.observe(request, response, stats, start, len(response.content))
+
+    def observe(self, request, response, stats, start, size):
+        elapsed = perf_counter() - start
+        match = request.resolver_match
+        # unmatched paths share one label so scanners cannot blow up the label set
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+
+        metrics.request_duration.observe(view, elapsed)
+        metrics.request_queries.observe(view, stats.queries)
+        metrics.request_db_time.observe(view, stats.db_time)
+        metrics.requests_total.inc(view=view, method=metrics.method_label(request.method), status=response.status_code)
+        metrics.response_size.observe(view, size)
+
+        self.check_budget(request, view, elapsed, stats)
+
+    def observe_when_drained(self, request, response, stats, start):
+        # A streamed body runs its queries (e.g. an export's .iterator() chunks) and is sized only while the
+        # server drains it, after __call__ has returned, so the request's stats are current again meanwhile.
+        # Restoring the previous value rather than resetting a token works in whichever context iterates.
+        content = response.streaming_content
+        if response.is_async:
+            async def counted():
+                size = 0
+                previous = metrics.current_request.get()
+                metrics.current_request.set(stats)
+                try:
+                    async for chunk in content:
+                        size += len(chunk)
+                        yield chunk
+                finally:
+                    metrics.current_request.set(previous)
+                    self.observe(request, response, stats, start, size)
+        else:
+            def counted():
+                size = 0
+                previous = metrics.current_request.get()
+                metrics.current_request.set(stats)
+                try:
+                    for chunk in content:
+                        size += len(chunk)
+                        yield chunk
+                finally:
+                    metrics.current_request.set(previous)
+                    self.observe(request, response, stats, start, size)
+        response.streaming_content = counted()
+
+    def check_budget(self, request, view, elapsed, stats):
+        query_budget = settings.FLASHCARDS_QUERY_BUDGET
+        latency_budget = settings.FLASHCARDS_LATENCY_BUDGET_MS
+        over_queries = query_budget is not None and stats.queries > query_budget
+        over_latency = latency_budget is not None and elapsed * 1000 > latency_budget
+        if not over_queries and not over_latency:
+            return
+        statements = '\n'.join(f'  {duration * 1000:.2f} ms  {sql}' for duration, sql in stats.statements)
+        if stats.queries > len(stats.statements):
+            statements += f'\n  ... {stats.queries - len(stats.statements)} more'
+        logger.warning(
+            '%s %s (%s) over budget: %.1f ms, %d queries, %.1f ms in the database\n%s',
+            request.method, request.get_full_path(), view, elapsed * 1000, stats.queries, stats.db_time * 1000,
+            statements
+        )
+
+
+class ReplicaMiddleware:
+    """
+    Sets read_only for safe requests, and pins a user to the primary for a while after they write.
+    The pin is a cache entry keyed by the user of the request's bearer token, so it holds for a
+    cross-origin client that sends no cookies; it is shared across processes only with a shared cache.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        key = self.pin_key(request)
+        replica = self.reads_from_replica(request) and (key is None or cache.get_cache().get(key) is None)
+        token = routers.read_only.set(replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.read_only.reset(token)
+        if key is not None and self.pins(request):
+            cache.get_cache().set(key, 1, settings.FLASHCARDS_REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        key = self.pin_key(request)
+        replica = self.reads_from_replica(request) and (key is None or await cache.get_cache().aget(key) is None)
+        token = routers.read_only.set(replica)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.read_only.reset(token)
+        if key is not None and self.pins(request):
+            await cache.get_cache().aset(key, 1, settings.FLASHCARDS_REPLICA_PIN_SECONDS)
+        return response
+
+    def reads_from_replica(self, request):
+        return bool(settings.FLASHCARDS_READ_REPLICAS) and request.method in routers.SAFE_METHODS
+
+    def pins(self, request):
+        return request.method not in routers.SAFE_METHODS and settings.FLASHCARDS_REPLICA_PIN_SECONDS > 0
+
+    def pin_key(self, request):
+        """Cache key of the token user's pin, or None when there are no replicas or no valid token"""
+        if not settings.FLASHCARDS_READ_REPLICAS:
+            return None
+        caller = token_caller(request)
+        return cache.make_key(routers.PIN_KIND, caller[0]) if caller else None
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='class',
+            index=models.Index(fields=['class_name'], name='class_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flashcard',
+            index=models.Index(fields=['flashcard_set', 'id'], name='flashcard_set_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flashcard',
+            index=models.Index(fields=['creator', 'id'], name='flashcard_creator_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flashcardset',
+            index=models.Index(fields=['creator', 'created_at'], name='fcset_creator_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flashcardsetleaderboard',
+            index=models.Index(fields=['flashcard_set', '-score', 'user'], name='leaderboard_set_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['board', 'timestamp'], name='message_board_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userwarning',
+            index=models.Index(fields=['user', 'resolved'], name='userwarning_user_resolved_idx'),
+        ),
+    ]
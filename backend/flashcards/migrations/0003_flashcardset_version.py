@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0002_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flashcardset',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0003_flashcardset_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardReviewState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ease', models.FloatField(default=2.5)),
+                ('interval', models.PositiveIntegerField(default=0)),
+                ('repetitions', models.PositiveIntegerField(default=0)),
+                ('due_at', models.DateTimeField()),
+                ('last_reviewed', models.DateTimeField(blank=True, null=True)),
+                ('flashcard', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='flashcards.flashcard')),
+                ('flashcard_set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='flashcards.flashcardset')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'due_at'], name='review_user_due_idx'), models.Index(fields=['user', 'flashcard_set', 'due_at'], name='review_user_set_due_idx')],
+                'unique_together': {('user', 'flashcard')},
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE flashcards_flashcard_fts USING fts5("
+    "front_text, back_text, content='flashcards_flashcard', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER flashcards_flashcard_fts_ai AFTER INSERT ON flashcards_flashcard BEGIN "
+    "INSERT INTO flashcards_flashcard_fts(rowid, front_text, back_text) VALUES (new.id, new.front_text, new.back_text); "
+    "END",
+    "CREATE TRIGGER flashcards_flashcard_fts_ad AFTER DELETE ON flashcards_flashcard BEGIN "
+    "INSERT INTO flashcards_flashcard_fts(flashcards_flashcard_fts, rowid, front_text, back_text) "
+    "VALUES ('delete', old.id, old.front_text, old.back_text); "
+    "END",
+    "CREATE TRIGGER flashcards_flashcard_fts_au AFTER UPDATE OF front_text, back_text ON flashcards_flashcard BEGIN "
+    "INSERT INTO flashcards_flashcard_fts(flashcards_flashcard_fts, rowid, front_text, back_text) "
+    "VALUES ('delete', old.id, old.front_text, old.back_text); "
+    "INSERT INTO flashcards_flashcard_fts(rowid, front_text, back_text) VALUES (new.id, new.front_text, new.back_text); "
+    "END",
+    "INSERT INTO flashcards_flashcard_fts(flashcards_flashcard_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS flashcards_flashcard_fts_au",
+    "DROP TRIGGER IF EXISTS flashcards_flashcard_fts_ad",
+    "DROP TRIGGER IF EXISTS flashcards_flashcard_fts_ai",
+    "DROP TABLE IF EXISTS flashcards_flashcard_fts",
+]
+
+# Must match the expression flashcards.search queries with, or the planner cannot use it
+POSTGRES_FORWARD = [
+    "CREATE INDEX flashcard_search_idx ON flashcards_flashcard "
+    "USING GIN (to_tsvector('english', front_text || ' ' || back_text))",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS flashcard_search_idx",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0005_message_history_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0006_flashcard_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlashcardSignature',
+            fields=[
+                ('flashcard', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='minhash', serialize=False, to='flashcards.flashcard')),
+                ('signature', models.BinaryField()),
+                ('class_obj', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='flashcards.class')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LSHBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('class_obj', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='flashcards.class')),
+                ('flashcard', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='flashcards.flashcard')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['class_obj', 'band', 'bucket'], name='lsh_class_band_bucket_idx')],
+            },
+        ),
+    ]
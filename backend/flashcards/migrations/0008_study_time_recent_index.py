@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0007_minhash_lsh'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flashcardsetstudytime',
+            index=models.Index(fields=['user', '-last_studied'], name='studytime_user_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:25
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, fk):
+    rows = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def backfill(apps, schema_editor):
+    Class = apps.get_model('flashcards', 'Class')
+    ClassMember = apps.get_model('flashcards', 'ClassMember')
+    Flashcard = apps.get_model('flashcards', 'Flashcard')
+    FlashcardSet = apps.get_model('flashcards', 'FlashcardSet')
+    Class.objects.update(member_count=count_of(ClassMember, 'class_obj'))
+    FlashcardSet.objects.update(card_count=count_of(Flashcard, 'flashcard_set'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0008_study_time_recent_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='class',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='flashcardset',
+            name='card_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0009_denormalized_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_hash',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+# Must match what flashcards.catalog's icontains filters compile to, UPPER("column"::text) LIKE UPPER(%s),
+# or the planner cannot use them. pg_trgm is a trusted extension, so the database owner can create it.
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX class_name_trgm_idx ON flashcards_class USING GIN (UPPER(class_name::text) gin_trgm_ops) "
+    "WHERE NOT is_personal",
+    "CREATE INDEX class_number_trgm_idx ON flashcards_class USING GIN (UPPER(class_number::text) gin_trgm_ops) "
+    "WHERE NOT is_personal",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS class_number_trgm_idx",
+    "DROP INDEX IF EXISTS class_name_trgm_idx",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return apply
+
+
+def mark_personal(apps, schema_editor):
+    # the default classes create_flashcard / create_flashcard_set have been creating
+    Class = apps.get_model('flashcards', 'Class')
+    Class.objects.filter(class_number__startswith='DEFAULT-', class_name__endswith="'s Flashcards").update(
+        is_personal=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0010_profile_avatar_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='class',
+            name='is_personal',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_personal, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='class',
+            index=models.Index(condition=models.Q(('is_personal', False)), fields=['id'], name='class_catalog_idx'),
+        ),
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_FORWARD}),
+            run({'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,141 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:59
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+CLASS_SUFFIX = "'s Flashcards"
+SET_SUFFIX = "'s Default Set"
+BATCH_SIZE = 1000
+
+
+def move_per_user(model, field, keep, duplicates, combine=None):
+    """
+    Re-point rows that are unique per (field, user) from the duplicates to keep. A user who already has a
+    row on keep keeps that one, updated by combine(kept_row, row) -> changed field names; the row left on
+    the duplicate goes with it when the duplicate is deleted.
+    """
+    kept = {row.user_id: row for row in model.objects.filter(**{field: keep})}
+    for row in model.objects.filter(**{f'{field}__in': duplicates}).order_by('id'):
+        if row.user_id not in kept:
+            model.objects.filter(id=row.id).update(**{field: keep})
+            kept[row.user_id] = row
+        elif combine:
+            target = kept[row.user_id]
+            changed = combine(target, row)
+            model.objects.filter(id=target.id).update(**{name: getattr(target, name) for name in changed})
+
+
+def merge_classes(apps, keep, duplicates):
+    ClassMember = apps.get_model('flashcards', 'ClassMember')
+    MessageBoard = apps.get_model('flashcards', 'MessageBoard')
+    Message = apps.get_model('flashcards', 'Message')
+    Class = apps.get_model('flashcards', 'Class')
+
+    for name in ('FlashcardSet', 'Flashcard', 'FlashcardSignature', 'LSHBucket'):
+        apps.get_model('flashcards', name).objects.filter(class_obj_id__in=duplicates).update(class_obj_id=keep)
+    move_per_user(ClassMember, 'class_obj_id', keep, duplicates)
+
+    boards = list(MessageBoard.objects.filter(class_obj_id__in=[keep, *duplicates]).order_by('id'))
+    if boards:
+        board = next((b for b in boards if b.class_obj_id == keep), boards[0])
+        others = [b.id for b in boards if b.id != board.id]
+        Message.objects.filter(board_id__in=others).update(board_id=board.id)
+        MessageBoard.objects.filter(id__in=others).delete()
+        MessageBoard.objects.filter(id=board.id).update(class_obj_id=keep)
+
+    Class.objects.filter(id__in=duplicates).delete()
+    Class.objects.filter(id=keep).update(member_count=ClassMember.objects.filter(class_obj_id=keep).count())
+
+
+def merge_sets(apps, keep, duplicates):
+    FlashcardSet = apps.get_model('flashcards', 'FlashcardSet')
+    Flashcard = apps.get_model('flashcards', 'Flashcard')
+
+    def best_score(kept, row):
+        kept.score = max(kept.score, row.score)
+        return ['score']
+
+    def total_time(kept, row):
+        kept.time_spent += row.time_spent
+        kept.last_studied = max(kept.last_studied, row.last_studied)
+        return ['time_spent', 'last_studied']
+
+    Flashcard.objects.filter(flashcard_set_id__in=duplicates).update(flashcard_set_id=keep)
+    apps.get_model('flashcards', 'CardReviewState').objects.filter(flashcard_set_id__in=duplicates) \
+        .update(flashcard_set_id=keep)
+    move_per_user(apps.get_model('flashcards', 'FlashcardSetLeaderboard'), 'flashcard_set_id', keep, duplicates,
+                  best_score)
+    move_per_user(apps.get_model('flashcards', 'FlashcardSetStudyTime'), 'flashcard_set_id', keep, duplicates,
+                  total_time)
+
+    FlashcardSet.objects.filter(id__in=duplicates).delete()
+    FlashcardSet.objects.filter(id=keep).update(card_count=Flashcard.objects.filter(flashcard_set_id=keep).count(),
+                                                version=F('version') + 1)
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Fold the duplicate "<username>'s Flashcards" classes that racing get_or_create calls left behind into
+    each user's oldest one, and the duplicate default sets in it into the oldest set, then point
+    Class.personal_owner and FlashcardSet.default_owner at the user.
+    """
+    User = apps.get_model('auth', 'User')
+    Class = apps.get_model('flashcards', 'Class')
+    FlashcardSet = apps.get_model('flashcards', 'FlashcardSet')
+
+    classes_by_name = defaultdict(list)
+    personal = Class.objects.filter(is_personal=True, class_name__endswith=CLASS_SUFFIX).order_by('id')
+    for class_id, class_name in personal.values_list('id', 'class_name').iterator(chunk_size=BATCH_SIZE):
+        classes_by_name[class_name[:-len(CLASS_SUFFIX)]].append(class_id)
+
+    usernames = list(classes_by_name)
+    for start in range(0, len(usernames), BATCH_SIZE):
+        users = User.objects.filter(username__in=usernames[start:start + BATCH_SIZE]).values_list('id', 'username')
+        owned_classes, owned_sets = [], []
+        for user_id, username in users:
+            keep, *duplicates = classes_by_name[username]
+            if duplicates:
+                merge_classes(apps, keep, duplicates)
+            owned_classes.append(Class(id=keep, personal_owner_id=user_id))
+
+            sets = list(FlashcardSet.objects.filter(class_obj_id=keep, creator_id=user_id,
+                                                    name=f'{username}{SET_SUFFIX}')
+                        .order_by('id').values_list('id', flat=True))
+            if sets:
+                keep_set, *duplicate_sets = sets
+                if duplicate_sets:
+                    merge_sets(apps, keep_set, duplicate_sets)
+                owned_sets.append(FlashcardSet(id=keep_set, default_owner_id=user_id))
+        Class.objects.bulk_update(owned_classes, ['personal_owner'])
+        FlashcardSet.objects.bulk_update(owned_sets, ['default_owner'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0011_class_catalog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='class',
+            name='personal_owner',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='personal_class', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='flashcardset',
+            name='default_owner',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='default_flashcard_set', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        # the default class is found through personal_owner now, not by name
+        migrations.RemoveIndex(
+            model_name='class',
+            name='class_name_idx',
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:12
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# SQLite adds these columns by copying flashcards_flashcard into a new table, which drops the triggers
+# that keep the full-text index of migration 0006 in sync; recreate them and rebuild the index
+search_index = import_module('flashcards.migrations.0006_flashcard_search_index')
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in search_index.SQLITE_REVERSE[:-1] + search_index.SQLITE_FORWARD[1:]:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0012_default_provisioning'),
+    ]
+
+    operations = [
+        # on reverse, after the column is removed again
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='classmember',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='flashcard',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:22
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_buckets(apps, schema_editor):
+    """Concurrent index_class runs could store a card's bucket twice; keep the first copy"""
+    LSHBucket = apps.get_model('flashcards', 'LSHBucket')
+    repeated = LSHBucket.objects.values('class_obj', 'band', 'bucket', 'flashcard') \
+        .annotate(first_id=Min('id'), copies=Count('id')).filter(copies__gt=1)
+    for row in repeated.iterator():
+        LSHBucket.objects.filter(class_obj=row['class_obj'], band=row['band'], bucket=row['bucket'],
+                                 flashcard=row['flashcard']).exclude(id=row['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0013_etag_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_buckets, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='lshbucket',
+            name='lsh_class_band_bucket_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='lshbucket',
+            constraint=models.UniqueConstraint(fields=('class_obj', 'band', 'bucket', 'flashcard'), name='lsh_bucket_card_unique'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:28
+
+from django.db import migrations, models
+
+
+def create_classes_version(apps, schema_editor):
+    ListVersion = apps.get_model('flashcards', 'ListVersion')
+    ListVersion.objects.using(schema_editor.connection.alias).create(name='classes')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0014_lsh_bucket_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_classes_version, migrations.RunPython.noop),
+    ]
@@ -6,6 +6,8 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     global_role = models.CharField(max_length=50, blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True, null=True)
+    # content hash of the picture whose thumbnails are ready (see flashcards.avatars); empty until then
+    avatar_hash = models.CharField(max_length=32, blank=True, default='')
     
     def __str__(self):
         return self.user.username
@@ -27,6 +29,19 @@ class FlashcardSet(models.Model):
     creator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # bumped on every card write so clients can revalidate the set's cards by ETag
+    version = models.PositiveIntegerField(default=0)
+    # kept in step with the set's Flashcard rows by flashcards.counters; see reconcile_counts
+    card_count = models.PositiveIntegerField(default=0)
+    # set only on the user's default set (see flashcards.provisioning); unique, so there is one per user
+    default_owner = models.OneToOneField(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                         related_name='default_flashcard_set')
+
+    class Meta:
+        indexes = [
+            # get_flashcard_sets: a user's sets in creation order
+            models.Index(fields=["creator", "created_at"], name="fcset_creator_created_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.class_obj.class_name})"
@@ -39,6 +54,15 @@ class Flashcard(models.Model):
 
     front_text = models.TextField()
     back_text = models.TextField()
+    # part of the ETag of a user's cards, so an edited card is revalidated (see flashcards.etags)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # keyset pages of a set's cards and of a user's cards, both ordered by id
+            models.Index(fields=["flashcard_set", "id"], name="flashcard_set_id_idx"),
+            models.Index(fields=["creator", "id"], name="flashcard_creator_id_idx"),
+        ]
 
     def __str__(self):
         return f"Flashcard {self.id} in set {self.flashcard_set.name}"
@@ -51,6 +75,10 @@ class FlashcardSetLeaderboard(models.Model):
 
     class Meta:
         unique_together = ("flashcard_set", "user")
+        indexes = [
+            # top scores of a set; user is a trailing key so rankings can be read from the index alone
+            models.Index(fields=["flashcard_set", "-score", "user"], name="leaderboard_set_score_idx"),
+        ]
 
 class FlashcardSetStudyTime(models.Model):
     flashcard_set = models.ForeignKey(FlashcardSet, on_delete=models.CASCADE)
@@ -60,15 +88,43 @@ class FlashcardSetStudyTime(models.Model):
 
     class Meta:
         unique_together = ("flashcard_set", "user")
+        indexes = [
+            # most recently studied sets of a user, for the dashboard
+            models.Index(fields=["user", "-last_studied"], name="studytime_user_recent_idx"),
+        ]
 
 class Class(models.Model):
     class_name = models.CharField(max_length=100)
     class_number = models.CharField(max_length=20)
     description = models.TextField(blank=True)
+    # kept in step with the class's ClassMember rows by flashcards.counters; see reconcile_counts
+    member_count = models.PositiveIntegerField(default=0)
+    # a user's auto-created "<username>'s Flashcards" class, which the catalog leaves out
+    is_personal = models.BooleanField(default=False)
+    # set only on the user's default class (see flashcards.provisioning); unique, so there is one per user
+    personal_owner = models.OneToOneField(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                          related_name='personal_class')
+
+    class Meta:
+        indexes = [
+            # catalog pages: id seeks over shared classes only; search indexes are in migration 0011
+            models.Index(fields=["id"], condition=models.Q(is_personal=False), name="class_catalog_idx"),
+        ]
 
     def __str__(self):
         return f"{self.class_name} ({self.class_number})"
 
+class ListVersion(models.Model):
+    """
+    Version of a listing that spans a whole table, such as every class with its member_count, so its ETag
+    reads one row instead of aggregating the table. Bumped by flashcards.counters.bump_list_version
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
 class ClassMember(models.Model):
     ROLE_CHOICES = (
         ("Leader", "Leader"),
@@ -79,6 +135,8 @@ class ClassMember(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     class_obj = models.ForeignKey(Class, on_delete=models.CASCADE)
     role_in_class = models.CharField(max_length=20, choices=ROLE_CHOICES)
+    # part of the ETag of a user's classes; also touched when the class itself is edited
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("user", "class_obj")  # one entry per user per class
@@ -99,6 +157,12 @@ class Message(models.Model):
     message_text = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # board history in time order; id breaks ties for keyset seeks
+            models.Index(fields=["board", "timestamp", "id"], name="message_board_ts_id_idx"),
+        ]
+
     def __str__(self):
         return f"{self.user.username} at {self.timestamp}"
 
@@ -108,5 +172,76 @@ class UserWarning(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     resolved = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # open warnings for a user
+            models.Index(fields=["user", "resolved"], name="userwarning_user_resolved_idx"),
+        ]
+
     def __str__(self):
         return f"Warning for {self.user.username}: {self.reason}"
+
+class CardReviewState(models.Model):
+    """Spaced-repetition (SM-2) state of one flashcard for one user"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    flashcard = models.ForeignKey(Flashcard, on_delete=models.CASCADE)
+    # copied from the card so a set's due queue can be read from one index
+    flashcard_set = models.ForeignKey(FlashcardSet, on_delete=models.CASCADE)
+
+    ease = models.FloatField(default=2.5)
+    interval = models.PositiveIntegerField(default=0)  # days
+    repetitions = models.PositiveIntegerField(default=0)
+    due_at = models.DateTimeField()
+    last_reviewed = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("user", "flashcard")
+        indexes = [
+            # next due cards for a user, overall and within one set
+            models.Index(fields=["user", "due_at"], name="review_user_due_idx"),
+            models.Index(fields=["user", "flashcard_set", "due_at"], name="review_user_set_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - card {self.flashcard_id} due {self.due_at}"
+
+class NewCardMark(models.Model):
+    """
+    How far a user has worked through their new cards, by card id: every card in the scope up to
+    last_card_id has a CardReviewState, so due_cards looks for unseen cards after it
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # 0 for the cards the user created, otherwise the id of the flashcard set
+    scope = models.PositiveBigIntegerField(default=0)
+    last_card_id = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("user", "scope")
+
+    def __str__(self):
+        return f"{self.user.username} - scope {self.scope} past card {self.last_card_id}"
+
+class FlashcardSignature(models.Model):
+    """MinHash signature of a card's text, used for near-duplicate detection within its class"""
+    flashcard = models.OneToOneField(Flashcard, on_delete=models.CASCADE, primary_key=True, related_name="minhash")
+    class_obj = models.ForeignKey(Class, on_delete=models.CASCADE)
+    signature = models.BinaryField()
+
+    def __str__(self):
+        return f"Signature of flashcard {self.flashcard_id}"
+
+class LSHBucket(models.Model):
+    """One LSH band of a card's signature; cards sharing a bucket in any band are duplicate candidates"""
+    class_obj = models.ForeignKey(Class, on_delete=models.CASCADE)
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+    flashcard = models.ForeignKey(Flashcard, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            # also the index that candidate lookups use; a bucket holds many cards, so the card is part of it
+            models.UniqueConstraint(fields=["class_obj", "band", "bucket", "flashcard"], name="lsh_bucket_card_unique"),
+        ]
+
+    def __str__(self):
+        return f"Flashcard {self.flashcard_id} band {self.band}"
@@ -0,0 +1,169 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache import acached, cached
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    """Pack keyset values into an opaque, URL-safe cursor string"""
+    raw = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Reverse of encode_cursor. Raises PaginationError for anything that was not produced by it"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise PaginationError('Invalid cursor')
+    if not isinstance(values, dict):
+        raise PaginationError('Invalid cursor')
+    return values
+
+
+def query_params(request):
+    """GET params of a DRF Request or a plain HttpRequest (the async views get the latter)"""
+    return getattr(request, 'query_params', request.GET)
+
+
+def get_page_size(request):
+    page_size = query_params(request).get('page_size')
+    if page_size is None:
+        return settings.FLASHCARDS_PAGE_SIZE
+    try:
+        page_size = int(page_size)
+    except ValueError:
+        raise PaginationError('page_size must be an integer')
+    if page_size < 1:
+        raise PaginationError('page_size must be positive')
+    return min(page_size, settings.FLASHCARDS_MAX_PAGE_SIZE)
+
+
+def next_link(request, cursor, param='cursor', drop=None):
+    params = query_params(request).copy()
+    params[param] = cursor
+    if drop:
+        params.pop(drop, None)
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+def _page_query(request, queryset):
+    page_size = get_page_size(request)
+    cursor = query_params(request).get('cursor')
+
+    queryset = queryset.order_by('id')
+    if cursor:
+        last_id = decode_cursor(cursor).get('id')
+        if not isinstance(last_id, int):
+            raise PaginationError('Invalid cursor')
+        queryset = queryset.filter(id__gt=last_id)
+    return queryset[:page_size + 1], page_size
+
+
+def _page(request, rows, page_size):
+    next_url = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_url = next_link(request, encode_cursor({'id': rows[-1]['id']}))
+    return {'results': rows, 'next': next_url}
+
+
+def keyset_page(request, queryset, cache_key=None, cache_timeout=None):
+    """
+    Return one page of a .values() queryset keyed on id, plus a link to the next page.
+    Each page is a single "WHERE id > last ORDER BY id LIMIT n" seek regardless of depth.
+    With cache_key, a (kind, ident) pair naming the queryset, the page's rows are read through the cache.
+    """
+    queryset, page_size = _page_query(request, queryset)
+    if cache_key:
+        kind, ident = cache_key
+        cursor = query_params(request).get('cursor', '')
+        rows = cached(kind, f'{ident}:{cursor}:{page_size}', lambda: list(queryset), cache_timeout)
+    else:
+        rows = list(queryset)
+    return _page(request, rows, page_size)
+
+
+async def akeyset_page(request, queryset):
+    queryset, page_size = _page_query(request, queryset)
+    return _page(request, [row async for row in queryset], page_size)
+
+
+def stream_ndjson(rows):
+    """Stream an iterable of dicts as newline-delimited JSON"""
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    return StreamingHttpResponse(
+        (encoder.encode(row) + '\n' for row in rows),
+        content_type='application/x-ndjson'
+    )
+
+
+def astream_ndjson(rows):
+    """stream_ndjson for an async iterable, such as QuerySet.aiterator()"""
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+    async def lines():
+        async for row in rows:
+            yield encoder.encode(row) + '\n'
+
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+
+def list_response(request, queryset, cache_key=None):
+    """
+    Render a .values() queryset for a listing endpoint.
+    ?stream=1 streams every row as NDJSON via .iterator(), ?cursor / ?page_size return a keyset page,
+    and with neither the full list is returned as before, read through the cache when cache_key
+    is a (kind, ident) pair.
+    """
+    if request.query_params.get('stream') in ('1', 'true'):
+        rows = queryset.order_by('id').iterator(chunk_size=settings.FLASHCARDS_STREAM_CHUNK_SIZE)
+        return stream_ndjson(rows)
+
+    if 'cursor' in request.query_params or 'page_size' in request.query_params:
+        try:
+            return Response(keyset_page(request, queryset), status=status.HTTP_200_OK)
+        except PaginationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if cache_key:
+        return Response(cached(*cache_key, lambda: list(queryset)), status=status.HTTP_200_OK)
+    return Response(list(queryset), status=status.HTTP_200_OK)
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    """JsonResponse that encodes values the way DRF's Response does, for the async views"""
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+
+async def alist_response(request, queryset, cache_key=None):
+    """list_response for the async views"""
+    params = query_params(request)
+    if params.get('stream') in ('1', 'true'):
+        return astream_ndjson(queryset.order_by('id').aiterator(chunk_size=settings.FLASHCARDS_STREAM_CHUNK_SIZE))
+
+    if 'cursor' in params or 'page_size' in params:
+        try:
+            return json_response(await akeyset_page(request, queryset))
+        except PaginationError as e:
+            return json_response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    async def load():
+        return [row async for row in queryset]
+
+    if cache_key:
+        return json_response(await acached(*cache_key, load))
+    return json_response(await load())
@@ -0,0 +1,105 @@
+"""
+Password hashing off the request threads.
+
+PBKDF2 hashes are computed in a process pool of FLASHCARDS_PASSWORD_WORKERS processes, so a login storm
+queues on a fixed number of cores instead of running one hash per request thread at once. At most
+FLASHCARDS_PASSWORD_MAX_PENDING hashes may be queued or running; past that, callers wait up to
+FLASHCARDS_PASSWORD_QUEUE_TIMEOUT seconds and then get PasswordPoolBusy. Other algorithms, and
+FLASHCARDS_PASSWORD_WORKERS=0, hash inline.
+
+This module must stay importable without django.setup(), since the pool processes import it.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.crypto import constant_time_compare
+
+_lock = threading.Lock()
+_pool = None
+_pool_config = None
+_pending = None
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """Django's PBKDF2-SHA256 with the cost from FLASHCARDS_PASSWORD_ITERATIONS; hashes at another cost
+    are upgraded on the next successful login"""
+
+    @property
+    def iterations(self):
+        return settings.FLASHCARDS_PASSWORD_ITERATIONS or hashers.PBKDF2PasswordHasher.iterations
+
+
+def _pbkdf2(password, salt, iterations):
+    # runs in a pool process
+    return hashers.PBKDF2PasswordHasher().encode(password, salt, iterations)
+
+
+def worker_count():
+    workers = settings.FLASHCARDS_PASSWORD_WORKERS
+    return (os.cpu_count() or 1) if workers is None else workers
+
+
+def _get_pool():
+    global _pool, _pool_config, _pending
+    workers = worker_count()
+    config = (workers, settings.FLASHCARDS_PASSWORD_MAX_PENDING or workers * 4)
+    with _lock:
+        if _pool_config != config:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn, not fork: the server process has threads (and open connections) a fork would copy
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_config = config
+            _pending = threading.BoundedSemaphore(config[1])
+        return _pool, _pending
+
+
+def _hash(password, salt, iterations):
+    if not worker_count():
+        return _pbkdf2(password, salt, iterations)
+    pool, pending = _get_pool()
+    if not pending.acquire(timeout=settings.FLASHCARDS_PASSWORD_QUEUE_TIMEOUT):
+        raise PasswordPoolBusy('Too many password checks in progress')
+    try:
+        return pool.submit(_pbkdf2, password, salt, iterations).result()
+    finally:
+        pending.release()
+
+
+def _pooled(hasher):
+    return hasher.algorithm == PBKDF2PasswordHasher.algorithm
+
+
+def make_password(password):
+    """hashers.make_password with the default hasher, computed in the pool when it is PBKDF2-SHA256"""
+    hasher = hashers.get_hasher()
+    if not _pooled(hasher):
+        return hashers.make_password(password)
+    return _hash(password, hasher.salt(), hasher.iterations)
+
+
+def check_password(password, encoded):
+    """Return (valid, must_update) like hashers.check_password, hashing in the pool where possible"""
+    if password is None or not hashers.is_password_usable(encoded):
+        return False, False
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False, False
+
+    preferred = hashers.get_hasher()
+    if _pooled(hasher):
+        decoded = hasher.decode(encoded)
+        valid = constant_time_compare(_hash(password, decoded['salt'], decoded['iterations']), encoded)
+    else:
+        valid = hasher.verify(password, encoded)
+    must_update = hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+    return valid, valid and must_update
@@ -0,0 +1,65 @@
+"""
+Each user's personal default class and default flashcard set.
+
+Class.personal_owner and FlashcardSet.default_owner point at the user they belong to and are unique, so
+there is at most one of each per user however many first requests race. register creates both; for
+users without them, default_set() inserts whichever is missing with INSERT ... ON CONFLICT (owner)
+DO UPDATE, which returns the row's id whether this request or a concurrent one inserted it. The
+(set id, class id) pair is cached per user, so adding a card to the default set normally costs no
+query to find it.
+"""
+from .cache import cached_on_commit, invalidate
+from .counters import CLASSES, bump_list_version
+from .models import Class, FlashcardSet
+
+
+def _fit(model, field, value):
+    return value[:model._meta.get_field(field).max_length]
+
+
+def personal_class(user_id, username):
+    return Class(personal_owner_id=user_id, is_personal=True,
+                 class_name=_fit(Class, 'class_name', f"{username}'s Flashcards"),
+                 class_number=_fit(Class, 'class_number', f'DEFAULT-{username}'),
+                 description='Default flashcard collection')
+
+
+def personal_set(user_id, username, class_id):
+    return FlashcardSet(default_owner_id=user_id, creator_id=user_id, class_obj_id=class_id,
+                        name=_fit(FlashcardSet, 'name', f"{username}'s Default Set"),
+                        description='Auto-created default set')
+
+
+def create_defaults(user_id, username):
+    """Create the default class and set of a user who has neither, e.g. one who just registered"""
+    class_obj = personal_class(user_id, username)
+    class_obj.save()
+    personal_set(user_id, username, class_obj.id).save()
+
+
+def _upsert(obj, owner_field):
+    # updating the owner to itself on conflict makes the statement return the existing row's id too
+    type(obj).objects.bulk_create([obj], update_conflicts=True, unique_fields=[owner_field],
+                                  update_fields=[owner_field])
+    return obj.id
+
+
+def _load(user_id, username):
+    ids = FlashcardSet.objects.filter(default_owner_id=user_id).values_list('id', 'class_obj_id').first()
+    if ids:
+        return ids
+    class_id = _upsert(personal_class(user_id, username), 'personal_owner')
+    set_id = _upsert(personal_set(user_id, username, class_id), 'default_owner')
+    # bulk_create sends no post_save, so do what the Class and FlashcardSet receivers would have done
+    bump_list_version(CLASSES)
+    invalidate('user_sets', user_id)
+    return set_id, class_id
+
+
+def default_set(user_id, username):
+    """
+    The user's default set, created along with their default class if need be. Only id, class_obj_id
+    and creator_id are filled in, which is all that adding cards to it needs.
+    """
+    set_id, class_id = cached_on_commit('default_set', user_id, lambda: _load(user_id, username))
+    return FlashcardSet(id=set_id, class_obj_id=class_id, creator_id=user_id, default_owner_id=user_id)
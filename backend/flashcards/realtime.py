@@ -0,0 +1,226 @@
+"""
+Real-time class message boards over ASGI WebSockets.
+
+Clients connect to /ws/classes/<class_id>/board/?token=<token>, with the bearer token login_user returns
+(browsers cannot set an Authorization header on a WebSocket; other clients may send "Authorization:
+Bearer <token>" instead). Members of the class are accepted and first receive the latest
+FLASHCARDS_BOARD_BACKFILL messages, then every message posted to the board, each once. They post by
+sending {"message": "..."}. Posted messages are written in batches and then fanned out through the
+broker named by FLASHCARDS_BOARD_BROKER.
+"""
+import asyncio
+import json
+import logging
+import re
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+from .authentication import KEYWORD, read_token
+from .models import ClassMember, Message, MessageBoard
+
+logger = logging.getLogger(__name__)
+
+BOARD_PATH = re.compile(r'^/ws/classes/(?P<class_id>\d+)/board/$')
+MAX_MESSAGE_LENGTH = 2000
+MAX_WRITE_BATCH = 500
+SOCKET_QUEUE_SIZE = 256
+
+_encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+
+class InProcessBroker:
+    """
+    Fans messages out to the sockets connected to this process. It stands in for an external broker:
+    a multi-process deployment would swap in one with the same subscribe/unsubscribe/publish methods.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, board_id, queue):
+        self._subscribers[board_id].add(queue)
+
+    def unsubscribe(self, board_id, queue):
+        subscribers = self._subscribers.get(board_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[board_id]
+
+    def subscriber_count(self, board_id):
+        return len(self._subscribers.get(board_id, ()))
+
+    async def publish(self, board_id, message_id, payload):
+        for queue in list(self._subscribers.get(board_id, ())):
+            try:
+                queue.put_nowait((message_id, payload))
+            except asyncio.QueueFull:
+                logger.warning('Dropping board %s message for a slow socket', board_id)
+
+
+broker = import_string(settings.FLASHCARDS_BOARD_BROKER)()
+
+
+def serialize_message(message_id, user_id, username, text, timestamp):
+    return _encoder.encode({
+        'type': 'message',
+        'id': message_id,
+        'user_id': user_id,
+        'username': username,
+        'message': text,
+        'timestamp': timestamp
+    })
+
+
+def _save_messages(batch):
+    messages = Message.objects.bulk_create(
+        [Message(board_id=board_id, user_id=user_id, message_text=text) for board_id, user_id, _, text in batch]
+    )
+    return [(message, username) for message, (_, _, username, _) in zip(messages, batch)]
+
+
+class MessageWriter:
+    """Collects posted messages for up to FLASHCARDS_BOARD_WRITE_DELAY seconds and writes them with one INSERT"""
+
+    def __init__(self):
+        self._loop = None
+        self._queue = None
+
+    def submit(self, board_id, user_id, username, text):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            loop.create_task(self._run(self._queue))
+        self._queue.put_nowait((board_id, user_id, username, text))
+
+    async def _run(self, queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + settings.FLASHCARDS_BOARD_WRITE_DELAY
+            while len(batch) < MAX_WRITE_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                saved = await sync_to_async(_save_messages)(batch)
+            except Exception:
+                logger.exception('Writing %s board messages failed', len(batch))
+                continue
+            for message, username in saved:
+                payload = serialize_message(message.id, message.user_id, username,
+                                            message.message_text, message.timestamp)
+                await broker.publish(message.board_id, message.id, payload)
+
+
+writer = MessageWriter()
+
+
+def _caller(scope):
+    """(user_id, username) from the connection's bearer token, or None without a valid one"""
+    token = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+    if token is None:
+        header = dict(scope.get('headers', ())).get(b'authorization', b'').decode('latin-1').split()
+        if len(header) == 2 and header[0].lower() == KEYWORD.lower():
+            token = header[1]
+    if not token:
+        return None
+    try:
+        return read_token(token)
+    except signing.BadSignature:
+        return None
+
+
+def _authorize(class_id, user_id):
+    """Return the board id if the user is a member of the class, else None"""
+    if not ClassMember.objects.filter(user_id=user_id, class_obj_id=class_id).exists():
+        return None
+    board, _ = MessageBoard.objects.get_or_create(class_obj_id=class_id)
+    return board.id
+
+
+def _backfill(board_id):
+    rows = Message.objects.filter(board_id=board_id).order_by('-timestamp', '-id').values(
+        'id', 'user_id', 'user__username', 'message_text', 'timestamp'
+    )[:settings.FLASHCARDS_BOARD_BACKFILL]
+    return [(row['id'], serialize_message(row['id'], row['user_id'], row['user__username'], row['message_text'],
+                                          row['timestamp']))
+            for row in reversed(rows)]
+
+
+async def _pump(queue, send, sent_ids):
+    while True:
+        message_id, payload = await queue.get()
+        # published after this socket subscribed but before its backfill was read: already sent
+        if message_id in sent_ids:
+            sent_ids.discard(message_id)
+            continue
+        await send({'type': 'websocket.send', 'text': payload})
+
+
+async def board_socket(scope, receive, send):
+    """ASGI application for one board WebSocket connection"""
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    match = BOARD_PATH.match(scope['path'])
+    if not match:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+
+    caller = _caller(scope)
+    if caller is None:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+    user_id, username = caller
+    board_id = await sync_to_async(_authorize)(int(match['class_id']), user_id)
+    if board_id is None:
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+
+    await send({'type': 'websocket.accept'})
+    queue = asyncio.Queue(maxsize=SOCKET_QUEUE_SIZE)
+    # subscribed before the backfill is read so nothing posted in between is missed; _pump skips the
+    # messages that made it into both
+    broker.subscribe(board_id, queue)
+    pump = None
+    try:
+        sent_ids = set()
+        for message_id, payload in await sync_to_async(_backfill)(board_id):
+            await send({'type': 'websocket.send', 'text': payload})
+            sent_ids.add(message_id)
+        pump = asyncio.create_task(_pump(queue, send, sent_ids))
+
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+            if event['type'] != 'websocket.receive':
+                continue
+            try:
+                text = json.loads(event.get('text') or '').get('message')
+            except (ValueError, AttributeError):
+                text = None
+            if not isinstance(text, str) or not text.strip() or len(text) > MAX_MESSAGE_LENGTH:
+                await send({'type': 'websocket.send', 'text': _encoder.encode(
+                    {'type': 'error', 'error': f'message must be 1-{MAX_MESSAGE_LENGTH} characters'}
+                )})
+                continue
+            writer.submit(board_id, user_id, username, text.strip())
+    finally:
+        broker.unsubscribe(board_id, queue)
+        if pump is not None:
+            pump.cancel()
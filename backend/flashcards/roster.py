@@ -0,0 +1,129 @@
+"""
+Bulk class enrollment.
+
+A roster is a list of (username or email, role) entries. Users are resolved with one IN query per
+ROSTER_BATCH_SIZE identifiers and the memberships are inserted with bulk_create(ignore_conflicts=True),
+which the (user, class_obj) unique constraint turns into "skip existing members". bulk_create sends no
+signals, so member_count and the members' cached class lists are updated here, inside the same
+transaction.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+
+from . import counters
+from .cache import invalidate
+from .models import Class, ClassMember
+
+ROSTER_BATCH_SIZE = 1000
+ROLES = [role for role, _ in ClassMember.ROLE_CHOICES]
+DEFAULT_ROLE = 'Student'
+
+
+class ClassNotFound(Exception):
+    pass
+
+
+def parse_entries(entries, default_role=DEFAULT_ROLE):
+    """
+    Normalize roster entries, each a username/email string or {'user': ..., 'role': ...}.
+    Returns ([(identifier, role)], [{'index', 'error'}]); later duplicates of an identifier are dropped.
+    """
+    parsed, invalid, seen = [], [], set()
+    for index, entry in enumerate(entries):
+        if isinstance(entry, str):
+            identifier, role = entry, default_role
+        elif isinstance(entry, dict):
+            identifier, role = entry.get('user'), entry.get('role') or default_role
+        else:
+            identifier, role = None, None
+        if not isinstance(identifier, str) or not identifier.strip():
+            invalid.append({'index': index, 'error': 'user must be a username or email'})
+            continue
+        if role not in ROLES:
+            invalid.append({'index': index, 'error': f'role must be one of {", ".join(ROLES)}'})
+            continue
+        identifier = identifier.strip()
+        if identifier not in seen:
+            seen.add(identifier)
+            parsed.append((identifier, role))
+    return parsed, invalid
+
+
+def resolve_users(identifiers):
+    """
+    Map usernames and emails to user ids. Usernames may contain "@" too, so those identifiers are
+    looked up both ways and an exact username match wins over the email.
+    Returns ({identifier: user_id}, missing identifiers, ambiguous emails shared by several users).
+    """
+    by_username, by_email, ambiguous = {}, {}, set()
+    for start in range(0, len(identifiers), ROSTER_BATCH_SIZE):
+        batch = identifiers[start:start + ROSTER_BATCH_SIZE]
+        emails = [identifier for identifier in batch if '@' in identifier]
+        rows = User.objects.filter(Q(username__in=batch) | Q(email__in=emails)).values_list('id', 'username',
+                                                                                            'email')
+        wanted_usernames, wanted_emails = set(batch), set(emails)
+        for user_id, username, email in rows:
+            if username in wanted_usernames:
+                by_username[username] = user_id
+            if email in wanted_emails:
+                if by_email.get(email, user_id) != user_id:
+                    ambiguous.add(email)
+                by_email[email] = user_id
+    ambiguous -= by_username.keys()
+    resolved = {email: user_id for email, user_id in by_email.items() if email not in ambiguous}
+    resolved.update(by_username)
+    missing = [identifier for identifier in identifiers if identifier not in resolved and identifier not in ambiguous]
+    return resolved, missing, sorted(ambiguous)
+
+
+def enroll(class_id, members):
+    """
+    Add {user_id: role} to a class, leaving existing members (and their roles) as they are.
+    Returns the ids of the users that were newly enrolled. Call inside a transaction.
+    """
+    existing = set()
+    user_ids = list(members)
+    for start in range(0, len(user_ids), ROSTER_BATCH_SIZE):
+        batch = user_ids[start:start + ROSTER_BATCH_SIZE]
+        existing.update(ClassMember.objects.filter(class_obj_id=class_id, user_id__in=batch)
+                        .values_list('user_id', flat=True))
+    new_ids = [user_id for user_id in user_ids if user_id not in existing]
+    ClassMember.objects.bulk_create(
+        [ClassMember(user_id=user_id, class_obj_id=class_id, role_in_class=members[user_id]) for user_id in new_ids],
+        batch_size=ROSTER_BATCH_SIZE, ignore_conflicts=True
+    )
+    if new_ids:
+        counters.recount_members([class_id])
+        counters.bump_user_lists(counters.USER_CLASSES, *new_ids)
+        invalidate('user_classes', *new_ids)
+    return new_ids
+
+
+def import_roster(class_id, entries, default_role=DEFAULT_ROLE):
+    """
+    Enroll a roster into a class in one transaction and report the outcome:
+    {'enrolled', 'already_members', 'missing', 'ambiguous', 'invalid'}. Raises ClassNotFound.
+    """
+    parsed, invalid = parse_entries(entries, default_role)
+
+    with transaction.atomic():
+        # locks the class row so a concurrent delete cannot leave memberships behind
+        if not Class.objects.select_for_update().filter(id=class_id).exists():
+            raise ClassNotFound(class_id)
+        resolved, missing, ambiguous = resolve_users([identifier for identifier, _ in parsed])
+
+        members = {}
+        for identifier, role in parsed:
+            if identifier in resolved:
+                # a user listed twice (by username and by email) keeps the first role
+                members.setdefault(resolved[identifier], role)
+        enrolled = enroll(class_id, members)
+
+    return {
+        'enrolled': len(enrolled),
+        'already_members': len(members) - len(enrolled),
+        'missing': missing,
+        'ambiguous': ambiguous,
+        'invalid': invalid
+    }
@@ -0,0 +1,63 @@
+"""
+Primary/replica routing.
+
+flashcards.middleware.ReplicaMiddleware marks GET and HEAD requests as read-only in a context
+variable; while it is set, ReadReplicaRouter sends reads to one of settings.FLASHCARDS_READ_REPLICAS.
+Writes, reads in views decorated with use_primary, reads that refill flashcards.cache, and reads by a
+user who wrote within the last FLASHCARDS_REPLICA_PIN_SECONDS all go to the primary.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_KIND = 'primary_pin'
+SAFE_METHODS = ('GET', 'HEAD')
+
+read_only = ContextVar('flashcards_read_only', default=False)
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.FLASHCARDS_READ_REPLICAS
+        if not replicas or not read_only.get():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas receive the schema through replication; the test stand-in is migrated like the primary
+        return db == DEFAULT_DB_ALIAS or db not in settings.FLASHCARDS_READ_REPLICAS
+
+
+def use_primary(view):
+    """For GET views (or other callables, sync or async) that also write, or must not see replication lag"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            token = read_only.set(False)
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                read_only.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = read_only.set(False)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            read_only.reset(token)
+    return wrapper
+
@@ -0,0 +1,140 @@
+"""SM-2 spaced-repetition scheduling over CardReviewState"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+
+from .models import CardReviewState, Flashcard, NewCardMark
+
+MIN_EASE = 1.3
+REVIEW_FIELDS = ['ease', 'interval', 'repetitions', 'due_at', 'last_reviewed']
+
+
+def apply_review(state, quality, now):
+    """Update state in place for a review graded 0 (blackout) to 5 (perfect recall)"""
+    if quality < 3:
+        state.repetitions = 0
+        state.interval = 1
+    else:
+        state.repetitions += 1
+        if state.repetitions == 1:
+            state.interval = 1
+        elif state.repetitions == 2:
+            state.interval = 6
+        else:
+            state.interval = round(state.interval * state.ease)
+
+    state.ease = max(MIN_EASE, state.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    state.last_reviewed = now
+    state.due_at = now + timedelta(days=state.interval)
+    return state
+
+
+def due_cards(user_id, limit, now, set_id=None, include_new=True):
+    """
+    Return up to limit cards for the user to study next: reviews already due, soonest first,
+    topped up with cards the user has never reviewed (see new_cards). The due part is one seek on
+    (user[, set], due_at).
+    """
+    states = CardReviewState.objects.filter(user_id=user_id, due_at__lte=now)
+    if set_id:
+        states = states.filter(flashcard_set_id=set_id)
+    cards = [
+        {
+            'id': state['flashcard_id'],
+            'front_text': state['flashcard__front_text'],
+            'back_text': state['flashcard__back_text'],
+            'due_at': state['due_at'],
+            'new': False
+        }
+        for state in states.order_by('due_at').values(
+            'flashcard_id', 'flashcard__front_text', 'flashcard__back_text', 'due_at'
+        )[:limit]
+    ]
+
+    remaining = limit - len(cards)
+    if include_new and remaining > 0:
+        cards.extend({**card, 'due_at': None, 'new': True} for card in new_cards(user_id, remaining, set_id))
+
+    return cards
+
+
+def new_cards(user_id, limit, set_id=None):
+    """
+    Up to limit cards the user has never reviewed, oldest first: from one set, or among the cards the user
+    created. The search starts after the user's NewCardMark for that scope and the mark then moves up to
+    the first unseen card, so each reviewed card is stepped over once instead of on every call.
+    """
+    scope = int(set_id or 0)
+    cards = Flashcard.objects.filter(flashcard_set_id=set_id) if set_id else Flashcard.objects.filter(creator_id=user_id)
+    mark = NewCardMark.objects.filter(user_id=user_id, scope=scope).values_list('last_card_id', flat=True).first() or 0
+
+    reviewed = CardReviewState.objects.filter(user_id=user_id, flashcard_id=OuterRef('id'))
+    unseen = list(cards.filter(id__gt=mark).filter(~Exists(reviewed)).order_by('id')
+                  .values('id', 'front_text', 'back_text')[:limit])
+
+    if unseen:
+        new_mark = unseen[0]['id'] - 1
+    else:
+        # every card in the scope was reviewed; ids only grow, so none is missed below the newest reviewed
+        # card (one seek on the (user, flashcard) unique index)
+        new_mark = CardReviewState.objects.filter(user_id=user_id).aggregate(high=Max('flashcard_id'))['high'] or 0
+    if new_mark > mark:
+        NewCardMark.objects.bulk_create([NewCardMark(user_id=user_id, scope=scope, last_card_id=new_mark)],
+                                        update_conflicts=True, unique_fields=['user', 'scope'],
+                                        update_fields=['last_card_id'])
+    return unseen
+
+
+def _is_int(value):
+    # bool is an int subclass, but True is not a quality grade
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def submit_reviews(user_id, reviews, now):
+    """
+    Apply a batch of {card_id, quality} reviews. Reads the cards and existing states with one query each,
+    then writes every state with one bulk INSERT and one bulk UPDATE. A first review that races another
+    one for the same card updates the row the other inserted. Returns (updated count, errors).
+    """
+    errors = []
+    valid = []
+    for index, review in enumerate(reviews):
+        card_id = review.get('card_id') if isinstance(review, dict) else None
+        quality = review.get('quality') if isinstance(review, dict) else None
+        if not _is_int(card_id) or not _is_int(quality) or not 0 <= quality <= 5:
+            errors.append({'index': index, 'error': 'card_id and quality (0-5) are required'})
+            continue
+        valid.append((index, card_id, quality))
+
+    card_ids = {card_id for _, card_id, _ in valid}
+    set_ids = dict(Flashcard.objects.filter(id__in=card_ids).values_list('id', 'flashcard_set_id'))
+    states = {
+        state.flashcard_id: state
+        for state in CardReviewState.objects.filter(user_id=user_id, flashcard_id__in=set_ids)
+    }
+    existing = set(states)
+
+    for index, card_id, quality in valid:
+        if card_id not in set_ids:
+            errors.append({'index': index, 'error': 'Flashcard not found'})
+            continue
+        state = states.get(card_id)
+        if state is None:
+            state = states[card_id] = CardReviewState(
+                user_id=user_id, flashcard_id=card_id, flashcard_set_id=set_ids[card_id], due_at=now
+            )
+        apply_review(state, quality, now)
+
+    with transaction.atomic():
+        CardReviewState.objects.bulk_create(
+            [state for card_id, state in states.items() if card_id not in existing],
+            update_conflicts=True, unique_fields=['user', 'flashcard'], update_fields=REVIEW_FIELDS
+        )
+        CardReviewState.objects.bulk_update(
+            [state for card_id, state in states.items() if card_id in existing],
+            REVIEW_FIELDS
+        )
+
+    errors.sort(key=lambda error: error['index'])
+    return len(states), errors
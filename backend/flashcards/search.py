@@ -0,0 +1,125 @@
+"""
+Ranked full-text search over flashcard front/back text.
+
+Backed by the index created in migration 0006: an FTS5 table kept in sync by triggers on SQLite, and a
+GIN expression index on PostgreSQL (which updates with the row). Other databases fall back to icontains.
+Both indexed backends read a query the same way: every word must match, the last one as a prefix, so
+results do not depend on the database while someone is still typing.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Flashcard
+from .pagination import PaginationError, decode_cursor, encode_cursor
+
+COLUMNS = ('id', 'front_text', 'back_text', 'flashcard_set_id', 'class_obj_id', 'rank')
+
+# Matches are ranked in a derived table so a page can seek past the last (rank, id) it showed
+SQLITE_SEARCH = """
+    SELECT id, front_text, back_text, flashcard_set_id, class_obj_id, rank FROM (
+        SELECT f.id, f.front_text, f.back_text, f.flashcard_set_id, f.class_obj_id,
+               -bm25(flashcards_flashcard_fts) AS rank
+        FROM flashcards_flashcard_fts
+        JOIN flashcards_flashcard f ON f.id = flashcards_flashcard_fts.rowid
+        WHERE flashcards_flashcard_fts MATCH %s {filters}
+    ) matches
+    {after}
+    ORDER BY rank DESC, id
+    LIMIT %s
+"""
+
+POSTGRES_SEARCH = """
+    SELECT id, front_text, back_text, flashcard_set_id, class_obj_id, rank FROM (
+        SELECT f.id, f.front_text, f.back_text, f.flashcard_set_id, f.class_obj_id,
+               ts_rank(to_tsvector('english', f.front_text || ' ' || f.back_text), query) AS rank
+        FROM flashcards_flashcard f, to_tsquery('english', %s) query
+        WHERE to_tsvector('english', f.front_text || ' ' || f.back_text) @@ query {filters}
+    ) matches
+    {after}
+    ORDER BY rank DESC, id
+    LIMIT %s
+"""
+
+AFTER = 'WHERE rank < %s OR (rank = %s AND id > %s)'
+
+
+def result_cursor(row):
+    return encode_cursor({'rank': row['rank'], 'id': row['id']})
+
+
+def parse_result_cursor(cursor):
+    """(rank, id) of the last result of a page; rank is None on databases without ranking"""
+    values = decode_cursor(cursor)
+    rank, card_id = values.get('rank'), values.get('id')
+    if not isinstance(card_id, int) or not (rank is None or isinstance(rank, (int, float))):
+        raise PaginationError('Invalid cursor')
+    return rank, card_id
+
+
+def _words(text):
+    return re.findall(r'\w+', text)
+
+
+def fts5_query(text):
+    """Quote each word so user input cannot form FTS5 syntax; the last word also matches as a prefix"""
+    words = _words(text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def tsquery(text):
+    """The to_tsquery() equivalent of fts5_query: every word required, the last one as a prefix"""
+    words = _words(text)
+    if not words:
+        return None
+    # \w+ cannot contain a quote or an operator, so quoting each word keeps it a single lexeme
+    terms = [f"'{word}'" for word in words]
+    terms[-1] += ':*'
+    return ' & '.join(terms)
+
+
+def search_flashcards(text, class_id=None, set_id=None, limit=20, after=None):
+    """
+    Return up to limit matching cards as dicts, best match first. after is the (rank, id) of the last
+    card of the previous page; each page seeks past it instead of skipping an OFFSET.
+    """
+    filters = ''
+    filter_params = []
+    if class_id:
+        filters += ' AND f.class_obj_id = %s'
+        filter_params.append(class_id)
+    if set_id:
+        filters += ' AND f.flashcard_set_id = %s'
+        filter_params.append(set_id)
+
+    if connection.vendor == 'sqlite':
+        sql, query = SQLITE_SEARCH, fts5_query(text)
+    elif connection.vendor == 'postgresql':
+        sql, query = POSTGRES_SEARCH, tsquery(text)
+    else:
+        return _search_fallback(text, class_id, set_id, limit, after)
+    if query is None:
+        return []
+
+    after_params = [after[0], after[0], after[1]] if after else []
+    sql = sql.format(filters=filters, after=AFTER if after else '')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query, *filter_params, *after_params, limit])
+        return [dict(zip(COLUMNS, row)) for row in cursor.fetchall()]
+
+
+def _search_fallback(text, class_id, set_id, limit, after):
+    cards = Flashcard.objects.filter(Q(front_text__icontains=text) | Q(back_text__icontains=text))
+    if class_id:
+        cards = cards.filter(class_obj_id=class_id)
+    if set_id:
+        cards = cards.filter(flashcard_set_id=set_id)
+    if after:
+        cards = cards.filter(id__gt=after[1])
+    rows = cards.order_by('id').values(*COLUMNS[:-1])[:limit]
+    return [{**row, 'rank': None} for row in rows]
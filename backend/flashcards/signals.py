@@ -0,0 +1,89 @@
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import dedup
+from .cache import bump, invalidate
+from .counters import (
+    CLASSES, USER_CARDS, USER_CLASSES, adjust_card_count, adjust_member_count, bump_list_version, bump_user_lists
+)
+from .models import Class, ClassMember, Flashcard, FlashcardSet
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate('user_id', instance.username)
+
+
+@receiver([post_save, post_delete], sender=ClassMember)
+def class_member_changed(sender, instance, **kwargs):
+    invalidate('user_classes', instance.user_id)
+    bump_user_lists(USER_CLASSES, instance.user_id)
+    delta = _count_delta(kwargs)
+    if delta and not _deleted_with(kwargs, Class):
+        adjust_member_count(instance.class_obj_id, delta)
+
+
+@receiver(post_save, sender=Class)
+def class_changed(sender, instance, created, **kwargs):
+    if not created:
+        member_ids = list(ClassMember.objects.filter(class_obj=instance).values_list('user_id', flat=True))
+        # members' class lists show the class's name and number, so move their ETags along
+        bump_user_lists(USER_CLASSES, *member_ids)
+        invalidate('user_classes', *member_ids)
+
+
+@receiver([post_save, post_delete], sender=Class)
+def catalog_changed(sender, instance, **kwargs):
+    # the class listing shows every class, the catalog only shared ones
+    bump_list_version(CLASSES)
+    if not instance.is_personal:
+        bump('catalog')
+
+
+@receiver([post_save, post_delete], sender=FlashcardSet)
+def flashcard_set_changed(sender, instance, **kwargs):
+    invalidate('user_sets', instance.creator_id)
+    if kwargs['signal'] is post_delete and instance.default_owner_id:
+        invalidate('default_set', instance.default_owner_id)
+
+
+@receiver([post_save, post_delete], sender=Flashcard)
+def flashcard_changed(sender, instance, **kwargs):
+    invalidate('user_cards', instance.creator_id)
+    bump_user_lists(USER_CARDS, instance.creator_id)
+    if _deleted_with(kwargs, FlashcardSet):
+        # the set is going too, so there is no count or version left to maintain
+        return
+    delta = _count_delta(kwargs)
+    # one UPDATE bumps the version and, when a card was added or removed, the set's card_count
+    adjust_card_count(instance.flashcard_set_id, delta)
+    if delta:
+        # the set creator's cached listing shows card_count
+        invalidate('user_sets', _set_creator_id(instance))
+    else:
+        # text or class may have changed
+        dedup.forget([instance.id])
+    if kwargs['signal'] is post_save:
+        dedup.index_cards(instance.class_obj_id, [(instance.id, instance.front_text, instance.back_text)])
+
+
+def _count_delta(kwargs):
+    """+1 for a created row, -1 for a deleted one, 0 for an update"""
+    if kwargs['signal'] is post_delete:
+        return -1
+    return 1 if kwargs['created'] else 0
+
+
+def _deleted_with(kwargs, model):
+    """True when this post_delete is part of a cascade from deleting a model instance or queryset"""
+    origin = kwargs.get('origin')
+    return isinstance(origin, model) or (isinstance(origin, QuerySet) and origin.model is model)
+
+
+def _set_creator_id(flashcard):
+    if Flashcard.flashcard_set.is_cached(flashcard):
+        return flashcard.flashcard_set.creator_id
+    return FlashcardSet.objects.filter(id=flashcard.flashcard_set_id).values_list('creator_id', flat=True).first()
+
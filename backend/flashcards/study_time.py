@@ -0,0 +1,120 @@
+"""
+Buffered study-time accumulation.
+
+Heartbeats only add to an in-process counter per (set, user). A daemon thread flushes the counters
+every FLASHCARDS_STUDY_TIME_FLUSH_INTERVAL seconds as one UPDATE ... SET time_spent = time_spent + CASE ...
+per batch, and an atexit hook flushes whatever is left when the worker shuts down gracefully. With an
+interval of 0 there is no thread and flush() writes the counters when called.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .models import FlashcardSet, FlashcardSetStudyTime
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 500
+
+
+def write_increments(pending):
+    """Add {(set_id, user_id): seconds} to FlashcardSetStudyTime, creating missing rows first"""
+    set_ids = {set_id for set_id, _ in pending}
+    user_ids = {user_id for _, user_id in pending}
+    with transaction.atomic():
+        # heartbeats are not validated against the database, so drop rows that no longer exist here
+        set_ids = set(FlashcardSet.objects.filter(id__in=set_ids).values_list('id', flat=True))
+        user_ids = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        items = [(key, seconds) for key, seconds in pending.items() if key[0] in set_ids and key[1] in user_ids]
+
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            FlashcardSetStudyTime.objects.bulk_create(
+                [FlashcardSetStudyTime(flashcard_set_id=set_id, user_id=user_id) for (set_id, user_id), _ in batch],
+                ignore_conflicts=True
+            )
+            match = Q()
+            increments = []
+            for (set_id, user_id), seconds in batch:
+                match |= Q(flashcard_set_id=set_id, user_id=user_id)
+                increments.append(When(flashcard_set_id=set_id, user_id=user_id, then=Value(seconds)))
+            FlashcardSetStudyTime.objects.filter(match).update(
+                time_spent=F('time_spent') + Case(*increments, default=Value(0), output_field=IntegerField()),
+                last_studied=timezone.now()
+            )
+    return len(items)
+
+
+class StudyTimeBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def add(self, set_id, user_id, seconds):
+        with self._lock:
+            self._pending[(set_id, user_id)] += seconds
+            if self._thread is None:
+                self._start()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        """Write everything buffered so far; on failure the seconds go back into the buffer"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return 0
+        try:
+            return write_increments(pending)
+        except Exception:
+            with self._lock:
+                self._pending.update(pending)
+            raise
+
+    def discard(self):
+        """Drop everything buffered so far; returns the number of (set, user) counters dropped"""
+        with self._lock:
+            dropped, self._pending = len(self._pending), Counter()
+        return dropped
+
+    def _start(self):
+        if settings.FLASHCARDS_STUDY_TIME_FLUSH_INTERVAL > 0:
+            self._thread = threading.Thread(target=self._run, name='study-time-flusher', daemon=True)
+            self._thread.start()
+        else:
+            self._thread = False
+        atexit.register(self.shutdown)
+
+    def _run(self):
+        while not self._stop.wait(settings.FLASHCARDS_STUDY_TIME_FLUSH_INTERVAL):
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing study time failed; will retry')
+
+    def shutdown(self):
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing study time at shutdown failed; %s rows lost', len(self._pending))
+
+
+buffer = StudyTimeBuffer()
+
+
+def flush():
+    """Write this worker's buffered heartbeats now; returns the number of rows updated"""
+    return buffer.flush()
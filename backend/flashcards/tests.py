@@ -1,3 +1,1742 @@
-from django.test import TestCase
+import asyncio
+import atexit
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    async_views, avatars, benchmarks, cache, counters, datagen, decks, dedup, leaderboard, metrics, passwords,
+    provisioning, realtime, roster, routers, scheduling, search, study_time, views
+)
+from .authentication import issue_token
+from .bulk import insert_flashcards
+from .models import (
+    CardReviewState, Class, ClassMember, Flashcard, FlashcardSet, FlashcardSetLeaderboard, FlashcardSetStudyTime,
+    FlashcardSignature, LSHBucket, Message, MessageBoard, NewCardMark
+)
+from .pagination import PaginationError, decode_cursor, encode_cursor
+
+
+class QueryPlanTests(TestCase):
+    """
+    Every query a view runs must be answerable through an index.
+    Seed size defaults to something quick; set FLASHCARDS_PLAN_TEST_CARDS=1000000 for the full check.
+    """
+    CARDS = int(os.getenv('FLASHCARDS_PLAN_TEST_CARDS', 20000))
+    USERS = 20
+    SETS_PER_USER = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            [User(username=f'plan_user_{i}') for i in range(cls.USERS)]
+        )
+        classes = Class.objects.bulk_create(
+            [Class(class_name=f'Class {i}', class_number=f'CLS-{i}') for i in range(cls.USERS)]
+        )
+        # personal default classes outnumber shared ones, as they grow with users
+        Class.objects.bulk_create(
+            [Class(class_name=f"user_{i}'s Flashcards", class_number=f'DEFAULT-user_{i}', is_personal=True)
+             for i in range(cls.USERS * 50)]
+        )
+        ClassMember.objects.bulk_create(
+            [ClassMember(user=user, class_obj=class_obj, role_in_class='Student')
+             for user in users for class_obj in classes[:3]]
+        )
+        sets = FlashcardSet.objects.bulk_create(
+            [FlashcardSet(class_obj=classes[i % len(classes)], name=f'Set {i}', creator=users[i % len(users)])
+             for i in range(cls.USERS * cls.SETS_PER_USER)]
+        )
+
+        batch = []
+        for i in range(cls.CARDS):
+            flashcard_set = sets[i % len(sets)]
+            batch.append(Flashcard(
+                flashcard_set=flashcard_set,
+                class_obj_id=flashcard_set.class_obj_id,
+                creator_id=flashcard_set.creator_id,
+                front_text=f'Front {i}',
+                back_text=f'Back {i}'
+            ))
+            if len(batch) == 5000:
+                Flashcard.objects.bulk_create(batch)
+                batch = []
+        Flashcard.objects.bulk_create(batch)
+
+        board = MessageBoard.objects.create(class_obj=classes[0])
+        Message.objects.bulk_create(
+            [Message(board=board, user=users[i % len(users)], message_text=f'Message {i}') for i in range(1000)]
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.user = users[0]
+        cls.flashcard_set = sets[0]
+        cls.class_obj = classes[0]
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # With sequential scans priced out, the planner only picks one when no index applies
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+                return [row[0] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def is_seq_scan(self, step):
+        if connection.vendor == 'postgresql':
+            return 'Seq Scan' in step
+        return step.startswith('SCAN ') and 'USING' not in step
+
+    def assertIndexedQueries(self, method, url, data):
+        client = self.client_class(HTTP_HOST='localhost')
+        with CaptureQueriesContext(connection) as ctx:
+            if method == 'post':
+                response = client.post(url, data, content_type='application/json')
+            else:
+                response = client.get(url, data)
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 300, response.content)
+
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = self.plan(sql)
+            scans = [step for step in plan if self.is_seq_scan(step)]
+            self.assertFalse(scans, f'{url} does a sequential scan:\n{sql}\n' + '\n'.join(plan))
+
+    def test_get_flashcards(self):
+        self.assertIndexedQueries('get', '/api/flashcards/', {'username': self.user.username})
+        self.assertIndexedQueries('get', '/api/flashcards/', {'username': self.user.username, 'page_size': 50})
+
+    def test_get_flashcards_in_set(self):
+        self.assertIndexedQueries('get', '/api/flashcards/set/', {'set_id': self.flashcard_set.id})
+        self.assertIndexedQueries('get', '/api/flashcards/set/', {'set_id': self.flashcard_set.id, 'page_size': 50})
+
+    def test_get_flashcard_sets(self):
+        self.assertIndexedQueries('get', '/api/flashcard-sets/', {'username': self.user.username})
+
+    def test_get_user_classes(self):
+        self.assertIndexedQueries('get', '/api/user-classes/', {'username': self.user.username})
+
+    def test_list_classes_page(self):
+        # The unpaginated catalog is a full listing by definition; pages after the first are id seeks
+        self.assertIndexedQueries('get', '/api/classes/', {'cursor': encode_cursor({'id': 5}), 'page_size': 5})
+
+    def test_class_catalog(self):
+        self.assertIndexedQueries('get', '/api/classes/catalog/', {'page_size': 5})
+        self.assertIndexedQueries('get', '/api/classes/catalog/', {'q': 'cls-1', 'cursor': encode_cursor({'id': 5})})
+
+    def test_get_due_cards(self):
+        self.assertIndexedQueries('get', '/api/reviews/due/', {'username': self.user.username})
+        self.assertIndexedQueries('get', '/api/reviews/due/', {'username': self.user.username,
+                                                               'set_id': self.flashcard_set.id})
+
+    def test_board_history(self):
+        params = {'class_id': self.class_obj.id, 'username': self.user.username}
+        self.assertIndexedQueries('get', '/api/boards/history/', params)
+        page = self.client_class(HTTP_HOST='localhost').get('/api/boards/history/', params)
+        self.assertIndexedQueries('get', page.json()['older'], {})
+
+    def test_dashboard(self):
+        self.assertIndexedQueries('get', '/api/dashboard/', {'username': self.user.username})
+
+    def test_create_flashcard_default_set_lookup(self):
+        self.assertIndexedQueries('post', '/api/create-flashcard/', {
+            'username': self.user.username, 'question': 'Q', 'answer': 'A'
+        })
+
+
+class BulkCreateTests(TestCase):
+    """Bulk creation writes whole chunks in one transaction and reports invalid rows by index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='bulk_user')
+        cls.class_obj = Class.objects.create(class_name='Bulk', class_number='BLK-1')
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+        self.flashcard_set = FlashcardSet.objects.create(class_obj=self.class_obj, name='Bulk set', creator=self.user)
+
+    def post(self, cards):
+        return self.client.post('/api/create-flashcards/bulk/', json.dumps({
+            'username': self.user.username, 'set_id': self.flashcard_set.id, 'cards': cards
+        }), content_type='application/json')
+
+    def cards(self, count):
+        return [{'question': f'Q{i}', 'answer': f'A{i}'} for i in range(count)]
+
+    def assertCards(self, count):
+        self.assertEqual(Flashcard.objects.filter(flashcard_set=self.flashcard_set).count(), count)
+        self.flashcard_set.refresh_from_db()
+        self.assertEqual(self.flashcard_set.card_count, count)
+
+    def test_valid_rows_are_written_and_invalid_ones_reported(self):
+        response = self.post(self.cards(3) + [{'question': 'Q'}, 'not an object'])
+        self.assertEqual(response.status_code, 201)
+        result = response.json()
+        self.assertEqual((result['created'], len(result['ids'])), (3, 3))
+        self.assertEqual([error['index'] for error in result['errors']], [3, 4])
+        self.assertCards(3)
+
+    def test_batch_without_valid_rows_writes_nothing(self):
+        response = self.post([{'question': ' ', 'answer': 'A'}, {}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['errors']), 2)
+        self.assertCards(0)
+
+    def test_failure_part_way_rolls_back_earlier_chunks(self):
+        def rows():
+            yield from self.cards(5)
+            raise ValueError('Upload interrupted')
+
+        with self.assertRaises(ValueError):
+            insert_flashcards(self.user.id, self.flashcard_set, rows(), chunk_size=2)
+        self.assertCards(0)
+
+    def test_query_count_grows_with_chunks_not_rows(self):
+        def split(ctx):
+            # the near-duplicate index is written per card and checked by NearDuplicateTests; the user's
+            # list version row is inserted on their first write only
+            queries = [q for q in ctx if not ('"flashcards_flashcardsignature"' in q['sql']
+                                              or '"flashcards_lshbucket"' in q['sql']
+                                              or '"flashcards_listversion"' in q['sql'])]
+            inserts = [q for q in queries if q['sql'].startswith('INSERT')]
+            return len(queries) - len(inserts), len(inserts)
+
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.post(self.cards(10)).status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.post(self.cards(1200)).status_code, 201)
+        (small_other, small_inserts), (large_other, large_inserts) = split(small), split(large)
+        self.assertEqual(large_other, small_other)
+        self.assertEqual(small_inserts, 1)
+        # multi-row INSERTs, as many as the backend's parameter limit needs
+        self.assertLessEqual(large_inserts, 12)
+        self.assertCards(1210)
+
+
+class PaginationTests(TestCase):
+    """Listings page by opaque id cursors, reject cursors they did not issue and stream NDJSON"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='page_user')
+        class_obj = Class.objects.create(class_name='Pages', class_number='PAG-1')
+        cls.flashcard_set = FlashcardSet.objects.create(class_obj=class_obj, name='Pages', creator=user)
+        insert_flashcards(user.id, cls.flashcard_set, [{'question': f'Q{i}', 'answer': f'A{i}'} for i in range(7)])
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+
+    def get(self, **params):
+        return self.client.get('/api/flashcards/set/', {'set_id': self.flashcard_set.id, **params})
+
+    def test_cursor_round_trip(self):
+        cursor = encode_cursor({'id': 42, 'at': '2024-01-01'})
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), {'id': 42, 'at': '2024-01-01'})
+
+    def test_pages_follow_next_links_to_the_end(self):
+        fronts, response = [], self.get(page_size=3)
+        while True:
+            page = response.json()
+            fronts += [card['front_text'] for card in page['results']]
+            if not page['next']:
+                break
+            response = self.client.get(page['next'])
+        self.assertEqual(fronts, [f'Q{i}' for i in range(7)])
+
+    def test_tampered_cursors_are_rejected(self):
+        for cursor in ('not a cursor!', 'bm90IGpzb24', encode_cursor([1, 2])):
+            with self.subTest(cursor=cursor), self.assertRaises(PaginationError):
+                decode_cursor(cursor)
+        # well-formed, but not a cursor a page would have issued
+        for cursor in ('not a cursor!', encode_cursor([1, 2]), encode_cursor({'id': '5'}), encode_cursor({})):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get(cursor=cursor).status_code, 400)
+
+    def test_page_size_bounds(self):
+        for page_size in ('0', '-3', 'ten'):
+            self.assertEqual(self.get(page_size=page_size).status_code, 400)
+        with override_settings(FLASHCARDS_MAX_PAGE_SIZE=5):
+            self.assertEqual(len(self.get(page_size=500).json()['results']), 5)
+
+    def test_stream_is_ndjson_in_id_order(self):
+        response = self.get(stream='1')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['front_text'] for line in lines], [f'Q{i}' for i in range(7)])
+
+
+class CacheInvalidationTests(TestCase):
+    """Cached per-user lists are dropped by the writes that change them, and misses and hits are counted"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='cached_user')
+        cls.class_obj = Class.objects.create(class_name='Cached', class_number='CAC-1')
+        cls.flashcard_set = FlashcardSet.objects.create(class_obj=cls.class_obj, name='Cached set', creator=cls.user)
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+        cache.get_cache().clear()
+
+    def get(self, url, username='cached_user'):
+        return self.client.get(url, {'username': username}).json()
+
+    def write(self):
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def card(self, front='Q'):
+        with self.write():
+            return Flashcard.objects.create(flashcard_set=self.flashcard_set, class_obj=self.class_obj,
+                                            creator=self.user, front_text=front, back_text='A')
+
+    def test_card_writes_refresh_cards_and_sets(self):
+        self.assertEqual(self.get('/api/flashcards/'), [])
+        self.assertEqual(self.get('/api/flashcard-sets/')[0]['card_count'], 0)
+        card = self.card()
+        self.assertEqual([c['front_text'] for c in self.get('/api/flashcards/')], ['Q'])
+        self.assertEqual(self.get('/api/flashcard-sets/')[0]['card_count'], 1)
+
+        card.front_text = 'Edited'
+        with self.write():
+            card.save()
+        self.assertEqual([c['front_text'] for c in self.get('/api/flashcards/')], ['Edited'])
+        with self.write():
+            card.delete()
+        self.assertEqual(self.get('/api/flashcards/'), [])
+
+    def test_membership_and_class_writes_refresh_user_classes(self):
+        self.assertEqual(self.get('/api/user-classes/'), [])
+        with self.write():
+            ClassMember.objects.create(user=self.user, class_obj=self.class_obj, role_in_class='Student')
+        self.assertEqual([c['class_name'] for c in self.get('/api/user-classes/')], ['Cached'])
+        self.class_obj.class_name = 'Renamed'
+        with self.write():
+            self.class_obj.save()
+        self.assertEqual([c['class_name'] for c in self.get('/api/user-classes/')], ['Renamed'])
+
+    def test_unknown_username_is_forgotten_once_registered(self):
+        self.assertEqual(self.client.get('/api/flashcards/', {'username': 'newcomer'}).status_code, 404)
+        with self.write():
+            User.objects.create(username='newcomer')
+        self.assertEqual(self.client.get('/api/flashcards/', {'username': 'newcomer'}).status_code, 200)
+
+    def test_stats_count_hits_and_misses(self):
+        def user_cards():
+            with override_settings(FLASHCARDS_METRICS_TOKEN='scrape'):
+                response = self.client.get('/api/cache-stats/', HTTP_AUTHORIZATION='Bearer scrape')
+            return response.json().get('user_cards', {'hits': 0, 'misses': 0})
+
+        before = user_cards()
+        self.get('/api/flashcards/')
+        self.get('/api/flashcards/')
+        after = user_cards()
+        self.assertEqual((after['misses'] - before['misses'], after['hits'] - before['hits']), (1, 1))
+
+
+class ConditionalGetTests(TestCase):
+    """GET listings carry an ETag, answer a matching If-None-Match with 304 and change tag on any edit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='etag_user')
+        cls.class_obj = Class.objects.create(class_name='Tagged', class_number='TAG-1')
+        cls.member = ClassMember.objects.create(user=cls.user, class_obj=cls.class_obj, role_in_class='Student')
+        cls.flashcard_set = FlashcardSet.objects.create(class_obj=cls.class_obj, name='Tagged', creator=cls.user)
+        cls.card = Flashcard.objects.create(flashcard_set=cls.flashcard_set, class_obj=cls.class_obj,
+                                            creator=cls.user, front_text='Q', back_text='A')
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+        cache.get_cache().clear()
+
+    def tag(self, url, params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, params, headers={'if-none-match': response['ETag']}).status_code, 304)
+        return response['ETag']
+
+    def assertTagChanges(self, url, params, edit):
+        before = self.tag(url, params)
+        with self.captureOnCommitCallbacks(execute=True):
+            edit()
+        response = self.client.get(url, params, headers={'if-none-match': before})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], before)
+
+    def test_card_edits_change_the_tags(self):
+        user = {'username': 'etag_user'}
+        self.card.front_text = 'Edited'
+        self.assertTagChanges('/api/flashcards/', user, self.card.save)
+        self.card.back_text = 'Edited'
+        self.assertTagChanges('/api/flashcards/set/', {'set_id': self.flashcard_set.id}, self.card.save)
+
+    def test_role_and_class_edits_change_the_user_classes_tag(self):
+        user = {'username': 'etag_user'}
+        self.member.role_in_class = 'TA'
+        self.assertTagChanges('/api/user-classes/', user, self.member.save)
+        self.class_obj.class_name = 'Renamed'
+        self.assertTagChanges('/api/user-classes/', user, self.class_obj.save)
+
+    def test_user_tags_read_one_row_and_follow_bulk_writes(self):
+        user = {'username': 'etag_user'}
+        tag = self.tag('/api/flashcards/', user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/flashcards/', user, headers={'if-none-match': tag})
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"flashcards_listversion"', queries[0]['sql'])
+
+        self.assertTagChanges('/api/flashcards/', user, lambda: insert_flashcards(
+            self.user.id, self.flashcard_set, [{'question': 'Bulk', 'answer': 'Card'}]))
+        self.assertTagChanges('/api/flashcards/', user, self.card.delete)
+        other = Class.objects.create(class_name='Other', class_number='TAG-2')
+        self.assertTagChanges('/api/user-classes/', user, lambda: roster.enroll(other.id, {self.user.id: 'Student'}))
+
+    def test_class_list_tag_reads_one_row_and_follows_classes_and_members(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.tag('/api/classes/', {})
+        # one row for the tag of each request, and the listing on the first one only
+        self.assertEqual(len(queries), 3)
+
+        other = User.objects.create(username='etag_other')
+        self.assertTagChanges('/api/classes/', {}, lambda: ClassMember.objects.create(
+            user=other, class_obj=self.class_obj, role_in_class='Student'))
+        self.class_obj.description = 'Edited'
+        self.assertTagChanges('/api/classes/', {}, self.class_obj.save)
+        enrolled = User.objects.create(username='etag_enrolled')
+        self.assertTagChanges('/api/classes/', {}, lambda: roster.enroll(self.class_obj.id, {enrolled.id: 'Student'}))
+        self.assertTagChanges('/api/classes/', {}, lambda: Class.objects.filter(id=self.class_obj.id).delete())
+
+    def test_pages_have_their_own_tags(self):
+        params = {'set_id': self.flashcard_set.id}
+        self.assertNotEqual(self.tag('/api/flashcards/set/', params),
+                            self.tag('/api/flashcards/set/', {**params, 'page_size': 1}))
+
+    def test_unknown_user_gets_no_tag(self):
+        response = self.client.get('/api/flashcards/', {'username': 'nobody'})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class LeaderboardTests(TestCase):
+    """Rankings are kept sorted in memory, updated in place and reloaded after other workers' writes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(username=f'ranked_{i}') for i in range(5)])
+        class_obj = Class.objects.create(class_name='Ranked', class_number='RNK-1')
+        cls.flashcard_set = FlashcardSet.objects.create(class_obj=class_obj, name='Ranked', creator=cls.users[0])
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+        cache.get_cache().clear()
+        leaderboard._rankings.clear()
+
+    def test_rank_window_and_around(self):
+        ranking = leaderboard.SetRanking([(1, 50), (2, 90), (3, 50), (4, 10)])
+        self.assertEqual([ranking.rank(user_id) for user_id in (2, 1, 3, 4, 5)], [1, 2, 3, 4, None])
+        self.assertEqual(ranking.window(1, 3), [(2, 1, 50), (3, 3, 50)])
+        self.assertEqual(ranking.window(-2, 1), [(1, 2, 90)])
+        self.assertEqual(ranking.around(2, 1), [(1, 2, 90), (2, 1, 50)])
+        self.assertEqual(ranking.around(3, 5), ranking.top(10))
+        self.assertEqual(ranking.around(5, 1), [])
+
+        ranking.upsert(4, 95)
+        ranking.upsert(6, 0)
+        self.assertEqual((ranking.rank(4), ranking.rank(2), ranking.rank(6), len(ranking)), (1, 2, 5, 5))
+
+    def submit(self, scores):
+        response = self.client.post('/api/leaderboard/submit/', json.dumps({
+            'set_id': self.flashcard_set.id,
+            'scores': [{'username': f'ranked_{i}', 'score': score} for i, score in scores.items()]
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def top(self):
+        response = self.client.get('/api/leaderboard/top/', {'set_id': self.flashcard_set.id, 'k': 3})
+        return [(entry['username'], entry['score']) for entry in response.json()['results']]
+
+    def test_submissions_are_applied_in_place(self):
+        self.submit({0: 10, 1: 30, 2: 20})
+        self.assertEqual(self.top(), [('ranked_1', 30), ('ranked_2', 20), ('ranked_0', 10)])
+        self.submit({0: 40, 3: 25})
+        with self.assertNumQueries(1):  # usernames only; the ranking is not reloaded
+            self.assertEqual(self.top(), [('ranked_0', 40), ('ranked_1', 30), ('ranked_3', 25)])
+        response = self.client.get('/api/leaderboard/rank/', {'set_id': self.flashcard_set.id,
+                                                              'username': 'ranked_3', 'radius': 1})
+        self.assertEqual(response.json()['rank'], 3)
+        self.assertEqual([entry['username'] for entry in response.json()['results']],
+                         ['ranked_1', 'ranked_3', 'ranked_2'])
+
+    def other_worker_writes(self, user, score):
+        FlashcardSetLeaderboard.objects.filter(flashcard_set=self.flashcard_set, user=user).update(score=score)
+        counters.bump_list_version(leaderboard.version_name(self.flashcard_set.id))
+
+    def test_reloads_after_another_workers_submission(self):
+        self.submit({0: 10, 1: 30})
+        self.assertEqual(self.top()[0], ('ranked_1', 30))
+        # through a shared cache, the other worker's generation bump reaches this one
+        self.other_worker_writes(self.users[0], 50)
+        leaderboard._bump_generation(self.flashcard_set.id)
+        self.assertEqual(self.top()[0], ('ranked_0', 50))
+
+    def test_reloads_after_max_age_without_a_shared_cache(self):
+        self.submit({0: 10, 1: 30})
+        self.other_worker_writes(self.users[0], 50)
+        self.assertEqual(self.top()[0], ('ranked_1', 30))
+        with override_settings(FLASHCARDS_LEADERBOARD_MAX_AGE=0):
+            self.assertEqual(self.top()[0], ('ranked_0', 50))
+
+    @override_settings(FLASHCARDS_LEADERBOARD_MAX_AGE=0)
+    def test_aged_ranking_is_kept_while_its_version_holds(self):
+        self.submit({0: 10, 1: 30})
+        with self.assertNumQueries(2):  # the version row and usernames; no scores reloaded
+            self.assertEqual(self.top()[0], ('ranked_1', 30))
+
+    def test_one_caller_rebuilds_while_the_others_wait(self):
+        calls = []
+
+        def slow_load(set_id):
+            calls.append(set_id)
+            time.sleep(0.05)
+            return 1, leaderboard.SetRanking([(1, 10)])
+
+        with mock.patch.object(leaderboard, '_load', slow_load):
+            threads = [threading.Thread(target=leaderboard.get_ranking, args=(self.flashcard_set.id,))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(calls, [self.flashcard_set.id])
+
+
+@override_settings(FLASHCARDS_STUDY_TIME_FLUSH_INTERVAL=0)
+class StudyTimeTests(TestCase):
+    """Heartbeats are summed in memory and written by one flush, which keeps them if it fails"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='studying_user')
+        class_obj = Class.objects.create(class_name='Study', class_number='STU-1')
+        cls.sets = FlashcardSet.objects.bulk_create([FlashcardSet(class_obj=class_obj, name=f'Study {i}',
+                                                                  creator=cls.user) for i in range(30)])
+
+    def make_buffer(self):
+        buffer = study_time.StudyTimeBuffer()
+        self.addCleanup(atexit.unregister, buffer.shutdown)
+        return buffer
+
+    def time_spent(self):
+        return dict(FlashcardSetStudyTime.objects.filter(user=self.user).values_list('flashcard_set_id', 'time_spent'))
+
+    def test_heartbeats_are_buffered_until_flushed(self):
+        client = self.client_class(HTTP_HOST='localhost')
+        first, second = self.sets[:2]
+        for set_id, seconds in ((first.id, 30), (second.id, 10), (first.id, 20)):
+            response = client.post('/api/study-time/heartbeat/', {'username': 'studying_user', 'set_id': set_id,
+                                                                  'seconds': seconds}, content_type='application/json')
+            self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.time_spent(), {})
+        self.assertFalse(study_time.buffer._thread)
+
+        self.assertEqual(study_time.flush(), 2)
+        self.assertEqual(self.time_spent(), {first.id: 50, second.id: 10})
+        study_time.buffer.add(first.id, self.user.id, 5)
+        study_time.flush()
+        self.assertEqual(self.time_spent(), {first.id: 55, second.id: 10})
+
+    def test_flush_queries_do_not_grow_with_rows(self):
+        def queries(sets):
+            buffer = self.make_buffer()
+            for flashcard_set in sets:
+                buffer.add(flashcard_set.id, self.user.id, 1)
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(buffer.flush(), len(sets))
+            return len(ctx)
+
+        self.assertEqual(queries(self.sets[:3]), queries(self.sets))
+        self.assertEqual(set(self.time_spent().values()), {1, 2})
+
+    def test_failed_flush_keeps_the_seconds_and_is_reported(self):
+        buffer = self.make_buffer()
+        buffer.add(self.sets[0].id, self.user.id, 30)
+        with mock.patch.object(study_time, 'write_increments', side_effect=DatabaseError('database is gone')):
+            with self.assertRaises(DatabaseError):
+                buffer.flush()
+            self.assertEqual(buffer.pending(), {(self.sets[0].id, self.user.id): 30})
+            with self.assertLogs('flashcards.study_time', 'ERROR') as logs:
+                buffer.shutdown()
+        self.assertIn('1 rows lost', logs.output[0])
+        self.assertEqual(self.time_spent(), {})
+
+    def test_benchmark_database_is_flushed_before_it_is_destroyed(self):
+        pending_at_teardown = []
+        with mock.patch.object(connection.creation, 'create_test_db'), \
+                mock.patch.object(connection.creation, 'destroy_test_db',
+                                  side_effect=lambda *args: pending_at_teardown.append(study_time.buffer.pending())), \
+                mock.patch.object(benchmarks, 'setup_test_environment'), \
+                mock.patch.object(benchmarks, 'teardown_test_environment'):
+            with benchmarks.isolated_database():
+                study_time.buffer.add(self.sets[0].id, self.user.id, 30)
+        self.assertEqual(pending_at_teardown, [{}])
+        self.assertEqual(self.time_spent(), {self.sets[0].id: 30})
+
+
+class BoardSocketTests(TestCase):
+    """Board WebSockets authenticate by token, admit class members only and deliver each message once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create(username='board_member')
+        cls.outsider = User.objects.create(username='board_outsider')
+        cls.class_obj = Class.objects.create(class_name='Board', class_number='BRD-1')
+        ClassMember.objects.create(user=cls.member, class_obj=cls.class_obj, role_in_class='Student')
+        cls.board = MessageBoard.objects.create(class_obj=cls.class_obj)
+        Message.objects.create(board=cls.board, user=cls.member, message_text='Earlier')
+
+    def connect(self, query=b'', headers=()):
+        scope = {'type': 'websocket', 'path': f'/ws/classes/{self.class_obj.id}/board/', 'query_string': query,
+                 'headers': list(headers)}
+        inbox, outbox = asyncio.Queue(), asyncio.Queue()
+        inbox.put_nowait({'type': 'websocket.connect'})
+        task = asyncio.create_task(realtime.board_socket(scope, inbox.get, outbox.put))
+        return inbox, outbox, task
+
+    def token_query(self, user):
+        return f'token={issue_token(user)}'.encode()
+
+    async def next_event(self, outbox):
+        return await asyncio.wait_for(outbox.get(), 5)
+
+    async def next_text(self, outbox):
+        return json.loads((await self.next_event(outbox))['text'])['message']
+
+    async def close(self, inbox, task):
+        inbox.put_nowait({'type': 'websocket.disconnect'})
+        await task
+
+    async def test_callers_without_a_members_token_are_rejected(self):
+        for query, code in ((b'username=board_member', 4401), (b'token=forged', 4401),
+                            (self.token_query(self.outsider), 4403)):
+            _, outbox, task = self.connect(query)
+            self.assertEqual(await self.next_event(outbox), {'type': 'websocket.close', 'code': code})
+            await task
+
+    async def test_members_get_backfill_and_each_posted_message(self):
+        header = (b'authorization', f'Bearer {issue_token(self.member)}'.encode())
+        sockets = [self.connect(self.token_query(self.member)), self.connect(headers=[header])]
+        for _, outbox, _ in sockets:
+            self.assertEqual((await self.next_event(outbox))['type'], 'websocket.accept')
+            self.assertEqual(await self.next_text(outbox), 'Earlier')
+
+        sockets[0][0].put_nowait({'type': 'websocket.receive', 'text': json.dumps({'message': ' Hello '})})
+        for _, outbox, _ in sockets:
+            self.assertEqual(await self.next_text(outbox), 'Hello')
+        for inbox, outbox, task in sockets:
+            await self.close(inbox, task)
+            self.assertTrue(outbox.empty())
+        self.assertEqual(await Message.objects.filter(board=self.board, user=self.member).acount(), 2)
+
+    async def test_message_published_during_backfill_is_sent_once(self):
+        backfill = realtime._backfill
+
+        def backfill_racing_a_post(board_id):
+            # posted by someone else after this socket subscribed, before its backfill query ran
+            message = Message.objects.create(board_id=board_id, user=self.member, message_text='Racing')
+            payload = realtime.serialize_message(message.id, self.member.id, 'board_member', 'Racing',
+                                                 message.timestamp)
+            async_to_sync(realtime.broker.publish)(board_id, message.id, payload)
+            return backfill(board_id)
+
+        with mock.patch.object(realtime, '_backfill', backfill_racing_a_post):
+            inbox, outbox, task = self.connect(self.token_query(self.member))
+            self.assertEqual((await self.next_event(outbox))['type'], 'websocket.accept')
+            self.assertEqual([await self.next_text(outbox), await self.next_text(outbox)], ['Earlier', 'Racing'])
+        inbox.put_nowait({'type': 'websocket.receive', 'text': json.dumps({'message': 'After'})})
+        self.assertEqual(await self.next_text(outbox), 'After')
+        await self.close(inbox, task)
+
+
+class HistoryTests(TestCase):
+    """Board history pages by (timestamp, id) cursors in both directions, exports everything and admits members only"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create(username='history_member')
+        User.objects.create(username='history_outsider')
+        cls.class_obj = Class.objects.create(class_name='History', class_number='HIS-1')
+        ClassMember.objects.create(user=cls.member, class_obj=cls.class_obj, role_in_class='Student')
+        board = MessageBoard.objects.create(class_obj=cls.class_obj)
+        Message.objects.bulk_create([Message(board=board, user=cls.member, message_text=f'M{i}') for i in range(7)])
+        # two pairs share a timestamp, so pages have to break ties by id
+        start = timezone.now() - timedelta(minutes=1)
+        for i, message in enumerate(Message.objects.filter(board=board).order_by('id')):
+            message.timestamp = start + timedelta(seconds=i // 2)
+            message.save(update_fields=['timestamp'])
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+
+    def get(self, url='/api/boards/history/', **params):
+        if url == '/api/boards/history/':
+            params = {'class_id': self.class_obj.id, 'username': 'history_member', **params}
+        return self.client.get(url, params)
+
+    def texts(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['text'] for row in response.json()['results']]
+
+    def test_pages_walk_back_and_forward(self):
+        newest = self.get(page_size=3)
+        self.assertEqual(self.texts(newest), ['M4', 'M5', 'M6'])
+        middle = self.get(newest.json()['older'])
+        self.assertEqual(self.texts(middle), ['M1', 'M2', 'M3'])
+        oldest = self.get(middle.json()['older'])
+        self.assertEqual(self.texts(oldest), ['M0'])
+        self.assertIsNone(oldest.json()['older'])
+
+        forward = self.get(oldest.json()['newer'])
+        self.assertEqual(self.texts(forward), ['M1', 'M2', 'M3'])
+        self.assertEqual(self.texts(self.get(forward.json()['newer'])), ['M4', 'M5', 'M6'])
+
+    def test_polling_newer_returns_only_new_messages(self):
+        newer = self.get().json()['newer']
+        self.assertEqual(self.texts(self.get(newer)), [])
+        Message.objects.create(board_id=MessageBoard.objects.get(class_obj=self.class_obj).id, user=self.member,
+                               message_text='Later')
+        self.assertEqual(self.texts(self.get(newer)), ['Later'])
+
+    def test_export_streams_the_whole_board(self):
+        response = self.get(export='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line)['text'] for line in lines], [f'M{i}' for i in range(7)])
+
+    def test_bad_requests_are_rejected(self):
+        self.assertEqual(self.get(before='not a cursor').status_code, 400)
+        self.assertEqual(self.get(after=encode_cursor({'ts': 'yesterday', 'id': 1})).status_code, 400)
+        self.assertEqual(self.get(class_id='abc').status_code, 400)
+        self.assertEqual(self.get(username='nobody').status_code, 404)
+        self.assertEqual(self.get(username='history_outsider').status_code, 403)
+        self.assertEqual(self.get(username='history_outsider', export='1').status_code, 403)
+
+
+class SchedulingTests(TestCase):
+    """SM-2 updates, batch review submission and the new-card queue"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='review_user')
+        class_obj = Class.objects.create(class_name='Reviews', class_number='REV-1')
+        cls.flashcard_set = FlashcardSet.objects.create(class_obj=class_obj, name='Reviews', creator=cls.user)
+        insert_flashcards(cls.user.id, cls.flashcard_set, [{'question': f'Q{i}', 'answer': f'A{i}'} for i in range(10)])
+        cls.card_ids = list(Flashcard.objects.filter(flashcard_set=cls.flashcard_set).order_by('id')
+                            .values_list('id', flat=True))
+
+    def submit(self, reviews):
+        response = self.client.post('/api/reviews/submit/', json.dumps({'username': 'review_user', 'reviews': reviews}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_apply_review_follows_sm2(self):
+        now = timezone.now()
+        state = CardReviewState(ease=2.5, interval=0, repetitions=0)
+        steps = []
+        for quality in (5, 5, 4, 1):
+            scheduling.apply_review(state, quality, now)
+            steps.append((state.repetitions, state.interval, round(state.ease, 2)))
+        self.assertEqual(steps, [(1, 1, 2.6), (2, 6, 2.7), (3, 16, 2.7), (0, 1, 2.16)])
+        self.assertEqual(state.due_at, now + timedelta(days=1))
+        for _ in range(10):
+            scheduling.apply_review(state, 0, now)
+        self.assertEqual(state.ease, scheduling.MIN_EASE)
+
+    def test_batch_submit_creates_and_updates_states(self):
+        first, second = self.card_ids[:2]
+        result = self.submit([{'card_id': first, 'quality': 5}, {'card_id': second, 'quality': True},
+                              {'card_id': 0, 'quality': 3}, {'card_id': second, 'quality': 6}, 'bad'])
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual([error['index'] for error in result['errors']], [1, 2, 3, 4])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.submit([{'card_id': first, 'quality': 5}, {'card_id': second, 'quality': 2}])
+        # cards and states read once each, then one INSERT and one UPDATE
+        statements = [query['sql'].split()[0] for query in ctx.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(statements, ['SELECT', 'SELECT', 'INSERT', 'UPDATE'])
+        states = {state.flashcard_id: state for state in CardReviewState.objects.filter(user=self.user)}
+        self.assertEqual((states[first].repetitions, states[first].interval), (2, 6))
+        self.assertEqual((states[second].repetitions, states[second].interval), (0, 1))
+
+    def test_racing_first_reviews_do_not_collide(self):
+        card_id = self.card_ids[0]
+        self.submit([{'card_id': card_id, 'quality': 5}])
+        # as if another request inserted the state after this one looked
+        with mock.patch.object(CardReviewState.objects, 'filter', return_value=CardReviewState.objects.none()):
+            updated, errors = scheduling.submit_reviews(self.user.id, [{'card_id': card_id, 'quality': 1}],
+                                                        timezone.now())
+        self.assertEqual((updated, errors), (1, []))
+        self.assertEqual(CardReviewState.objects.get(user=self.user, flashcard_id=card_id).repetitions, 0)
+
+    def test_new_cards_start_after_the_mark(self):
+        self.submit([{'card_id': card_id, 'quality': 5} for card_id in self.card_ids[:6]])
+        for set_id in (None, self.flashcard_set.id):
+            cards = scheduling.due_cards(self.user.id, 2, timezone.now(), set_id=set_id)
+            self.assertEqual([card['id'] for card in cards], self.card_ids[6:8])
+            self.assertEqual(NewCardMark.objects.get(user=self.user, scope=set_id or 0).last_card_id,
+                             self.card_ids[5])
+
+        # the reviewed cards are not looked at again, and an exhausted queue moves the mark to the end
+        self.submit([{'card_id': card_id, 'quality': 5} for card_id in self.card_ids[6:]])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(scheduling.new_cards(self.user.id, 5), [])
+        self.assertIn(f'> {self.card_ids[5]}', ctx.captured_queries[1]['sql'])
+        self.assertEqual(NewCardMark.objects.get(user=self.user, scope=0).last_card_id, self.card_ids[-1])
+
+        Flashcard.objects.create(flashcard_set=self.flashcard_set, class_obj_id=self.flashcard_set.class_obj_id,
+                                 creator=self.user, front_text='Later', back_text='Card')
+        self.assertEqual([card['front_text'] for card in scheduling.new_cards(self.user.id, 5)], ['Later'])
+
+    def test_non_integer_set_id_is_rejected(self):
+        response = self.client.get('/api/reviews/due/', {'username': 'review_user', 'set_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchTests(TestCase):
+    """Search requires every word, matches the last as a prefix, ranks matches and pages through them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='search_user')
+        cls.class_obj = Class.objects.create(class_name='Biology', class_number='BIO-1')
+        other_class = Class.objects.create(class_name='Physics', class_number='PHY-1')
+        cls.flashcard_set = FlashcardSet.objects.create(class_obj=cls.class_obj, name='Bio', creator=user)
+        other_set = FlashcardSet.objects.create(class_obj=other_class, name='Phys', creator=user)
+        insert_flashcards(user.id, cls.flashcard_set, [
+            {'question': 'What is photosynthesis?', 'answer': 'Plants turning light into sugar'},
+            {'question': 'Where does photosynthesis happen?', 'answer': 'In the chloroplast'},
+            {'question': 'Plant cell walls', 'answer': 'Made of cellulose'},
+        ] + [{'question': f'Enzyme {i}', 'answer': 'enzyme ' * (i + 1)} for i in range(5)])
+        insert_flashcards(user.id, other_set, [{'question': 'Photon energy', 'answer': 'E = hf'}])
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+
+    def search(self, q, **params):
+        response = self.client.get('/api/flashcards/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def fronts(self, q, **params):
+        return sorted(card['front_text'] for card in self.search(q, **params)['results'])
+
+    def test_queries_are_quoted_for_both_backends(self):
+        self.assertEqual(search.fts5_query('cell walls'), '"cell" "walls"*')
+        self.assertEqual(search.tsquery("cell walls"), "'cell' & 'walls':*")
+        self.assertEqual(search.tsquery("it's (NOT) a | b"), "'it' & 's' & 'NOT' & 'a' & 'b':*")
+        self.assertIsNone(search.tsquery('?!'))
+
+    def test_last_word_matches_as_a_prefix(self):
+        self.assertEqual(self.fronts('photo'), ['Photon energy', 'What is photosynthesis?',
+                                                'Where does photosynthesis happen?'])
+        self.assertEqual(self.fronts('photosynthesis chloro'), ['Where does photosynthesis happen?'])
+        self.assertEqual(self.fronts('photo', class_id=self.class_obj.id),
+                         ['What is photosynthesis?', 'Where does photosynthesis happen?'])
+        self.assertEqual(self.fronts('"; DROP TABLE'), [])
+
+    def test_pages_seek_past_the_last_result(self):
+        everything = self.search('enzyme', page_size=100)['results']
+        self.assertEqual(len(everything), 5)
+        self.assertEqual([card['rank'] for card in everything], sorted((c['rank'] for c in everything), reverse=True))
+
+        seen, page = [], self.search('enzyme', page_size=2)
+        while True:
+            seen += page['results']
+            if not page['next']:
+                break
+            page = self.client.get(page['next']).json()
+        self.assertEqual([card['id'] for card in seen], [card['id'] for card in everything])
+
+    def test_invalid_cursors_are_rejected(self):
+        for cursor in ('garbage', encode_cursor({'rank': 'high', 'id': 1}), encode_cursor({'rank': 1.5})):
+            response = self.client.get('/api/flashcards/search/', {'q': 'enzyme', 'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+
+    def test_non_integer_filters_are_rejected(self):
+        for params in ({'class_id': 'abc'}, {'set_id': '1.5'}, {'set_id': '-1'}):
+            response = self.client.get('/api/flashcards/search/', {'q': 'enzyme', **params})
+            self.assertEqual(response.status_code, 400, params)
+        page = self.search('enzyme', class_id=self.class_obj.id, set_id=self.flashcard_set.id)
+        self.assertEqual(len(page['results']), 5)
+
+
+class NearDuplicateTests(TestCase):
+    """Cards are indexed on write, lookups only read, and merging never deletes a card unlike the one kept"""
+    WORDS = ' '.join(f'word{i}' for i in range(60))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='dedup_user')
+        cls.class_obj = Class.objects.create(class_name='Chemistry', class_number='CHEM-1')
+        cls.flashcard_set = FlashcardSet.objects.create(class_obj=cls.class_obj, name='Chem', creator=cls.user)
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+
+    def add_cards(self, *fronts):
+        return insert_flashcards(self.user.id, self.flashcard_set,
+                                 [{'question': front, 'answer': 'same answer'} for front in fronts])['ids']
+
+    def similar(self, card_id, **params):
+        response = self.client.get('/api/flashcards/similar/', {'card_id': card_id, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return {card['id']: card['similarity'] for card in response.json()['results']}
+
+    def test_cards_are_indexed_on_write(self):
+        card_id, = self.add_cards('What is an ionic bond?')
+        self.assertEqual(LSHBucket.objects.filter(flashcard_id=card_id).count(), dedup.BANDS)
+        old_signature = bytes(FlashcardSignature.objects.get(flashcard_id=card_id).signature)
+
+        card = Flashcard.objects.get(id=card_id)
+        card.front_text = 'What is a covalent bond?'
+        card.save()
+        self.assertNotEqual(bytes(FlashcardSignature.objects.get(flashcard_id=card_id).signature), old_signature)
+        # indexing again adds nothing twice
+        dedup.index_class(self.class_obj.id)
+        self.assertEqual(LSHBucket.objects.filter(flashcard_id=card_id).count(), dedup.BANDS)
+
+    def test_threshold_decides_what_counts_as_a_duplicate(self):
+        original, near, unrelated = self.add_cards(self.WORDS, self.WORDS + ' ok', 'Avogadro constant')
+        matches = self.similar(original)
+        self.assertEqual(list(matches), [near])
+        self.assertGreater(matches[near], dedup.DEFAULT_THRESHOLD)
+        self.assertEqual(self.similar(original, threshold=1), {})
+
+    def test_lookup_only_reads(self):
+        original, = self.add_cards(self.WORDS)
+        # written without signals, as generated data is
+        unindexed, = Flashcard.objects.bulk_create([Flashcard(
+            flashcard_set=self.flashcard_set, class_obj=self.class_obj, creator=self.user,
+            front_text=self.WORDS + ' ok', back_text='same answer'
+        )])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIn(original, self.similar(unindexed.id))
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in queries.captured_queries))
+        self.assertFalse(FlashcardSignature.objects.filter(flashcard_id=unindexed.id).exists())
+
+    def test_merge_keeps_cards_that_only_chain_to_the_kept_card(self):
+        # a~b and b~c are above the threshold, a~c is not
+        step = len(self.WORDS) // 12
+        a, b, c = self.add_cards(self.WORDS[:-2 * step], self.WORDS[step:-step], self.WORDS[2 * step:])
+        clusters = dedup.duplicate_clusters(self.class_obj.id)
+        self.assertEqual(clusters, [[a, b, c]])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(dedup.merge_clusters(clusters), 1)
+        self.assertEqual(sum(query['sql'].startswith('DELETE FROM "flashcards_flashcard"')
+                             for query in queries.captured_queries), 1)
+        self.assertEqual(sorted(Flashcard.objects.filter(class_obj=self.class_obj).values_list('id', flat=True)),
+                         [a, c])
+
+
+class DeckFileTests(TestCase):
+    """Exported decks read back unchanged, and import errors point at the line of the file they came from"""
+    CARDS = [
+        ('#include <stdio.h>', 'Preprocessor directive'),
+        ('#tags: not a header', '#html:true'),
+        ('Multi-line', 'first line\n#second line starts with a hash'),
+        ('Tab\there', 'Comma, "quotes"'),
+        ('Unicode ü', '→ ✓'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='deck_user')
+        class_obj = Class.objects.create(class_name='Decks', class_number='DCK-1')
+        cls.flashcard_set = FlashcardSet.objects.create(class_obj=class_obj, name='Deck', creator=user)
+        insert_flashcards(user.id, cls.flashcard_set,
+                          [{'question': question, 'answer': answer} for question, answer in cls.CARDS])
+
+    def read(self, text, fmt):
+        return list(decks.read_deck(decks.decode_lines(io.BytesIO(text.encode())), fmt))
+
+    def test_round_trip(self):
+        for fmt in decks.FORMATS:
+            with self.subTest(fmt=fmt):
+                text = ''.join(decks.export_deck(self.flashcard_set.id, fmt))
+                rows = self.read(text, fmt)
+                self.assertEqual([(row['question'], row['answer']) for row in rows], self.CARDS)
+
+    def test_errors_carry_file_line_numbers(self):
+        files = {
+            'csv': ('question,answer\nQ,A\nQ3,\nQ4,A4\nonly one column\n', [3, 5]),
+            'tsv': ('#separator:tab\n#html:false\nQ1\tA1\n\nbad row\n"multi\nline"\tA\nanother bad\n', [5, 8]),
+            'jsonl': ('{"question": "Q", "answer": "A"}\n\nnot json\n{"question": "Q"}\n[1, 2]\n', [3, 4, 5]),
+        }
+        for fmt, (text, lines) in files.items():
+            with self.subTest(fmt=fmt):
+                result = insert_flashcards(self.flashcard_set.creator_id, self.flashcard_set, self.read(text, fmt))
+                self.assertEqual([error['line'] for error in result['errors']], lines)
+
+    def test_import_command_reports_lines(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('{"question": "Q", "answer": "A"}\n[1, 2]\n')
+        self.addCleanup(os.unlink, f.name)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_deck', f.name, self.flashcard_set.id, stdout=out, stderr=err)
+        self.assertIn('Imported 1 cards', out.getvalue())
+        self.assertIn('line 2: Row must be an object', err.getvalue())
+
+
+class DashboardTests(TestCase):
+    """The dashboard runs the same number of queries however many classes and sets the user has"""
+    # user id lookup, memberships + classes, sets + card counts, recent study time + sets
+    QUERIES = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='dashboard_user')
+        cls.other = User.objects.create(username='dashboard_other')
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+        cache.get_cache().clear()
+
+    def add_class(self, i, cards):
+        class_obj = Class.objects.create(class_name=f'Dashboard {i}', class_number=f'DB-{i}')
+        ClassMember.objects.create(user=self.user, class_obj=class_obj, role_in_class='Leader' if i % 2 else 'Student')
+        flashcard_set = FlashcardSet.objects.create(class_obj=class_obj, name=f'Set {i}', creator=self.user)
+        insert_flashcards(self.other.id, flashcard_set, [{'question': f'Q{j}', 'answer': f'A{j}'} for j in range(cards)])
+        FlashcardSetStudyTime.objects.create(flashcard_set=flashcard_set, user=self.user, time_spent=60 * i)
+        return flashcard_set
+
+    def fetch(self):
+        cache.get_cache().clear()
+        with self.assertNumQueries(self.QUERIES):
+            response = self.client.get('/api/dashboard/', {'username': self.user.username})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_empty(self):
+        data = self.fetch()
+        self.assertEqual((data['classes'], data['flashcard_sets'], data['recent_study']), ([], [], []))
+        self.assertEqual(data['card_count'], 0)
+
+    def test_query_count_is_constant(self):
+        self.add_class(1, cards=3)
+        data = self.fetch()
+        self.assertEqual(len(data['classes']), 1)
+
+        sets = [self.add_class(i, cards=i) for i in range(2, 12)]
+        data = self.fetch()
+        self.assertEqual(len(data['classes']), 11)
+        self.assertEqual({c['role_in_class'] for c in data['classes']}, {'Leader', 'Student'})
+
+        counts = {s['id']: s['card_count'] for s in data['flashcard_sets']}
+        self.assertEqual(len(counts), 11)
+        for i, flashcard_set in enumerate(sets, start=2):
+            self.assertEqual(counts[flashcard_set.id], i)
+        self.assertEqual(data['card_count'], 3 + sum(range(2, 12)))
+        self.assertEqual(len(data['recent_study']), 10)
+
+    def test_unknown_user(self):
+        response = self.client.get('/api/dashboard/', {'username': 'nobody'})
+        self.assertEqual(response.status_code, 404)
+
+
+class CounterTests(TestCase):
+    """card_count and member_count follow every write path, and reconcile_counts repairs drift"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(username=f'counter_user_{i}') for i in range(3)])
+
+    def setUp(self):
+        self.class_obj = Class.objects.create(class_name='Counters', class_number='CNT-1')
+        self.flashcard_set = FlashcardSet.objects.create(class_obj=self.class_obj, name='Set', creator=self.users[0])
+
+    def card(self, flashcard_set=None, class_obj=None):
+        return Flashcard.objects.create(flashcard_set=flashcard_set or self.flashcard_set,
+                                        class_obj=class_obj or self.class_obj,
+                                        creator=self.users[0], front_text='Q', back_text='A')
+
+    def assertCounts(self, cards=None, members=None):
+        if cards is not None:
+            self.flashcard_set.refresh_from_db()
+            self.assertEqual(self.flashcard_set.card_count, cards)
+        if members is not None:
+            self.class_obj.refresh_from_db()
+            self.assertEqual(self.class_obj.member_count, members)
+
+    def test_card_writes(self):
+        first = self.card()
+        self.card()
+        self.assertCounts(cards=2)
+        first.front_text = 'Edited'
+        first.save()
+        self.assertCounts(cards=2)
+        first.delete()
+        self.assertCounts(cards=1)
+
+        insert_flashcards(self.users[1].id, self.flashcard_set, [{'question': 'Q', 'answer': 'A'}] * 5 + [{}])
+        self.assertCounts(cards=6)
+        ids = list(Flashcard.objects.filter(flashcard_set=self.flashcard_set).values_list('id', flat=True)[:4])
+        Flashcard.objects.filter(id__in=ids).delete()
+        self.assertCounts(cards=2)
+
+    def test_cascades(self):
+        other_class = Class.objects.create(class_name='Other', class_number='CNT-2')
+        self.card()
+        self.card(class_obj=other_class)
+        self.assertCounts(cards=2)
+        # a card in this set that belongs to another class goes with that class
+        other_class.delete()
+        self.assertCounts(cards=1)
+
+        doomed = FlashcardSet.objects.create(class_obj=self.class_obj, name='Doomed', creator=self.users[0])
+        self.card(flashcard_set=doomed)
+        doomed.delete()
+        self.assertCounts(cards=1)
+
+    def test_member_writes(self):
+        members = [ClassMember.objects.create(user=user, class_obj=self.class_obj, role_in_class='Student')
+                   for user in self.users]
+        self.assertCounts(members=3)
+        members[0].delete()
+        self.assertCounts(members=2)
+        self.users[1].delete()
+        self.assertCounts(members=1)
+
+    def test_reconcile(self):
+        for _ in range(3):
+            self.card()
+        ClassMember.objects.create(user=self.users[0], class_obj=self.class_obj, role_in_class='Leader')
+        FlashcardSet.objects.filter(id=self.flashcard_set.id).update(card_count=10)
+        Class.objects.filter(id=self.class_obj.id).update(member_count=0)
+
+        self.assertEqual(counters.reconcile_card_counts(dry_run=True), 1)
+        self.assertEqual(counters.reconcile_card_counts(batch_size=1), 1)
+        self.assertEqual(counters.reconcile_member_counts(), 1)
+        self.assertEqual(counters.reconcile_card_counts(), 0)
+        self.assertCounts(cards=3, members=1)
+
+
+class AsyncViewParityTests(TestCase):
+    """Each async read view returns the same status, body and ETag as the sync view it can replace"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='parity_user')
+        cls.class_obj = Class.objects.create(class_name='Parity', class_number='PAR-1')
+        ClassMember.objects.create(user=cls.user, class_obj=cls.class_obj, role_in_class='Leader')
+        cls.flashcard_set = FlashcardSet.objects.create(class_obj=cls.class_obj, name='Parity set', creator=cls.user)
+        insert_flashcards(cls.user.id, cls.flashcard_set, [{'question': f'Q{i}', 'answer': f'A{i}'} for i in range(7)])
+        FlashcardSetStudyTime.objects.create(flashcard_set=cls.flashcard_set, user=cls.user, time_spent=90)
+
+    def setUp(self):
+        self.factory = RequestFactory(HTTP_HOST='localhost')
+
+    def call_both(self, name, params, **headers):
+        request = self.factory.get('/api/', params, headers=headers)
+        sync_response = getattr(views, name)(request)
+        if hasattr(sync_response, 'render'):
+            sync_response.render()
+        cache.get_cache().clear()
+        async_response = async_to_sync(getattr(async_views, name))(self.factory.get('/api/', params, headers=headers))
+        cache.get_cache().clear()
+        return sync_response, async_response
+
+    def assertSameResponse(self, name, params, **headers):
+        sync_response, async_response = self.call_both(name, params, **headers)
+        self.assertEqual(sync_response.status_code, async_response.status_code, name)
+        if sync_response.status_code == 200:
+            self.assertEqual(json.loads(sync_response.content), json.loads(async_response.content), name)
+        self.assertEqual(sync_response.get('ETag'), async_response.get('ETag'), name)
+        return sync_response
+
+    def test_bodies_match(self):
+        user = {'username': self.user.username}
+        for name, params in (
+            ('get_flashcards', user),
+            ('get_flashcards', {**user, 'page_size': 3}),
+            ('get_flashcard_sets', user),
+            ('get_user_classes', user),
+            ('list_classes', {}),
+            ('dashboard', user),
+            ('get_flashcards_in_set', {'set_id': self.flashcard_set.id}),
+            ('get_flashcards_in_set', {'set_id': self.flashcard_set.id, 'page_size': 5}),
+            ('get_flashcards', {'username': 'nobody'}),
+            ('get_flashcards_in_set', {'set_id': 0}),
+            ('get_flashcards', {**user, 'cursor': 'not a cursor'}),
+        ):
+            self.assertSameResponse(name, params)
+
+    def test_token_without_username(self):
+        token = {'authorization': f'Bearer {issue_token(self.user)}'}
+        for name in ('get_flashcards', 'get_flashcard_sets', 'get_user_classes', 'dashboard'):
+            self.assertEqual(self.assertSameResponse(name, {}, **token).status_code, 200, name)
+            self.assertEqual(self.assertSameResponse(name, {}).status_code, 400, name)
+
+    def test_not_modified(self):
+        params = {'set_id': self.flashcard_set.id}
+        tag = self.assertSameResponse('get_flashcards_in_set', params)['ETag']
+        sync_response, async_response = self.call_both('get_flashcards_in_set', params, if_none_match=tag)
+        self.assertEqual((sync_response.status_code, async_response.status_code), (304, 304))
+
+    def test_stream(self):
+        request = self.factory.get('/api/', {'username': self.user.username, 'stream': '1'})
+
+        async def read():
+            response = await async_views.get_flashcards(request)
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        lines = async_to_sync(read)().decode().splitlines()
+        self.assertEqual([json.loads(line)['front_text'] for line in lines], [f'Q{i}' for i in range(7)])
+
+
+@override_settings(FLASHCARDS_METRICS_TOKEN='scrape')
+class RequestMetricsTests(TestCase):
+    """The metrics middleware counts each request's queries and exposes them at /metrics"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='metrics_user')
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+        cache.get_cache().clear()
+        metrics.reset()
+
+    def scrape(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_records_queries_per_view(self):
+        # cold: user lookup, ETag aggregate and the listing; warm: only the ETag aggregate
+        self.client.get('/api/flashcards/', {'username': self.user.username})
+        self.client.get('/api/flashcards/', {'username': self.user.username})
+        text = self.scrape()
+        self.assertIn('flashcards_request_duration_seconds_count{view="get_flashcards"} 2', text)
+        self.assertIn('flashcards_request_queries_sum{view="get_flashcards"} 4', text)
+        self.assertIn('flashcards_request_queries_bucket{view="get_flashcards",le="1"} 1', text)
+        self.assertIn('flashcards_requests_total{method="GET",status="200",view="get_flashcards"} 2', text)
+        self.assertIn('flashcards_response_size_bytes_sum{view="get_flashcards"} 4', text)
+
+    def test_streamed_bodies_are_measured_once_drained(self):
+        class_obj = Class.objects.create(class_name='Metrics', class_number='MET-1')
+        flashcard_set = FlashcardSet.objects.create(class_obj=class_obj, name='Streamed', creator=self.user)
+        insert_flashcards(self.user.id, flashcard_set, [{'question': f'Q{i}', 'answer': 'A'} for i in range(3)])
+
+        response = self.client.get('/api/decks/export/', {'set_id': flashcard_set.id})
+        self.assertNotIn('view="export_deck"', self.scrape())
+        body = b''.join(response.streaming_content)
+        text = self.scrape()
+        # the set lookup in the view and the cards query that runs while the body is drained
+        self.assertIn('flashcards_request_queries_sum{view="export_deck"} 2', text)
+        self.assertIn(f'flashcards_response_size_bytes_sum{{view="export_deck"}} {len(body)}', text)
+        self.assertIsNone(metrics.current_request.get())
+
+    def test_unmatched_paths_share_a_label(self):
+        self.client.get('/no/such/path/')
+        self.client.get('/another/missing/path/')
+        self.assertIn('flashcards_request_duration_seconds_count{view="unmatched"} 2', self.scrape())
+
+    def test_unknown_methods_share_a_label(self):
+        self.client.generic('BREW', '/api/flashcards/')
+        self.client.generic('PROPFIND', '/api/flashcards/')
+        text = self.scrape()
+        self.assertIn('flashcards_requests_total{method="other",status="405",view="get_flashcards"} 2', text)
+        self.assertNotIn('BREW', text)
+
+    def test_metrics_and_cache_stats_need_staff_or_the_token(self):
+        for path in ('/metrics', '/api/cache-stats/'):
+            self.assertEqual(self.client.get(path).status_code, 403)
+            self.assertEqual(self.client.get(path, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get(path, HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+            with override_settings(FLASHCARDS_METRICS_TOKEN=None):
+                self.assertEqual(self.client.get(path, HTTP_AUTHORIZATION='Bearer None').status_code, 403)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        User.objects.filter(id=self.user.id).update(is_staff=True)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/api/cache-stats/').status_code, 200)
+
+    @override_settings(FLASHCARDS_QUERY_BUDGET=0)
+    def test_logs_requests_over_query_budget(self):
+        with self.assertLogs('flashcards.requests', 'WARNING') as logs:
+            self.client.get('/api/flashcards/', {'username': self.user.username})
+        self.assertIn('get_flashcards', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+class DataGeneratorTests(TestCase):
+    """Generated data is internally consistent, so benchmarks on it exercise the normal read paths"""
+
+    def test_counts_and_counters(self):
+        result = datagen.generate(scale='tiny', prefix='gen', users=12, classes=3, sets_per_user=1,
+                                  cards_per_set=4, messages_per_class=5)
+        self.assertEqual(result['counts']['users'], 12)
+        self.assertEqual(result['counts']['cards'], 48)
+        self.assertEqual(Flashcard.objects.filter(flashcard_set__creator__username__startswith='gen_').count(), 48)
+        self.assertEqual(Message.objects.count(), 15)
+        self.assertEqual(counters.reconcile_card_counts(dry_run=True), 0)
+        self.assertEqual(counters.reconcile_member_counts(dry_run=True), 0)
+        for class_obj in Class.objects.filter(class_number__startswith='GEN-'):
+            self.assertEqual(ClassMember.objects.filter(class_obj=class_obj, role_in_class='Leader').count(),
+                             min(class_obj.member_count, 1))
+
+
+@override_settings(FLASHCARDS_READ_REPLICAS=['replica'])
+@skipUnless('replica' in settings.DATABASES, 'needs DJANGO_SETTINGS_MODULE=studyhub.test_settings')
+class ReadReplicaTests(TestCase):
+    """
+    GET reads go to the replica; writes, reads in use_primary views and reads right after a write go to
+    the primary. The "replica" alias is a second local database that only studyhub.test_settings defines,
+    so rows present on just one side show which database answered.
+    """
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+
+    @classmethod
+    def setUpTestData(cls):
+        for alias in ('default', 'replica'):
+            user = User.objects.db_manager(alias).create(id=1000, username='replica_user')
+            class_obj = Class.objects.using(alias).create(id=1000, class_name='Replicated', class_number='REP-1')
+        cls.replica_set = FlashcardSet.objects.using('replica').create(id=1000, class_obj=class_obj,
+                                                                      name='Replica only', creator=user)
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+        cache.get_cache().clear()
+
+    def get_set(self):
+        return self.client.get('/api/flashcards/set/', {'set_id': self.replica_set.id})
+
+    def test_get_reads_from_replica(self):
+        self.assertEqual(self.get_set().status_code, 200)
+
+    def test_use_primary_view_reads_from_primary(self):
+        Class.objects.create(class_name='Primary only', class_number='PRI-1')
+        response = self.client.get('/api/classes/catalog/', {'q': 'Primary only'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['class_name'] for row in response.json()['results']], ['Primary only'])
+
+    def test_cache_refills_read_from_primary(self):
+        # registered on the primary and not replicated yet; a replica read would cache "no such user"
+        user = User.objects.create(username='fresh_user')
+        self.assertEqual(self.client.get('/api/flashcards/', {'username': 'fresh_user'}).status_code, 200)
+
+        cache.get_cache().clear()
+        token = routers.read_only.set(True)
+        try:
+            self.assertEqual(async_to_sync(cache.aget_user_id)('fresh_user'), user.id)
+        finally:
+            routers.read_only.reset(token)
+
+    def test_writes_go_to_primary_and_pin_the_user(self):
+        token = issue_token(User.objects.get(id=1000))
+        self.client = self.client_class(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.post('/api/create-flashcard-set/', {'username': 'replica_user', 'name': 'New',
+                                                                   'class_id': 1000}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(FlashcardSet.objects.using('default').filter(id=response.json()['id'], name='New').exists())
+        self.assertFalse(FlashcardSet.objects.using('replica').filter(name='New').exists())
+        self.assertEqual(response.cookies, {})
+        # pinned without a cookie: the user's next read goes to the primary, which lacks the replica-only set
+        self.assertEqual(self.get_set().status_code, 404)
+        # other callers still read from the replica
+        self.assertEqual(self.client_class(HTTP_HOST='localhost').get(
+            '/api/flashcards/set/', {'set_id': self.replica_set.id}).status_code, 200)
+        with override_settings(FLASHCARDS_REPLICA_PIN_SECONDS=0):
+            cache.get_cache().clear()
+            self.client.post('/api/create-flashcard-set/', {'username': 'replica_user', 'name': 'Unpinned',
+                                                            'class_id': 1000}, content_type='application/json')
+            self.assertEqual(self.get_set().status_code, 200)
+
+
+@override_settings(FLASHCARDS_PASSWORD_ITERATIONS=1000, FLASHCARDS_PASSWORD_WORKERS=0)
+class LoginPipelineTests(TestCase):
+    """Passwords are hashed through flashcards.passwords: pooled, at the configured cost, with backpressure"""
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+        self.user = User.objects.create(username='login_user', password=passwords.make_password('correct-horse-1'))
+
+    def login(self, password='correct-horse-1'):
+        return self.client.post('/api/login/', {'username': 'login_user', 'password': password},
+                                content_type='application/json')
+
+    def test_login(self):
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login('wrong-password').status_code, 401)
+
+    def test_changed_cost_rehashes_on_login(self):
+        with override_settings(FLASHCARDS_PASSWORD_ITERATIONS=2000):
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(FLASHCARDS_PASSWORD_WORKERS=1)
+    def test_register_and_login_through_pool(self):
+        response = self.client.post('/api/register/', {'username': 'pooled_user', 'email': 'pooled@example.com',
+                                                       'password': 'a-Long-enough-password-42'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(self.client.login(username='pooled_user', password='a-Long-enough-password-42'))
+
+    @override_settings(FLASHCARDS_PASSWORD_WORKERS=1, FLASHCARDS_PASSWORD_MAX_PENDING=1,
+                       FLASHCARDS_PASSWORD_QUEUE_TIMEOUT=0)
+    def test_full_queue_returns_503(self):
+        _, pending = passwords._get_pool()
+        pending.acquire()
+        try:
+            response = self.login()
+        finally:
+            pending.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+@override_settings(FLASHCARDS_THUMBNAIL_WORKERS=0)
+class ProfilePictureTests(TestCase):
+    """Uploads are stored by content hash and served as immutable thumbnails, which member lists link to"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='avatar_user')
+        cls.other = User.objects.create(username='no_avatar_user')
+        cls.class_obj = Class.objects.create(class_name='Avatars', class_number='AVA-1')
+        ClassMember.objects.bulk_create([ClassMember(user=cls.user, class_obj=cls.class_obj, role_in_class='Leader'),
+                                         ClassMember(user=cls.other, class_obj=cls.class_obj, role_in_class='Student')])
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = Path(media.name)
+        overridden = override_settings(MEDIA_ROOT=media.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def upload(self, content, name='photo.png'):
+        return self.client.post('/api/profile/picture/', {'username': 'avatar_user',
+                                                         'file': SimpleUploadedFile(name, content)})
+
+    def png(self):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (600, 400), (200, 30, 30, 128)).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_upload_creates_thumbnails_and_member_list_links_them(self):
+        response = self.upload(self.png())
+        self.assertEqual(response.status_code, 200)
+        small = response.json()['avatar']['64']['webp']
+        self.assertEqual(len(list((self.media_root / 'avatars').iterdir())), 4)
+
+        # outside DEBUG the web server serves thumbnails; the view only stands in for it in development
+        self.assertEqual(self.client.get(small).status_code, 404)
+        thumbnail = avatars.thumbnail_view(RequestFactory().get(small), small.rsplit('/', 1)[1])
+        self.assertEqual(thumbnail.status_code, 200)
+        self.assertEqual(thumbnail['Cache-Control'], avatars.CACHE_CONTROL)
+        with Image.open(io.BytesIO(b''.join(thumbnail.streaming_content))) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (64, 64)))
+
+        members = self.client.get('/api/classes/members/', {'class_id': self.class_obj.id}).json()['results']
+        self.assertEqual([member['username'] for member in members], ['avatar_user', 'no_avatar_user'])
+        self.assertEqual(members[0]['avatar']['webp'], small)
+        self.assertIsNone(members[1]['avatar'])
+
+    def test_same_content_is_ready_immediately(self):
+        self.upload(self.png())
+        with override_settings(FLASHCARDS_THUMBNAIL_WORKERS=1), self.captureOnCommitCallbacks() as callbacks:
+            response = self.upload(self.png(), name='again.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(callbacks, [])
+
+    @override_settings(FLASHCARDS_THUMBNAIL_WORKERS=1)
+    def test_new_picture_is_queued_and_old_avatar_kept(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.upload(self.png())
+        self.assertEqual(response.status_code, 202)
+        self.assertIsNone(response.json()['avatar'])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.user.userprofile.avatar_hash, '')
+
+    def test_rejects_non_images(self):
+        response = self.upload(b'not an image', name='photo.jpg')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list((self.media_root / 'profile_pictures').iterdir()), [])
+
+    @override_settings(FLASHCARDS_AVATAR_MAX_BYTES=1024)
+    def test_rejects_oversized_upload_before_parsing_it(self):
+        with mock.patch('rest_framework.parsers.MultiPartParser.parse') as parse:
+            response = self.upload(b'x' * (1024 + avatars.FORM_OVERHEAD_BYTES + 1))
+        self.assertEqual(response.status_code, 413)
+        parse.assert_not_called()
+
+        # a body within the slack is parsed, and the file itself still has to fit
+        response = self.upload(self.png() + b'x' * 1024)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse((self.media_root / 'profile_pictures').exists())
+
+
+class RosterImportTests(TestCase):
+    """A roster is enrolled with a constant number of queries, reporting who could not be enrolled"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(username=f'roster_{i}', email=f'roster_{i}@example.com')
+                                              for i in range(30)])
+        User.objects.bulk_create([User(username='twin_a', email='twin@example.com'),
+                                  User(username='twin_b', email='twin@example.com')])
+        cls.class_obj = Class.objects.create(class_name='Roster', class_number='ROS-1')
+        ClassMember.objects.create(user=cls.users[0], class_obj=cls.class_obj, role_in_class='Leader')
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_import_reports_missing_ambiguous_and_invalid_entries(self):
+        users = (['roster_0', 'roster_1', {'user': 'roster_2@example.com', 'role': 'Leader'}, 'roster_1',
+                  'nobody', 'twin@example.com', {'user': 'roster_3', 'role': 'Owner'}, 7])
+        response = self.post('/api/classes/roster/', {'class_id': self.class_obj.id, 'users': users})
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual((result['enrolled'], result['already_members']), (2, 1))
+        self.assertEqual(result['missing'], ['nobody'])
+        self.assertEqual(result['ambiguous'], ['twin@example.com'])
+        self.assertEqual([error['index'] for error in result['invalid']], [6, 7])
+
+        roles = dict(ClassMember.objects.filter(class_obj=self.class_obj).values_list('user__username', 'role_in_class'))
+        self.assertEqual(roles, {'roster_0': 'Leader', 'roster_1': 'Student', 'roster_2': 'Leader'})
+        self.class_obj.refresh_from_db()
+        self.assertEqual(self.class_obj.member_count, 3)
+
+    def test_query_count_does_not_grow_with_the_roster(self):
+        usernames = [user.username for user in self.users]
+        with CaptureQueriesContext(connection) as small:
+            roster.import_roster(self.class_obj.id, usernames[:5])
+        with CaptureQueriesContext(connection) as large:
+            roster.import_roster(self.class_obj.id, usernames)
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(ClassMember.objects.filter(class_obj=self.class_obj).count(), 30)
+
+    def test_enrollment_refreshes_cached_class_lists(self):
+        self.client.get('/api/user-classes/', {'username': 'roster_5'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post('/api/join-class/', {'class_id': self.class_obj.id, 'usernames': ['roster_5', 'roster_6']})
+        classes = self.client.get('/api/user-classes/', {'username': 'roster_5'}).json()
+        self.assertEqual([c['id'] for c in classes], [self.class_obj.id])
+
+    def test_unknown_class_and_oversized_roster_are_rejected(self):
+        self.assertEqual(self.post('/api/classes/roster/', {'class_id': 999999, 'users': ['roster_1']}).status_code,
+                         404)
+        users = ['roster_1'] * (views.MAX_ROSTER_ENTRIES + 1)
+        self.assertEqual(self.post('/api/classes/roster/', {'class_id': self.class_obj.id, 'users': users}).status_code,
+                         400)
+        self.assertFalse(ClassMember.objects.filter(user__username='roster_1').exists())
+
+    def test_non_integer_ids_are_rejected(self):
+        for url, data in [('/api/classes/roster/', {'class_id': 'abc', 'users': ['roster_1']}),
+                          ('/api/join-class/', {'class_id': '1.5', 'usernames': ['roster_1']}),
+                          ('/api/join-class/', {'class_id': 'abc', 'username': 'roster_1'}),
+                          ('/api/leaderboard/submit/', {'set_id': 'abc', 'scores': []})]:
+            response = self.post(url, data)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn('must be an integer', response.json()['error'])
+
+    def test_usernames_containing_at_are_found(self):
+        handle = User.objects.create(username='handle@school', email='')
+        owner = User.objects.create(username='owner', email='shared@example.com')
+        squatter = User.objects.create(username='shared@example.com', email='other@example.com')
+        result = self.post('/api/classes/roster/', {'class_id': self.class_obj.id,
+                                                    'users': ['handle@school', 'shared@example.com', 'owner']}).json()
+        self.assertEqual((result['enrolled'], result['missing'], result['ambiguous']), (3, [], []))
+        self.assertEqual(set(ClassMember.objects.filter(class_obj=self.class_obj).values_list('user_id', flat=True)),
+                         {self.users[0].id, handle.id, owner.id, squatter.id})
+
+
+class ClassCatalogTests(TestCase):
+    """The catalog lists shared classes only, searches them by name or number and caches its pages"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='catalog_user')
+        Class.objects.bulk_create([Class(class_name='Organic Chemistry', class_number='CHEM-201'),
+                                   Class(class_name='Physics', class_number='PHYS-101'),
+                                   Class(class_name='Physical Chemistry', class_number='CHEM-301')])
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+        cache.get_cache().clear()
+
+    def names(self, **params):
+        response = self.client.get('/api/classes/catalog/', params)
+        self.assertEqual(response.status_code, 200)
+        return [c['class_name'] for c in response.json()['results']]
+
+    def test_personal_default_classes_are_left_out(self):
+        response = self.client.post('/api/create-flashcard-set/', {'username': 'catalog_user', 'name': 'Mine'})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Class.objects.get(class_name="catalog_user's Flashcards").is_personal)
+        self.assertEqual(self.names(), ['Organic Chemistry', 'Physics', 'Physical Chemistry'])
+
+    def test_search_matches_the_start_of_name_or_number(self):
+        self.assertEqual(self.names(q='phys'), ['Physics', 'Physical Chemistry'])
+        self.assertEqual(self.names(q='chem-'), ['Organic Chemistry', 'Physical Chemistry'])
+        page = self.client.get('/api/classes/catalog/', {'q': 'CHEM', 'page_size': 1}).json()
+        self.assertEqual(self.client.get(page['next']).json()['results'][0]['class_number'], 'CHEM-301')
+
+    def test_pages_are_cached_until_a_class_is_created(self):
+        self.names(q='phys')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.names(q='phys'), ['Physics', 'Physical Chemistry'])
+        self.assertEqual(len(ctx), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/create-class/', {'class_name': 'Physiology', 'class_number': 'BIO-220'})
+        self.assertEqual(self.names(q='phys'), ['Physics', 'Physical Chemistry', 'Physiology'])
+
+
+class DefaultProvisioningTests(TestCase):
+    """Each user has exactly one default class and set, found without queries once cached"""
+
+    def setUp(self):
+        self.client = self.client_class(HTTP_HOST='localhost')
+        cache.get_cache().clear()
+
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_registration_creates_defaults_used_by_create_flashcard(self):
+        response = self.post('/api/register/', {'username': 'fresh', 'email': 'fresh@example.com',
+                                                'password': 'a-Long-enough-password-42'})
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(username='fresh')
+        self.assertTrue(user.personal_class.is_personal)
+        self.assertEqual(user.default_flashcard_set.class_obj_id, user.personal_class.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post('/api/create-flashcard/', {'username': 'fresh', 'question': 'Q1', 'answer': 'A1'})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post('/api/create-flashcard/', {'username': 'fresh', 'question': 'Q2', 'answer': 'A2'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([q['sql'] for q in ctx if q['sql'].startswith('SELECT')], [])
+        self.assertEqual(list(user.default_flashcard_set.flashcard_set.values_list('front_text', flat=True)),
+                         ['Q1', 'Q2'])
+        self.assertEqual(Class.objects.filter(is_personal=True).count(), 1)
+
+    def test_lazy_provisioning_converges_on_one_class_and_set(self):
+        user = User.objects.create(username='legacy')
+        # a concurrent request already inserted the class
+        provisioning.personal_class(user.id, 'legacy').save()
+        first = provisioning.default_set(user.id, 'legacy')
+        again = provisioning._upsert(provisioning.personal_set(user.id, 'legacy', first.class_obj_id), 'default_owner')
+        self.assertEqual(again, first.id)
+        self.assertEqual(Class.objects.filter(personal_owner=user).count(), 1)
+        self.assertEqual(FlashcardSet.objects.filter(default_owner=user).get().id, first.id)
+
+        response = self.post('/api/create-flashcard-set/', {'username': 'legacy', 'name': 'Extra'})
+        self.assertEqual(FlashcardSet.objects.get(id=response.json()['id']).class_obj_id, first.class_obj_id)
+
+    def test_deleted_default_set_is_recreated(self):
+        user = User.objects.create(username='cleaner')
+        with self.captureOnCommitCallbacks(execute=True):
+            old = provisioning.default_set(user.id, 'cleaner')
+        with self.captureOnCommitCallbacks(execute=True):
+            FlashcardSet.objects.filter(id=old.id).delete()
+        new = provisioning.default_set(user.id, 'cleaner')
+        self.assertNotEqual(new.id, old.id)
+        self.assertEqual(new.class_obj_id, old.class_obj_id)
+
+
+class TokenAuthenticationTests(TestCase):
+    """A bearer token from login_user identifies the caller without reading sessions or users"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='token_user', password=passwords.make_password('correct-horse-1'))
+        User.objects.create(username='other_user')
+
+    def setUp(self):
+        cache.get_cache().clear()
+        response = self.client_class(HTTP_HOST='localhost').post(
+            '/api/login/', {'username': 'token_user', 'password': 'correct-horse-1'}, content_type='application/json'
+        )
+        self.token = response.json()['token']
+        # CSRF is enforced as in a browser; token requests carry no cookies, so they do not need it
+        self.client = self.client_class(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {self.token}',
+                                        enforce_csrf_checks=True)
+
+    def test_token_identifies_the_caller_without_auth_queries(self):
+        response = self.client.post('/api/create-flashcard/', {'question': 'Q', 'answer': 'A'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        tables = []
+
+        def record(execute, sql, params, many, context):
+            tables.extend(table for table in ('auth_user', 'django_session') if table in sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            cards = self.client.get('/api/flashcards/').json()
+        self.assertEqual([card['front_text'] for card in cards], ['Q'])
+        self.assertEqual(tables, [])
+
+    def test_username_parameter_still_names_another_user(self):
+        response = self.client.get('/api/flashcard-sets/', {'username': 'other_user'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        self.assertEqual(self.client.get('/api/flashcard-sets/', {'username': 'nobody'}).status_code, 404)
+
+    def test_bad_and_expired_tokens_are_rejected(self):
+        client = self.client_class(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {self.token}x')
+        self.assertEqual(client.get('/api/flashcards/').status_code, 401)
+        with override_settings(FLASHCARDS_TOKEN_MAX_AGE=-1):
+            self.assertEqual(self.client.get('/api/flashcards/').status_code, 401)
+        anonymous = self.client_class(HTTP_HOST='localhost')
+        self.assertEqual(anonymous.get('/api/flashcards/').status_code, 400)
+
+    def test_stale_token_does_not_block_login_or_register(self):
+        with override_settings(FLASHCARDS_TOKEN_MAX_AGE=-1):
+            response = self.client.post('/api/login/', {'username': 'token_user', 'password': 'correct-horse-1'},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            response = self.client.post('/api/register/', {'username': 'fresh_user', 'email': 'fresh@example.com',
+                                                           'password': 'correct-horse-2'},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 201)
@@ -1,18 +1,60 @@
+from django.conf import settings
 from django.urls import path
+
+from . import async_views
+from .avatars import thumbnail_view
+from .metrics import metrics_view
 from .views import register, login_user, create_flashcard, get_flashcards, get_user_classes, list_classes, join_class
 from .views import create_class
 from .views import get_flashcard_sets, get_flashcards_in_set, create_flashcard_set
+from .views import bulk_create_flashcards, cache_stats
+from .views import get_due_cards, submit_reviews
+from .views import leaderboard_top, leaderboard_rank, submit_scores
+from .views import study_heartbeat, board_history, search_flashcards, similar_flashcards
+from .views import import_deck, export_deck, dashboard
+from .views import upload_profile_picture, class_members, import_roster, class_catalog
+
+
+def read_route(route, view, name):
+    """Route a read endpoint to its async_views twin when FLASHCARDS_ASYNC_VIEWS lists it"""
+    if name in settings.FLASHCARDS_ASYNC_VIEWS or '*' in settings.FLASHCARDS_ASYNC_VIEWS:
+        view = getattr(async_views, name)
+    return path(route, view, name=name)
+
 
 urlpatterns = [
     path('api/register/', register, name='register'),
     path('api/login/', login_user, name='login'),
-    path('api/flashcards/', get_flashcards, name='get_flashcards'),
+    read_route('api/flashcards/', get_flashcards, 'get_flashcards'),
     path('api/create-flashcard/', create_flashcard, name='create_flashcard'),
-    path('api/user-classes/', get_user_classes, name='get_user_classes'),
-    path('api/classes/', list_classes, name='list_classes'),
+    path('api/create-flashcards/bulk/', bulk_create_flashcards, name='bulk_create_flashcards'),
+    read_route('api/user-classes/', get_user_classes, 'get_user_classes'),
+    read_route('api/classes/', list_classes, 'list_classes'),
+    path('api/classes/catalog/', class_catalog, name='class_catalog'),
     path('api/join-class/', join_class, name='join_class'),
+    path('api/classes/members/', class_members, name='class_members'),
+    path('api/classes/roster/', import_roster, name='import_roster'),
     path('api/create-class/', create_class, name='create_class'),
-    path('api/flashcard-sets/', get_flashcard_sets, name='get_flashcard_sets'),
-    path('api/flashcards/set/', get_flashcards_in_set, name='get_flashcards_in_set'),
+    read_route('api/dashboard/', dashboard, 'dashboard'),
+    read_route('api/flashcard-sets/', get_flashcard_sets, 'get_flashcard_sets'),
+    read_route('api/flashcards/set/', get_flashcards_in_set, 'get_flashcards_in_set'),
+    path('api/flashcards/search/', search_flashcards, name='search_flashcards'),
+    path('api/flashcards/similar/', similar_flashcards, name='similar_flashcards'),
+    path('api/decks/import/', import_deck, name='import_deck'),
+    path('api/decks/export/', export_deck, name='export_deck'),
     path('api/create-flashcard-set/', create_flashcard_set, name='create_flashcard_set'),
+    path('api/cache-stats/', cache_stats, name='cache_stats'),
+    path('api/reviews/due/', get_due_cards, name='get_due_cards'),
+    path('api/reviews/submit/', submit_reviews, name='submit_reviews'),
+    path('api/leaderboard/top/', leaderboard_top, name='leaderboard_top'),
+    path('api/leaderboard/rank/', leaderboard_rank, name='leaderboard_rank'),
+    path('api/leaderboard/submit/', submit_scores, name='submit_scores'),
+    path('api/study-time/heartbeat/', study_heartbeat, name='study_heartbeat'),
+    path('api/boards/history/', board_history, name='board_history'),
+    path('api/profile/picture/', upload_profile_picture, name='upload_profile_picture'),
+    path('metrics', metrics_view, name='metrics'),
 ]
+
+if settings.DEBUG:
+    # in production the web server (or storage) serves MEDIA_ROOT/avatars/ with avatars.CACHE_CONTROL
+    urlpatterns.append(path('media/avatars/<str:name>', thumbnail_view, name='avatar_thumbnail'))
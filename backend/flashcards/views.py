@@ -1,14 +1,42 @@
 from django.contrib.auth import authenticate, login
+from django.conf import settings
 from django.contrib.auth.models import User
-from rest_framework.decorators import api_view
+from rest_framework.authentication import BasicAuthentication, SessionAuthentication
+from rest_framework.decorators import api_view, authentication_classes
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
-from .models import Flashcard, Class, ClassMember, FlashcardSet
+from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import etag
+from .models import Flashcard, Class, ClassMember, FlashcardSet, MessageBoard
+from .bulk import insert_flashcards, iter_ndjson
+from .pagination import PaginationError, get_page_size, keyset_page, list_response, next_link
+from .authentication import issue_token, resolve_caller
+from .cache import cached
+from . import (
+    avatars, cache, catalog, decks, dedup, history, leaderboard, listings, metrics, passwords, provisioning, roster,
+    scheduling, search, study_time
+)
+from .routers import use_primary
+from .scheduling import due_cards
+from .etags import (
+    classes_etag, flashcard_sets_etag, flashcards_etag, flashcards_in_set_etag, user_classes_etag
+)
+
+
+MAX_DUE_CARDS = 200
+MAX_LEADERBOARD_ENTRIES = 100
+MAX_SIMILAR_CARDS = 100
+MAX_IMPORT_ERRORS = 100
+MAX_ROSTER_ENTRIES = 5000
 
 
 @api_view(['POST'])
+@authentication_classes([])  # a stale bearer token must not lock the user out
 def login_user(request):
     username = request.data.get('username')
     password = request.data.get('password')
@@ -16,15 +44,20 @@ def login_user(request):
     if not username or not password:
         return Response({'error': 'Username and password required'}, status=status.HTTP_400_BAD_REQUEST)
 
-    user = authenticate(request, username=username, password=password)
+    try:
+        user = authenticate(request, username=username, password=password)
+    except passwords.PasswordPoolBusy as e:
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
     if user is not None:
         login(request, user)  # creates a session
-        return Response({'success': True})
+        # for API clients: sent back as "Authorization: Bearer <token>", it authenticates without a session
+        return Response({'success': True, 'token': issue_token(user)})
     else:
         return Response({'error': 'Invalid username or password'}, status=status.HTTP_401_UNAUTHORIZED)
 
 
 @api_view(['POST'])
+@authentication_classes([])  # a stale bearer token must not lock the user out
 def register(request):
     username = request.data.get('username', '').strip()
     email = request.data.get('email', '').strip()
@@ -49,31 +82,35 @@ def register(request):
         return Response({'error': ' '.join(ve.messages)}, status=status.HTTP_400_BAD_REQUEST)
 
     # Create the user
-    user = User.objects.create_user(username=username, email=email, password=password)
+    try:
+        password_hash = passwords.make_password(password)
+    except passwords.PasswordPoolBusy as e:
+        return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
+    with transaction.atomic():
+        user = User.objects.create(username=User.normalize_username(username),
+                                   email=User.objects.normalize_email(email), password=password_hash)
+        provisioning.create_defaults(user.id, user.username)
     return Response({'success': True, 'username': user.username}, status=status.HTTP_201_CREATED)
 
 
 
 
+@etag(flashcard_sets_etag)
 @api_view(['GET'])
 def get_flashcard_sets(request):
     """Fetch flashcard sets for a given user (username via query param)"""
     try:
-        username = request.query_params.get('username')
-        if not username:
-            return Response({'error': 'Username is required'}, status=status.HTTP_400_BAD_REQUEST)
+        user_id, username = resolve_caller(request, request.query_params.get('username'))
+        error = listings.caller_error(user_id, username)
+        if error:
+            return Response({'error': error[0]}, status=error[1])
 
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
-            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
-
-        sets = FlashcardSet.objects.filter(creator=user).values('id', 'name', 'description', 'class_obj_id', 'created_at')
-        return Response(list(sets), status=status.HTTP_200_OK)
+        return list_response(request, listings.user_sets(user_id), cache_key=('user_sets', user_id))
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@etag(flashcards_in_set_etag)
 @api_view(['GET'])
 def get_flashcards_in_set(request):
     """Fetch flashcards in a specific flashcard set (set_id via query param)"""
@@ -87,8 +124,7 @@ def get_flashcards_in_set(request):
         except FlashcardSet.DoesNotExist:
             return Response({'error': 'Flashcard set not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        flashcards = Flashcard.objects.filter(flashcard_set=flashcard_set).values('id', 'front_text', 'back_text', 'creator_id')
-        return Response(list(flashcards), status=status.HTTP_200_OK)
+        return list_response(request, listings.set_cards(flashcard_set))
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -97,7 +133,7 @@ def get_flashcards_in_set(request):
 def create_flashcard_set(request):
     """Create a new FlashcardSet. Expects: username, name, description (optional), class_id (optional)"""
     try:
-        username = request.data.get('username')
+        user_id, username = resolve_caller(request, request.data.get('username'))
         name = request.data.get('name', '').strip()
         description = request.data.get('description', '').strip()
         class_id = request.data.get('class_id')
@@ -105,46 +141,34 @@ def create_flashcard_set(request):
         if not username or not name:
             return Response({'error': 'username and name are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
+        if user_id is None:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        class_obj = None
         if class_id:
-            try:
-                class_obj = Class.objects.get(id=class_id)
-            except Class.DoesNotExist:
+            if not Class.objects.filter(id=class_id).exists():
                 return Response({'error': 'Class not found'}, status=status.HTTP_404_NOT_FOUND)
         else:
-            class_obj, _ = Class.objects.get_or_create(
-                class_name=f"{username}'s Flashcards",
-                defaults={'class_number': f'DEFAULT-{username}', 'description': 'Default flashcard collection'}
-            )
+            class_id = provisioning.default_set(user_id, username).class_obj_id
 
-        new_set = FlashcardSet.objects.create(class_obj=class_obj, name=name, description=description, creator=user)
+        new_set = FlashcardSet.objects.create(class_obj_id=class_id, name=name, description=description,
+                                              creator_id=user_id)
         return Response({'success': True, 'id': new_set.id, 'name': new_set.name}, status=status.HTTP_201_CREATED)
 
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@etag(flashcards_etag)
 @api_view(['GET'])
 def get_flashcards(request):
     """Fetch flashcards created by a specific user"""
     try:
-        username = request.query_params.get('username')
-        
-        if not username:
-            return Response({'error': 'Username is required'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
-            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
-        
-        flashcards = Flashcard.objects.filter(creator=user).values('id', 'front_text', 'back_text')
-        return Response(list(flashcards), status=status.HTTP_200_OK)
+        user_id, username = resolve_caller(request, request.query_params.get('username'))
+        error = listings.caller_error(user_id, username)
+        if error:
+            return Response({'error': error[0]}, status=error[1])
+
+        return list_response(request, listings.user_cards(user_id), cache_key=('user_cards', user_id))
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -153,7 +177,7 @@ def get_flashcards(request):
 def create_flashcard(request):
     """Create a new flashcard for the authenticated user"""
     try:
-        username = request.data.get('username')
+        user_id, username = resolve_caller(request, request.data.get('username'))
         question = request.data.get('question', '').strip()
         answer = request.data.get('answer', '').strip()
         set_id = request.data.get('set_id')
@@ -164,9 +188,7 @@ def create_flashcard(request):
         if not question or not answer:
             return Response({'error': 'Question and answer are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
+        if user_id is None:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
         flashcard_set = None
@@ -178,19 +200,11 @@ def create_flashcard(request):
 
         # If no set provided, ensure a default class and default set exist for the user
         if not flashcard_set:
-            default_class, _ = Class.objects.get_or_create(
-                class_name=f"{username}'s Flashcards",
-                defaults={'class_number': f'DEFAULT-{username}', 'description': 'Default flashcard collection'}
-            )
-            flashcard_set, _ = FlashcardSet.objects.get_or_create(
-                class_obj=default_class,
-                name=f"{username}'s Default Set",
-                defaults={'description': 'Auto-created default set', 'creator': user}
-            )
+            flashcard_set = provisioning.default_set(user_id, username)
 
         flashcard = Flashcard.objects.create(
-            class_obj=flashcard_set.class_obj,
-            creator=user,
+            class_obj_id=flashcard_set.class_obj_id,
+            creator_id=user_id,
             flashcard_set=flashcard_set,
             front_text=question,
             back_text=answer
@@ -207,60 +221,147 @@ def create_flashcard(request):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@api_view(['GET'])
-def get_user_classes(request):
-    """Fetch classes the user is enrolled in"""
+@api_view(['POST'])
+def bulk_create_flashcards(request):
+    """
+    Create many flashcards in one transaction. Expects: username, set_id (optional) and either
+    cards (a list of {question, answer}) or an NDJSON file upload under "file"
+    """
     try:
-        username = request.query_params.get('username')
+        user_id, username = resolve_caller(request, request.data.get('username'))
+        set_id = request.data.get('set_id')
+        cards = request.data.get('cards')
+        upload = request.FILES.get('file')
 
         if not username:
             return Response({'error': 'Username is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
+        if upload is not None:
+            rows = iter_ndjson(upload)
+        elif isinstance(cards, list):
+            rows = cards
+        else:
+            return Response({'error': 'cards list or file upload is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if user_id is None:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        class_memberships = ClassMember.objects.filter(user=user).select_related('class_obj')
-        classes_data = []
-        for membership in class_memberships:
-            classes_data.append({
-                'id': membership.class_obj.id,
-                'class_name': membership.class_obj.class_name,
-                'class_number': membership.class_obj.class_number,
-                'description': membership.class_obj.description,
-                'role_in_class': membership.role_in_class
-            })
+        if set_id:
+            try:
+                flashcard_set = FlashcardSet.objects.get(id=set_id)
+            except FlashcardSet.DoesNotExist:
+                return Response({'error': 'Flashcard set not found'}, status=status.HTTP_404_NOT_FOUND)
+        else:
+            flashcard_set = provisioning.default_set(user_id, username)
+
+        result = insert_flashcards(user_id, flashcard_set, rows)
+        if not result['created']:
+            return Response({'error': 'No valid flashcards provided', 'errors': result['errors']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'success': True,
+            'set_id': flashcard_set.id,
+            'created': result['created'],
+            'ids': result['ids'],
+            'errors': result['errors']
+        }, status=status.HTTP_201_CREATED)
+
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@etag(user_classes_etag)
+@api_view(['GET'])
+def get_user_classes(request):
+    """Fetch classes the user is enrolled in"""
+    try:
+        user_id, username = resolve_caller(request, request.query_params.get('username'))
+        error = listings.caller_error(user_id, username)
+        if error:
+            return Response({'error': error[0]}, status=error[1])
 
-        return Response(classes_data, status=status.HTTP_200_OK)
+        def load_classes():
+            return [listings.class_row(membership) for membership in listings.memberships(user_id)]
+
+        return Response(cached('user_classes', user_id, load_classes), status=status.HTTP_200_OK)
 
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+def dashboard(request):
+    """
+    Everything the dashboard and sidebar need in one request (username via query param): classes with
+    roles and member counts, the user's sets with card counts, and recently studied sets. The query count
+    does not grow with the number of classes or sets.
+    """
+    try:
+        user_id, username = resolve_caller(request, request.query_params.get('username'))
+        error = listings.caller_error(user_id, username)
+        if error:
+            return Response({'error': error[0]}, status=error[1])
+
+        memberships, sets, recent = listings.dashboard_querysets(user_id)
+        return Response(listings.dashboard_body(
+            user_id,
+            [listings.class_row(membership, member_count=True) for membership in memberships],
+            [listings.dashboard_set_row(flashcard_set) for flashcard_set in sets],
+            [listings.recent_study_row(entry) for entry in recent]
+        ), status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@etag(classes_etag)
 @api_view(['GET'])
 def list_classes(request):
     """Return all classes from the Class table"""
     try:
-        classes = Class.objects.all().values('id', 'class_name', 'class_number', 'description')
-        return Response(list(classes), status=status.HTTP_200_OK)
+        return list_response(request, listings.all_classes())
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@use_primary  # pages are cached; a stale replica read would be served until they expire
+@api_view(['GET'])
+def class_catalog(request):
+    """Shared classes to browse, or search by class name or number (q via query param), one keyset page at a time"""
+    try:
+        text = request.query_params.get('q', '').strip()
+        if len(text) > catalog.MAX_QUERY_LENGTH:
+            return Response({'error': f'q must be at most {catalog.MAX_QUERY_LENGTH} characters'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = catalog.page(request, text)
+        except PaginationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(page, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @api_view(['POST'])
 def join_class(request):
-    """Enroll a user into a class via class_id"""
+    """Enroll a user into a class via class_id, or several at once as Students via a usernames list"""
     try:
-        username = request.data.get('username')
+        user_id, username = resolve_caller(request, request.data.get('username'))
+        usernames = request.data.get('usernames')
         class_id = request.data.get('class_id')
 
+        if class_id and not _is_id(class_id):
+            return Response({'error': 'class_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if usernames is not None and class_id:
+            if not isinstance(usernames, list) or not usernames:
+                return Response({'error': 'usernames must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+            return _import_roster(class_id, usernames, roster.DEFAULT_ROLE)
+
         if not username or not class_id:
             return Response({'error': 'username and class_id required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
+        if user_id is None:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
         try:
@@ -268,13 +369,55 @@ def join_class(request):
         except Class.DoesNotExist:
             return Response({'error': 'Class not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        ClassMember.objects.get_or_create(user=user, class_obj=class_obj, defaults={'role_in_class': 'Student'})
+        ClassMember.objects.get_or_create(user_id=user_id, class_obj=class_obj, defaults={'role_in_class': 'Student'})
         return Response({'success': True}, status=status.HTTP_200_OK)
 
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _is_id(value):
+    """Whether a class_id/set_id from the request body (a JSON number or a string) is a valid primary key"""
+    return str(value).isdigit()
+
+
+def _import_roster(class_id, entries, default_role):
+    if len(entries) > MAX_ROSTER_ENTRIES:
+        return Response({'error': f'At most {MAX_ROSTER_ENTRIES} users per request'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        result = roster.import_roster(class_id, entries, default_role)
+    except roster.ClassNotFound:
+        return Response({'error': 'Class not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'success': True, **result}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def import_roster(request):
+    """
+    Enroll a roster into a class in one transaction. Expects: class_id, users (a list of usernames/emails
+    or {user, role} objects) and optionally default_role. Reports counts plus the missing, ambiguous and
+    invalid entries; users who are already members keep their role.
+    """
+    try:
+        class_id = request.data.get('class_id')
+        users = request.data.get('users')
+        default_role = request.data.get('default_role') or roster.DEFAULT_ROLE
+
+        if not class_id or not isinstance(users, list) or not users:
+            return Response({'error': 'class_id and a non-empty users list are required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not _is_id(class_id):
+            return Response({'error': 'class_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if default_role not in roster.ROLES:
+            return Response({'error': f'default_role must be one of {", ".join(roster.ROLES)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return _import_roster(class_id, users, default_role)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['POST'])
 def create_class(request):
     """Create a Class and optionally add the creator as ClassMember (Leader)"""
@@ -282,7 +425,7 @@ def create_class(request):
         class_name = request.data.get('class_name', '').strip()
         class_number = request.data.get('class_number', '').strip()
         description = request.data.get('description', '').strip()
-        username = request.data.get('username')
+        user_id, username = resolve_caller(request, request.data.get('username'))
         role = request.data.get('role', 'Leader')
 
         if not class_name or not class_number:
@@ -292,17 +435,456 @@ def create_class(request):
 
         # If a username was provided, try to add with the specified role (validate role)
         if username:
-            try:
-                user = User.objects.get(username=username)
+            # ignore if user not found; class still created
+            if user_id is not None:
                 # validate role against model choices
                 allowed_roles = [r[0] for r in ClassMember.ROLE_CHOICES]
                 role_to_use = role if role in allowed_roles else 'Leader'
-                ClassMember.objects.create(user=user, class_obj=new_class, role_in_class=role_to_use)
-            except User.DoesNotExist:
-                # ignore if user not found; class still created
-                pass
+                ClassMember.objects.create(user_id=user_id, class_obj=new_class, role_in_class=role_to_use)
 
         return Response({'success': True, 'id': new_class.id, 'class_name': new_class.class_name}, status=status.HTTP_201_CREATED)
 
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, BasicAuthentication])  # the metrics token is not a signed token
+def cache_stats(request):
+    """Hit/miss counters of the per-user lookup cache in this worker; for staff or the metrics token"""
+    if not metrics.can_scrape(request):
+        return Response({'error': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
+    return Response(cache.stats(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def get_due_cards(request):
+    """Next cards for a user to review (username, limit, set_id and include_new via query params)"""
+    try:
+        user_id, username = resolve_caller(request, request.query_params.get('username'))
+        set_id = request.query_params.get('set_id')
+        include_new = request.query_params.get('include_new', '1') in ('1', 'true')
+
+        if not username:
+            return Response({'error': 'Username is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if set_id and not _is_id(set_id):
+            return Response({'error': 'set_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), MAX_DUE_CARDS)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if user_id is None:
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        cards = due_cards(user_id, max(limit, 0), timezone.now(), set_id=int(set_id) if set_id else None,
+                          include_new=include_new)
+        return Response(cards, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def submit_reviews(request):
+    """Record a batch of reviews. Expects: username, reviews (a list of {card_id, quality 0-5})"""
+    try:
+        user_id, username = resolve_caller(request, request.data.get('username'))
+        reviews = request.data.get('reviews')
+
+        if not username or not isinstance(reviews, list):
+            return Response({'error': 'username and reviews list are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if user_id is None:
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        updated, errors = scheduling.submit_reviews(user_id, reviews, timezone.now())
+        return Response({'success': True, 'updated': updated, 'errors': errors}, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _int_param(request, name, default, maximum):
+    """Read a bounded non-negative integer query param; raises ValueError if it is not an integer"""
+    return max(0, min(int(request.query_params.get(name, default)), maximum))
+
+
+@api_view(['GET'])
+def leaderboard_top(request):
+    """Top k scores of a flashcard set (set_id and k via query params)"""
+    try:
+        set_id = request.query_params.get('set_id')
+        if not set_id:
+            return Response({'error': 'set_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            k = _int_param(request, 'k', 10, MAX_LEADERBOARD_ENTRIES)
+            set_id = int(set_id)
+        except ValueError:
+            return Response({'error': 'set_id and k must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = leaderboard.with_usernames(leaderboard.top_scores(set_id, k))
+        return Response({'set_id': set_id, 'results': entries}, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def leaderboard_rank(request):
+    """A user's rank in a set with radius neighbours either side (set_id, username, radius via query params)"""
+    try:
+        set_id = request.query_params.get('set_id')
+        user_id, username = resolve_caller(request, request.query_params.get('username'))
+        if not set_id or not username:
+            return Response({'error': 'set_id and username are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            radius = _int_param(request, 'radius', 2, MAX_LEADERBOARD_ENTRIES // 2)
+            set_id = int(set_id)
+        except ValueError:
+            return Response({'error': 'set_id and radius must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if user_id is None:
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        rank, entries = leaderboard.scores_around(set_id, user_id, radius)
+        if rank is None:
+            return Response({'error': 'User has no score in this set'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({'set_id': set_id, 'rank': rank, 'results': leaderboard.with_usernames(entries)},
+                        status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def submit_scores(request):
+    """Upsert many scores for one set. Expects: set_id, scores (a list of {username, score})"""
+    try:
+        set_id = request.data.get('set_id')
+        scores = request.data.get('scores')
+
+        if not set_id or not isinstance(scores, list):
+            return Response({'error': 'set_id and scores list are required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not _is_id(set_id):
+            return Response({'error': 'set_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not FlashcardSet.objects.filter(id=set_id).exists():
+            return Response({'error': 'Flashcard set not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        errors = []
+        by_username = {}
+        for index, entry in enumerate(scores):
+            if not isinstance(entry, dict) or not isinstance(entry.get('username'), str) \
+                    or not isinstance(entry.get('score'), int):
+                errors.append({'index': index, 'error': 'username and integer score are required'})
+                continue
+            by_username[entry['username']] = entry['score']
+
+        user_ids = dict(User.objects.filter(username__in=by_username).values_list('username', 'id'))
+        missing = [username for username in by_username if username not in user_ids]
+        new_scores = {user_ids[username]: score for username, score in by_username.items() if username in user_ids}
+
+        if new_scores:
+            leaderboard.submit_scores(int(set_id), new_scores)
+
+        return Response({'success': True, 'updated': len(new_scores), 'missing_users': missing, 'errors': errors},
+                        status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def study_heartbeat(request):
+    """Add seconds of study time for a user on a set. Expects: username, set_id, seconds"""
+    try:
+        user_id, username = resolve_caller(request, request.data.get('username'))
+        set_id = request.data.get('set_id')
+        seconds = request.data.get('seconds')
+
+        if not username or not isinstance(set_id, int) or not isinstance(seconds, int):
+            return Response({'error': 'username, set_id and seconds are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not 0 < seconds <= settings.FLASHCARDS_MAX_HEARTBEAT_SECONDS:
+            return Response({'error': f'seconds must be between 1 and {settings.FLASHCARDS_MAX_HEARTBEAT_SECONDS}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if user_id is None:
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # buffered; written to FlashcardSetStudyTime by the periodic flush
+        study_time.buffer.add(set_id, user_id, seconds)
+        return Response({'success': True}, status=status.HTTP_202_ACCEPTED)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def board_history(request):
+    """
+    Message history of a class board (class_id and username via query params), newest page first; only
+    members of the class may read it, as on the board's WebSocket.
+    ?before / ?after take a cursor from a previous page; ?export=1 streams the whole board as gzip'd NDJSON.
+    """
+    try:
+        user_id, username = resolve_caller(request, request.query_params.get('username'))
+        class_id = request.query_params.get('class_id')
+        if not class_id or not username:
+            return Response({'error': 'class_id and username are required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not _is_id(class_id):
+            return Response({'error': 'class_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if user_id is None:
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+        if not ClassMember.objects.filter(user_id=user_id, class_obj_id=class_id).exists():
+            return Response({'error': 'Not a member of this class'}, status=status.HTTP_403_FORBIDDEN)
+
+        board_id = MessageBoard.objects.filter(class_obj_id=class_id).values_list('id', flat=True).first()
+
+        if request.query_params.get('export') in ('1', 'true'):
+            response = StreamingHttpResponse(history.export_board(board_id), content_type='application/gzip')
+            response['Content-Disposition'] = f'attachment; filename="class-{class_id}-board.ndjson.gz"'
+            return response
+
+        try:
+            limit = get_page_size(request)
+            before = request.query_params.get('before')
+            after = request.query_params.get('after')
+            before = history.parse_message_cursor(before) if before else None
+            after = history.parse_message_cursor(after) if after else None
+        except PaginationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if board_id is None:
+            return Response({'results': [], 'older': None, 'newer': None}, status=status.HTTP_200_OK)
+
+        rows, has_more = history.history_page(board_id, limit, before=before, after=after)
+        older = newer = None
+        if rows:
+            if has_more or after is not None:
+                older = next_link(request, history.message_cursor(rows[0]), param='before', drop='after')
+            # newer is always offered so clients can poll for messages posted since
+            newer = next_link(request, history.message_cursor(rows[-1]), param='after', drop='before')
+        elif after is not None:
+            newer = request.build_absolute_uri()
+
+        return Response({'results': rows, 'older': older, 'newer': newer}, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def search_flashcards(request):
+    """Ranked full-text search over card text (q, class_id, set_id, cursor, page_size via query params)"""
+    try:
+        text = request.query_params.get('q', '').strip()
+        class_id = request.query_params.get('class_id')
+        set_id = request.query_params.get('set_id')
+        cursor = request.query_params.get('cursor')
+
+        if not text:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if class_id and not _is_id(class_id):
+            return Response({'error': 'class_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if set_id and not _is_id(set_id):
+            return Response({'error': 'set_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            page_size = get_page_size(request)
+            after = search.parse_result_cursor(cursor) if cursor else None
+        except PaginationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = search.search_flashcards(text, class_id=class_id, set_id=set_id, limit=page_size + 1, after=after)
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_url = next_link(request, search.result_cursor(rows[-1]))
+        return Response({'results': rows, 'next': next_url}, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+
+@api_view(['GET'])
+def similar_flashcards(request):
+    """Near-duplicates of a card within its class (card_id, threshold, limit via query params)"""
+    try:
+        card_id = request.query_params.get('card_id')
+        if not card_id:
+            return Response({'error': 'card_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            card_id = int(card_id)
+            limit = _int_param(request, 'limit', 20, MAX_SIMILAR_CARDS)
+            threshold = float(request.query_params.get('threshold', dedup.DEFAULT_THRESHOLD))
+        except ValueError:
+            return Response({'error': 'card_id, limit and threshold must be numbers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < threshold <= 1:
+            return Response({'error': 'threshold must be in (0, 1]'}, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = dedup.similar_cards(card_id, threshold=threshold, limit=limit)
+        if matches is None:
+            return Response({'error': 'Flashcard not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        cards = Flashcard.objects.in_bulk([other_id for other_id, _ in matches])
+        results = [
+            {
+                'id': other_id,
+                'front_text': cards[other_id].front_text,
+                'back_text': cards[other_id].back_text,
+                'flashcard_set_id': cards[other_id].flashcard_set_id,
+                'similarity': round(similarity, 3)
+            }
+            for other_id, similarity in matches if other_id in cards
+        ]
+        return Response({'card_id': card_id, 'results': results}, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def import_deck(request):
+    """
+    Import a deck file into a set. Expects: username, file, set_id (optional, defaults to the user's
+    default set) and file_format (csv, tsv or jsonl; guessed from the file name when omitted)
+    """
+    try:
+        user_id, username = resolve_caller(request, request.data.get('username'))
+        set_id = request.data.get('set_id')
+        upload = request.FILES.get('file')
+
+        if not username or upload is None:
+            return Response({'error': 'username and file are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get('file_format') or decks.guess_format(upload.name)
+        if fmt not in decks.FORMATS:
+            return Response({'error': f'file_format must be one of {", ".join(decks.FORMATS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if user_id is None:
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if set_id:
+            try:
+                flashcard_set = FlashcardSet.objects.get(id=set_id)
+            except FlashcardSet.DoesNotExist:
+                return Response({'error': 'Flashcard set not found'}, status=status.HTTP_404_NOT_FOUND)
+        else:
+            flashcard_set = provisioning.default_set(user_id, username)
+
+        rows = decks.read_deck(decks.decode_lines(upload), fmt)
+        result = insert_flashcards(user_id, flashcard_set, rows, chunk_size=settings.FLASHCARDS_IMPORT_CHUNK_SIZE,
+                                   collect_ids=False, max_errors=MAX_IMPORT_ERRORS)
+        if not result['created']:
+            return Response({'error': 'No valid flashcards provided', 'invalid': result['invalid'],
+                             'errors': result['errors']}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'success': True,
+            'set_id': flashcard_set.id,
+            'created': result['created'],
+            'invalid': result['invalid'],
+            'errors': result['errors']
+        }, status=status.HTTP_201_CREATED)
+
+    except UnicodeDecodeError:
+        return Response({'error': 'File must be UTF-8 encoded'}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def export_deck(request):
+    """Stream a set's cards as a file download (set_id and file_format via query params)"""
+    try:
+        set_id = request.query_params.get('set_id')
+        fmt = request.query_params.get('file_format', 'csv')
+
+        if not set_id:
+            return Response({'error': 'set_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if fmt not in decks.FORMATS:
+            return Response({'error': f'file_format must be one of {", ".join(decks.FORMATS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            set_id = int(set_id)
+        except ValueError:
+            return Response({'error': 'set_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not FlashcardSet.objects.filter(id=set_id).exists():
+            return Response({'error': 'Flashcard set not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        response = StreamingHttpResponse(decks.export_deck(set_id, fmt), content_type=decks.CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="set-{set_id}.{fmt}"'
+        return response
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def upload_profile_picture(request):
+    """
+    Set a user's profile picture. Expects: username, file (JPEG, PNG, WebP or GIF). The file is streamed to
+    disk and thumbnailed in the background; 'avatar' in the response is null until the thumbnails are ready.
+    """
+    try:
+        # checked before request.data, which makes DRF read the whole body; upload.size below catches
+        # requests that did not declare their length
+        if avatars.upload_too_large(request):
+            return Response({'error': 'File is too large'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        user_id, username = resolve_caller(request, request.data.get('username'))
+        upload = request.FILES.get('file')
+
+        if not username or upload is None:
+            return Response({'error': 'username and file are required'}, status=status.HTTP_400_BAD_REQUEST)
+        if upload.size > settings.FLASHCARDS_AVATAR_MAX_BYTES:
+            return Response({'error': 'File is too large'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        if user_id is None:
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            name, content_hash = avatars.save_original(upload)
+        except avatars.InvalidImage as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        ready = avatars.set_picture(user_id, name, content_hash)
+        return Response({
+            'success': True,
+            'status': 'ready' if ready else 'processing',
+            'avatar': avatars.thumbnail_urls(content_hash) if ready else None
+        }, status=status.HTTP_200_OK if ready else status.HTTP_202_ACCEPTED)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def class_members(request):
+    """Members of a class with roles and small avatar thumbnails, one keyset page at a time (class_id via query param)"""
+    try:
+        class_id = request.query_params.get('class_id')
+        if not class_id:
+            return Response({'error': 'class_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            class_id = int(class_id)
+        except ValueError:
+            return Response({'error': 'class_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        members = ClassMember.objects.filter(class_obj_id=class_id).values(
+            'id', 'user_id', 'role_in_class', username=F('user__username'),
+            avatar_hash=F('user__userprofile__avatar_hash')
+        )
+        try:
+            page = keyset_page(request, members)
+        except PaginationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        small = min(avatars.THUMBNAIL_SIZES)
+        for member in page['results']:
+            urls = avatars.thumbnail_urls(member.pop('avatar_hash'), sizes=(small,))
+            member['avatar'] = urls[small] if urls else None
+        return Response(page, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'flashcards.middleware.RequestMetricsMiddleware',
+    'flashcards.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -61,6 +63,21 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# 'db', 'cached_db' (read through the cache, written to both), 'cache' or 'signed_cookies' (stored in the
+# client's cookie: no server-side reads, but a session cannot be revoked before it expires)
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'cached_db')
+SESSION_ENGINE = f'django.contrib.sessions.backends.{SESSION_BACKEND}'
+
+# Bearer tokens from login_user authenticate without a session or user lookup; see flashcards.authentication
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'flashcards.authentication.SignedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+}
+FLASHCARDS_TOKEN_MAX_AGE = int(os.getenv('FLASHCARDS_TOKEN_MAX_AGE', 7 * 24 * 3600))
+
 ROOT_URLCONF = 'studyhub.urls'
 
 TEMPLATES = [
@@ -84,10 +101,72 @@ WSGI_APPLICATION = 'studyhub.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections are kept open for DATABASE_CONN_MAX_AGE seconds (0 closes them after every request, None
+# never does: "none") and checked before reuse when DATABASE_CONN_HEALTH_CHECKS is on. On PostgreSQL,
+# DATABASE_POOL=1 switches to psycopg's connection pool instead, sized by DATABASE_POOL_MIN_SIZE /
+# DATABASE_POOL_MAX_SIZE per worker process; pooling and persistent connections are mutually exclusive.
+DATABASE_CONN_MAX_AGE = os.getenv('DATABASE_CONN_MAX_AGE', '60')
+DATABASE_CONN_MAX_AGE = None if DATABASE_CONN_MAX_AGE.lower() == 'none' else int(DATABASE_CONN_MAX_AGE)
+DATABASE_CONN_HEALTH_CHECKS = os.getenv('DATABASE_CONN_HEALTH_CHECKS', '1') == '1'
+DATABASE_POOL = os.getenv('DATABASE_POOL') == '1'
+
+
+def database_config(url):
+    config = dj_database_url.parse(url, conn_max_age=DATABASE_CONN_MAX_AGE,
+                                   conn_health_checks=DATABASE_CONN_HEALTH_CHECKS)
+    if DATABASE_POOL and config['ENGINE'] == 'django.db.backends.postgresql':
+        config['CONN_MAX_AGE'] = 0
+        config.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': int(os.getenv('DATABASE_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.getenv('DATABASE_POOL_TIMEOUT', 10)),
+        }
+    return config
+
+
 DATABASES = {
-    'default': dj_database_url.parse(os.getenv('DATABASE_URL'))
+    'default': database_config(os.getenv('DATABASE_URL'))
 }
 
+# Read replicas: comma-separated DATABASE_REPLICA_URLS become aliases replica_1, replica_2, ...
+# flashcards.routers sends the reads of GET requests to them and everything else to default.
+for number, url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES[f'replica_{number}'] = database_config(url.strip())
+FLASHCARDS_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['flashcards.routers.ReadReplicaRouter']
+
+# After a write, the token user's reads stay on the primary for this many seconds (a cache entry), so
+# they see their own changes despite replication lag
+FLASHCARDS_REPLICA_PIN_SECONDS = int(os.getenv('FLASHCARDS_REPLICA_PIN_SECONDS', 5))
+
+
+# Cache
+# Local memory by default (per process, least recently used keys are culled past MAX_ENTRIES).
+# Set REDIS_URL to share one cache between workers; configure maxmemory-policy allkeys-lru there.
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'studyhub',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000))},
+        }
+    }
+
+# Per-user lookup cache used by flashcards.cache
+FLASHCARDS_CACHE_ALIAS = 'default'
+FLASHCARDS_CACHE_TIMEOUT = int(os.getenv('FLASHCARDS_CACHE_TIMEOUT', 300))
+# Catalog pages are dropped when a shared class is added, but show member_count as of when they were cached
+FLASHCARDS_CATALOG_CACHE_TIMEOUT = int(os.getenv('FLASHCARDS_CATALOG_CACHE_TIMEOUT', 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -109,6 +188,30 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 AUTH_USER_MODEL = 'auth.User'
+
+# Logins check passwords through flashcards.passwords, which hashes in a pool of
+# FLASHCARDS_PASSWORD_WORKERS processes (default: one per core; 0 hashes on the request thread).
+# When more than FLASHCARDS_PASSWORD_MAX_PENDING hashes are queued, logins wait up to
+# FLASHCARDS_PASSWORD_QUEUE_TIMEOUT seconds and then get a 503.
+AUTHENTICATION_BACKENDS = ['flashcards.backends.PooledPasswordBackend']
+PASSWORD_HASHERS = [
+    'flashcards.passwords.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+# PBKDF2 cost; unset uses Django's default. Existing hashes move to a new cost as their users log in.
+FLASHCARDS_PASSWORD_ITERATIONS = (
+    int(os.environ['FLASHCARDS_PASSWORD_ITERATIONS']) if os.getenv('FLASHCARDS_PASSWORD_ITERATIONS') else None
+)
+FLASHCARDS_PASSWORD_WORKERS = (
+    int(os.environ['FLASHCARDS_PASSWORD_WORKERS']) if os.getenv('FLASHCARDS_PASSWORD_WORKERS') else None
+)
+FLASHCARDS_PASSWORD_MAX_PENDING = (
+    int(os.environ['FLASHCARDS_PASSWORD_MAX_PENDING']) if os.getenv('FLASHCARDS_PASSWORD_MAX_PENDING') else None
+)
+FLASHCARDS_PASSWORD_QUEUE_TIMEOUT = float(os.getenv('FLASHCARDS_PASSWORD_QUEUE_TIMEOUT', 5))
 ACCOUNT_EMAIL_REQUIRED = True
 
 # Internationalization
@@ -136,3 +239,46 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Profile pictures (see flashcards.avatars): upload limits, and threads rendering thumbnails
+# (0 renders them during the upload request)
+FLASHCARDS_AVATAR_MAX_BYTES = int(os.getenv('FLASHCARDS_AVATAR_MAX_BYTES', 10 * 1024 * 1024))
+FLASHCARDS_AVATAR_MAX_PIXELS = int(os.getenv('FLASHCARDS_AVATAR_MAX_PIXELS', 40_000_000))
+FLASHCARDS_THUMBNAIL_WORKERS = int(os.getenv('FLASHCARDS_THUMBNAIL_WORKERS', 2))
+
+# Listing endpoints: keyset page size when ?page_size is not given, upper bound
+# for ?page_size, and rows fetched per round trip when streaming with ?stream=1
+FLASHCARDS_PAGE_SIZE = int(os.getenv('FLASHCARDS_PAGE_SIZE', 100))
+FLASHCARDS_MAX_PAGE_SIZE = int(os.getenv('FLASHCARDS_MAX_PAGE_SIZE', 1000))
+FLASHCARDS_STREAM_CHUNK_SIZE = int(os.getenv('FLASHCARDS_STREAM_CHUNK_SIZE', 2000))
+
+# Cards per bulk_create when importing a deck file
+FLASHCARDS_IMPORT_CHUNK_SIZE = int(os.getenv('FLASHCARDS_IMPORT_CHUNK_SIZE', 2000))
+
+# Read endpoints (by URL name) served by flashcards.async_views instead of the sync DRF views, e.g.
+# "get_flashcards,dashboard", or "*" for all of them. Only worth it under ASGI; under WSGI each async
+# view runs in its own event loop.
+FLASHCARDS_ASYNC_VIEWS = {name.strip() for name in os.getenv('FLASHCARDS_ASYNC_VIEWS', '').split(',') if name.strip()}
+
+# /metrics and /api/cache-stats/ are served to staff users, and to scrapers sending this as a bearer token
+FLASHCARDS_METRICS_TOKEN = os.getenv('FLASHCARDS_METRICS_TOKEN') or None
+
+# Requests over either budget are logged by flashcards.middleware with their SQL; unset disables the check
+FLASHCARDS_QUERY_BUDGET = int(os.environ['FLASHCARDS_QUERY_BUDGET']) if os.getenv('FLASHCARDS_QUERY_BUDGET') else None
+FLASHCARDS_LATENCY_BUDGET_MS = (
+    float(os.environ['FLASHCARDS_LATENCY_BUDGET_MS']) if os.getenv('FLASHCARDS_LATENCY_BUDGET_MS') else None
+)
+
+# Each worker keeps leaderboard rankings in memory and reloads them at least this often (seconds), so
+# other workers' submissions show up even when the cache is not shared between workers
+FLASHCARDS_LEADERBOARD_MAX_AGE = float(os.getenv('FLASHCARDS_LEADERBOARD_MAX_AGE', 5))
+
+# Study-time heartbeats are buffered per worker and flushed every FLUSH_INTERVAL seconds (0: only when
+# flashcards.study_time.flush() is called, and at shutdown)
+FLASHCARDS_STUDY_TIME_FLUSH_INTERVAL = int(os.getenv('FLASHCARDS_STUDY_TIME_FLUSH_INTERVAL', 10))
+FLASHCARDS_MAX_HEARTBEAT_SECONDS = 300
+
+# Class message boards over WebSockets (see flashcards.realtime)
+FLASHCARDS_BOARD_BROKER = 'flashcards.realtime.InProcessBroker'
+FLASHCARDS_BOARD_BACKFILL = 50
+FLASHCARDS_BOARD_WRITE_DELAY = 0.05  # seconds posted messages wait to be written in one batch
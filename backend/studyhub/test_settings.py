@@ -0,0 +1,14 @@
+"""
+The project settings plus a stand-in replica, for running the replica routing tests:
+
+    DJANGO_SETTINGS_MODULE=studyhub.test_settings python manage.py test flashcards
+
+ReadReplicaTests are skipped under the plain project settings, which have no "replica" alias.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, dj_database_url, os
+
+# Replicas do not see the primary's uncommitted test transactions, so routing stays off in tests.
+# ReadReplicaTests turn it on against a second local database standing in for a replica.
+FLASHCARDS_READ_REPLICAS = []
+DATABASES['replica'] = dj_database_url.parse(os.getenv('DATABASE_TEST_REPLICA_URL', 'sqlite://:memory:'))
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { BrowserRouter as Router, Routes, Route, Navigate } from 'react-router-dom';
 import Login from './components/Login';
 import Dashboard from './components/Dashboard';
+import { setAuthToken } from './api/api';
 
 function App() {
   const [user, setUser] = useState(null);
@@ -25,6 +26,7 @@ function App() {
       if (count <= 0) {
         // last tab closed → log out
         localStorage.removeItem('user'); // optional: clear persistent storage
+        setAuthToken(null);
         setUser(null);
       }
     };
@@ -51,6 +53,7 @@ function App() {
   const handleLogout = () => {
     setUser(null);
     localStorage.removeItem('user');
+    setAuthToken(null);
   };
 
   return (
@@ -1,6 +1,31 @@
 import axios from 'axios';
 
 const API_URL = 'http://127.0.0.1:8000/api';
+const TOKEN_KEY = 'authToken';
+
+// The bearer token from login identifies the user to the API without a session lookup
+export const setAuthToken = (token) => {
+  if (token) {
+    localStorage.setItem(TOKEN_KEY, token);
+    axios.defaults.headers.common.Authorization = `Bearer ${token}`;
+  } else {
+    localStorage.removeItem(TOKEN_KEY);
+    delete axios.defaults.headers.common.Authorization;
+  }
+};
+
+setAuthToken(localStorage.getItem(TOKEN_KEY));
+
+// An expired or revoked token gets a 401 on every call; drop it so the next login starts clean
+axios.interceptors.response.use(
+  (response) => response,
+  (error) => {
+    if (error.response && error.response.status === 401) {
+      setAuthToken(null);
+    }
+    return Promise.reject(error);
+  }
+);
 
 export const getFlashcards = async (username) => {
   try {
@@ -19,6 +44,12 @@ export const getFlashcardSets = async (username) => {
   return response.data;
 };
 
+// Classes with roles, sets with card counts and recent study time in one request
+export const getDashboard = async (username) => {
+  const response = await axios.get(`${API_URL}/dashboard/`, { params: { username } });
+  return response.data;
+};
+
 export const getFlashcardsInSet = async (setId) => {
   const response = await axios.get(`${API_URL}/flashcards/set/`, { params: { set_id: setId } });
   return response.data;
@@ -78,6 +109,19 @@ export const getAllClasses = async () => {
   }
 };
 
+export const searchClasses = async (query = '', cursor = null) => {
+  try {
+    const params = {};
+    if (query) params.q = query;
+    if (cursor) params.cursor = cursor;
+    const response = await axios.get(`${API_URL}/classes/catalog/`, { params });
+    return response.data;
+  } catch (error) {
+    console.error('Error searching classes:', error);
+    return { results: [], next: null };
+  }
+};
+
 export const joinClass = async (username, classId) => {
   try {
     const response = await axios.post(`${API_URL}/join-class/`, {
@@ -108,3 +152,42 @@ export const createClass = async (username, className, classNumber, description,
 };
 
 
+
+export const getClassMembers = async (classId, cursor = null) => {
+  try {
+    const params = { class_id: classId };
+    if (cursor) params.cursor = cursor;
+    const response = await axios.get(`${API_URL}/classes/members/`, { params });
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching class members:', error);
+    return { results: [], next: null };
+  }
+};
+
+export const importRoster = async (classId, users, defaultRole = 'Student') => {
+  try {
+    const response = await axios.post(`${API_URL}/classes/roster/`, {
+      class_id: classId,
+      users,
+      default_role: defaultRole,
+    });
+    return response.data;
+  } catch (error) {
+    console.error('Error importing roster:', error);
+    throw error;
+  }
+};
+
+export const uploadProfilePicture = async (username, file) => {
+  try {
+    const formData = new FormData();
+    formData.append('username', username);
+    formData.append('file', file);
+    const response = await axios.post(`${API_URL}/profile/picture/`, formData);
+    return response.data;
+  } catch (error) {
+    console.error('Error uploading profile picture:', error);
+    throw error;
+  }
+};
@@ -1,6 +1,7 @@
 import React, { useState } from 'react';
 import '../styles/Login.css';
 import axios from 'axios';
+import { setAuthToken } from '../api/api';
 
 function Login({ onLogin }) {
   const [isRegister, setIsRegister] = useState(false);
@@ -67,6 +68,7 @@ function Login({ onLogin }) {
       } else {
         const res = await axios.post('http://127.0.0.1:8000/api/login/', { username, password });
         if (res.data.success) {
+          setAuthToken(res.data.token);
           onLogin(username);
         } else {
           setError('Invalid username or password');